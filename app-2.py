@@ -1,28 +1,23 @@
 import streamlit as st
-from openai import OpenAI
 import os
-import tempfile
 import time
-from pathlib import Path
-import json
-import re
-from concurrent.futures import ThreadPoolExecutor
-
-# Bibliothèques pour traiter différents types de documents
-import PyPDF2
-import docx
-import io
-
-# Configuration de la page Streamlit
-st.set_page_config(
-    page_title="Assistant IA - Dialogue & Q&A sur Documents",
-    page_icon="🧠",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+import uuid
+
+# Moteur d'extraction, de recherche et de construction des prompts (importable sans Streamlit)
+from docqa.admission import AdmissionController, AdmissionRejected
+from docqa.ingestion import INGESTION_POLL_INTERVAL, get_ingestion_queue
+from docqa.llm import (MODEL, MAX_TOKENS, TEMPERATURE, TOP_P, PRESENCE_PENALTY, STOP_SEQUENCE,
+                       AsyncLLMTransport)
+from docqa.metrics import get_metrics
+from docqa.notices import set_notice_handler
+from docqa.prompting import HISTORY_TOKEN_BUDGET, build_prompt_messages, estimate_tokens, new_history_summary
+from docqa.responses import get_response_cache, response_cache_enabled, response_cache_key, replay_response
+from docqa.retrieval import DEFAULT_RANKER, RANKERS, create_context_for_question
+from docqa.sessions import ConversationLog, SessionDocumentStore, get_session_store
+from docqa.streaming import StreamRenderer
 
 # Style CSS personnalisé pour améliorer l'interface
-st.markdown("""
+PAGE_CSS = """
 <style>
 .chat-message {
     padding: 1.5rem;
@@ -103,7 +98,17 @@ st.markdown("""
     height: 40px;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+def configure_page():
+    """Configuration de la page Streamlit (appelée par main, jamais à l'import du module)"""
+    st.set_page_config(
+        page_title="Assistant IA - Dialogue & Q&A sur Documents",
+        page_icon="🧠",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
 
 # Fonction de cache pour éviter de recalculer des résultats déjà obtenus
 @st.cache_data(ttl=3600)
@@ -114,386 +119,288 @@ def get_api_credentials():
         "api_key": os.environ.get("SCALEWAY_API_KEY")
     }
 
-# Configuration de l'API Scaleway
-api_creds = get_api_credentials()
-API_BASE_URL = api_creds["base_url"]
-API_KEY = api_creds["api_key"]
-
-if not API_BASE_URL or not API_KEY:
-    st.error("Les variables d'environnement SCALEWAY_API_BASE_URL et SCALEWAY_API_KEY doivent être définies.")
-    st.stop()
-
-# Paramètres du modèle
-MODEL = "llama-3.3-70b-instruct"
-MAX_TOKENS = 4096
-TEMPERATURE = 0.15
-TOP_P = 0.9
-PRESENCE_PENALTY = 0.0
-STOP_SEQUENCE = ["/stop"]
+def require_api_credentials():
+    """Arrête l'application si la configuration de l'API Scaleway est incomplète"""
+    api_creds = get_api_credentials()
+    if not api_creds["base_url"] or not api_creds["api_key"]:
+        st.error("Les variables d'environnement SCALEWAY_API_BASE_URL et SCALEWAY_API_KEY doivent être définies.")
+        st.stop()
+    return api_creds
 
 # Initialisation des variables de session avec un mécanisme plus robuste
 def init_session_state():
     """Initialise les variables de session de façon plus structurée"""
     if 'initialized' not in st.session_state:
-        st.session_state.conversation_history = [
-            {"role": "system", "content": "Tu es un assistant intelligent qui répond en français même si la question est dans une autre langue. Tu peux discuter de tout sujet et analyser des documents si l'utilisateur en fournit."}
-        ]
-        st.session_state.chat_messages = []
-        st.session_state.documents = {}  # Dictionnaire pour stocker {nom_document: contenu}
+        # Identifie la session dans la file d'attente du modèle et dans le stockage des sessions
+        st.session_state.session_id = uuid.uuid4().hex
+        start_session_storage()
+        st.session_state.ingestion_jobs = {}  # Ingestions en arrière-plan {identifiant: nom_document}
         st.session_state.submitted = False
         st.session_state.initialized = True
 
-# Appel de l'initialisation
-init_session_state()
+def start_session_storage():
+    """Démarre une conversation vide : l'historique et les documents sont conservés sur disque
 
-# Fonctions pour extraire le texte de différents formats de documents
-def extract_text_from_pdf(file):
-    """Extrait le texte d'un fichier PDF avec une gestion d'erreurs améliorée et robuste"""
-    text = ""
-    temp_file_path = None
-    
-    try:
-        # Créer un fichier temporaire avec un meilleur contrôle
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(file.getvalue())
-            temp_file_path = temp_file.name
-        
-        # Ouvrir et lire le PDF avec gestion des erreurs améliorée
-        try:
-            with open(temp_file_path, 'rb') as pdf_file:
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                
-                # Vérifier si le PDF est crypté et essayer de le décrypter si nécessaire
-                if pdf_reader.is_encrypted:
-                    try:
-                        # Essayer avec un mot de passe vide (beaucoup de PDFs sont marqués comme cryptés mais sans mot de passe)
-                        pdf_reader.decrypt('')
-                    except:
-                        st.warning("Le PDF semble être protégé par un mot de passe et ne peut pas être entièrement analysé.")
-                
-                # Extraction page par page avec gestion des erreurs pour chaque page
-                for page_num in range(len(pdf_reader.pages)):
-                    try:
-                        page = pdf_reader.pages[page_num]
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n\n"
-                        else:
-                            # Essayer une méthode alternative pour les PDFs problématiques
-                            st.info(f"Méthode alternative d'extraction utilisée pour la page {page_num+1}")
-                    except Exception as page_error:
-                        st.warning(f"Impossible d'extraire le texte de la page {page_num+1}: {str(page_error)}")
-                        # Continuer avec les autres pages
-        
-        except PyPDF2.errors.PdfReadError as pdf_error:
-            st.error(f"Erreur lors de la lecture du PDF: {str(pdf_error)}")
-            st.info("Tentative avec une méthode alternative...")
-            
-            # Méthode alternative en cas d'échec de PyPDF2
-            try:
-                import pdfplumber
-                
-                with pdfplumber.open(temp_file_path) as pdf:
-                    for page in pdf.pages:
-                        try:
-                            page_text = page.extract_text()
-                            if page_text:
-                                text += page_text + "\n\n"
-                        except:
-                            pass  # Ignorer les pages problématiques
-            except ImportError:
-                st.error("Module pdfplumber non disponible pour l'extraction alternative.")
-                # Recommander l'installation: pip install pdfplumber
-    
-    except Exception as e:
-        st.error(f"Erreur lors de l'extraction du texte du PDF: {str(e)}")
-    
-    finally:
-        # Nettoyer le fichier temporaire
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except Exception as cleanup_error:
-                pass  # Ignorer les erreurs de nettoyage
-    
-    # Vérifier si du texte a été extrait
-    if not text.strip():
-        st.warning("Aucun texte n'a pu être extrait du PDF. Cela peut être dû à un PDF scanné ou protégé.")
-    
-    return text
-
-def extract_text_from_docx(file):
-    """Extrait le texte d'un fichier DOCX avec gestion d'erreurs améliorée"""
-    text = ""
-    try:
-        doc = docx.Document(io.BytesIO(file.getvalue()))
-        # Extraction du texte des paragraphes et des tableaux
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-        
-        # Extraction du texte des tableaux
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + " "
-                text += "\n"
-            text += "\n"
-    except Exception as e:
-        st.error(f"Erreur lors de l'extraction du texte du DOCX: {str(e)}")
-    
-    return text
-
-def extract_text_from_txt(file_object):
-    """Extrait le texte d'un fichier TXT avec gestion d'erreurs améliorée"""
-    try:
-        # Si c'est un objet UploadedFile (de l'interface Streamlit)
-        if hasattr(file_object, 'getvalue'):
-            return file_object.getvalue().decode("utf-8")
-        # Si c'est un objet BufferedReader (fichier ouvert)
-        else:
-            file_object.seek(0)  # Retour au début du fichier
-            content = file_object.read()
-            if isinstance(content, bytes):
-                return content.decode("utf-8")
-            return content
-    except UnicodeDecodeError:
-        # Essaie avec différents encodages si UTF-8 échoue
-        encodings = ['latin-1', 'iso-8859-1', 'windows-1252']
-        for encoding in encodings:
-            try:
-                if hasattr(file_object, 'getvalue'):
-                    return file_object.getvalue().decode(encoding)
-                else:
-                    file_object.seek(0)
-                    content = file_object.read()
-                    if isinstance(content, bytes):
-                        return content.decode(encoding)
-                    return content
-            except UnicodeDecodeError:
-                continue
-        st.error("Impossible de déterminer l'encodage du fichier texte.")
-        return ""
-    except Exception as e:
-        st.error(f"Erreur lors de l'extraction du texte du fichier TXT: {str(e)}")
-        return ""
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def process_file(file_content, file_name):
-    """Traite le fichier uploadé et extrait son contenu textuel (version avec cache)"""
-    file_extension = Path(file_name).suffix.lower()
-    
-    # Création d'un fichier temporaire avec le contenu
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(file_content)
-        temp_path = temp_file.name
-    
-    try:
-        if file_extension == '.pdf':
-            with open(temp_path, 'rb') as f:
-                uploaded_file = type('', (), {})()  # Crée un objet vide
-                uploaded_file.getvalue = lambda: file_content  # Ajoute une méthode getvalue
-                result = extract_text_from_pdf(uploaded_file)
-        elif file_extension == '.docx':
-            with open(temp_path, 'rb') as f:
-                uploaded_file = type('', (), {})()  # Crée un objet vide
-                uploaded_file.getvalue = lambda: file_content  # Ajoute une méthode getvalue
-                result = extract_text_from_docx(uploaded_file)
-        elif file_extension == '.txt':
-            with open(temp_path, 'rb') as f:
-                result = extract_text_from_txt(f)
-        else:
-            st.error(f"Format de fichier non pris en charge: {file_extension}")
-            result = ""
-    finally:
-        # Nettoyage du fichier temporaire
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
-            
-    return result
+    La session ne garde que des poignées : les derniers messages et les noms des documents.
+    """
+    session_store = get_session_store()
+    session_store.open_session(st.session_state.session_id)
+    st.session_state.chat_messages = ConversationLog(session_store, st.session_state.session_id)
+    # Documents de la session {nom_document: contenu} et leurs index
+    st.session_state.documents = SessionDocumentStore(session_store, st.session_state.session_id)
+    st.session_state.history_summary = new_history_summary()
 
-def get_chunks(text, chunk_size=3000, overlap=200):
-    """Divise le texte en chunks pour gérer les documents longs"""
-    chunks = []
-    if not text:
-        return chunks
-        
-    # Chunking amélioré avec détection de phrases
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        if end < len(text) and end - start == chunk_size:
-            # Chercher la fin de phrase/paragraphe la plus proche pour une coupure propre
-            # Recherche plus sophistiquée avec pattern de fin de phrase
-            sentence_end_pattern = re.compile(r'[.!?]\s+')
-            matches = list(sentence_end_pattern.finditer(text[end-200:end]))
-            if matches:
-                # Utilise la dernière correspondance trouvée
-                last_match = matches[-1]
-                end = end - 200 + last_match.end()
-            else:
-                # Cherche une fin de ligne si pas de fin de phrase
-                newline_matches = list(re.finditer(r'\n', text[end-200:end]))
-                if newline_matches:
-                    last_newline = newline_matches[-1]
-                    end = end - 200 + last_newline.end()
-                    
-        chunks.append(text[start:end])
-        start = end - overlap if end < len(text) else end
-    
-    return chunks
+# Les messages du moteur s'affichent dans la page lorsqu'ils ne sont pas collectés par un worker
+set_notice_handler(lambda level, message: getattr(st, level)(message))
 
-def create_context_for_question(question, documents, max_length=6000):
-    """Crée un contexte pertinent pour la question en utilisant les documents disponibles"""
-    if not documents:
-        return ""
-    
-    # Combine tous les documents en un seul texte pour l'analyse
-    all_text = ""
-    for doc_name, doc_content in documents.items():
-        all_text += f"\n\n--- DOCUMENT: {doc_name} ---\n\n"
-        all_text += doc_content
-    
-    # Si le texte total est petit, on utilise tout
-    if len(all_text) <= max_length:
-        return all_text
-    
-    # Pour les documents plus grands, on utilise une méthode de recherche plus sophistiquée
-    chunks = get_chunks(all_text)
-    
-    # Analyse sémantique améliorée de la question
-    # Extraction des mots-clés avec élimination des stopwords
-    words = re.findall(r'\b\w+\b', question.lower())
-    stopwords = set(['le', 'la', 'les', 'un', 'une', 'des', 'et', 'est', 'à', 'au', 'aux', 
-                    'de', 'du', 'en', 'ce', 'cette', 'ces', 'qui', 'que', 'quoi', 'où', 
-                    'comment', 'pourquoi', 'quand', 'quel', 'quelle', 'quels', 'quelles',
-                    'il', 'elle', 'ils', 'elles', 'nous', 'vous', 'leur', 'leurs', 'son',
-                    'sa', 'ses', 'mon', 'ma', 'mes', 'ton', 'ta', 'tes', 'pour', 'par',
-                    'avec', 'sans', 'mais', 'ou', 'où', 'donc', 'or', 'ni', 'car', 'sur'])
-    
-    keywords = [word for word in words if word not in stopwords and len(word) > 2]
-    
-    if not keywords:
-        # Si pas de mots-clés significatifs, on prend les premiers chunks
-        selected_chunks = list(range(min(5, len(chunks))))
-    else:
-        # Score chaque chunk en fonction de la pertinence
-        chunk_scores = []
-        for i, chunk in enumerate(chunks):
-            chunk_lower = chunk.lower()
-            
-            # Score basé sur la fréquence des mots-clés avec pondération
-            base_score = 0
-            for keyword in keywords:
-                # Donne un poids plus élevé aux mots plus longs (supposés plus significatifs)
-                weight = min(1.0, 0.5 + (len(keyword) / 10))
-                count = chunk_lower.count(keyword)
-                base_score += count * weight
-            
-            # Bonus pour les chunks contenant des phrases complètes de la question
-            question_phrases = re.split(r'[.!?]', question.lower())
-            phrase_bonus = 0
-            for phrase in question_phrases:
-                if len(phrase.strip()) > 10 and phrase.strip() in chunk_lower:
-                    phrase_bonus += 2
-            
-            final_score = base_score + phrase_bonus
-            chunk_scores.append((i, final_score))
-        
-        # Trie les chunks par score et prend les meilleurs jusqu'à atteindre max_length
-        sorted_chunks = sorted(chunk_scores, key=lambda x: x[1], reverse=True)
-        
-        # Sélectionne les chunks avec le meilleur score
-        selected_chunks = []
-        total_length = 0
-        
-        for chunk_idx, score in sorted_chunks:
-            if score > 0 and total_length + len(chunks[chunk_idx]) <= max_length:
-                selected_chunks.append(chunk_idx)
-                total_length += len(chunks[chunk_idx])
-        
-        # Si aucun chunk n'a de score positif ou si on n'a pas assez de contenu
-        if not selected_chunks or total_length < max_length * 0.5:
-            # Ajoute des chunks supplémentaires au début du document
-            for i in range(min(3, len(chunks))):
-                if i not in selected_chunks and total_length + len(chunks[i]) <= max_length:
-                    selected_chunks.append(i)
-                    total_length += len(chunks[i])
-    
-    # Trie les indices pour préserver l'ordre original des documents
-    selected_chunks.sort()
-    context = "\n\n".join([chunks[i] for i in selected_chunks])
-    
-    return context
+def submit_documents(files):
+    """Met les fichiers téléchargés en file d'ingestion pour la session et renvoie les identifiants"""
+    ingestion_queue = get_ingestion_queue()
+    job_ids = []
+    for uploaded_file in files:
+        job_id = ingestion_queue.submit(uploaded_file.getvalue(), uploaded_file.name)
+        st.session_state.ingestion_jobs[job_id] = uploaded_file.name
+        job_ids.append(job_id)
+    return job_ids
+
+def collect_ingested_documents(job_ids=None):
+    """Ajoute au DocumentStore les documents dont l'ingestion est terminée
+
+    Renvoie les travaux récupérés (dans l'ordre d'envoi) afin d'afficher leurs messages.
+    """
+    ingestion_queue = get_ingestion_queue()
+    collected = []
+    for job_id in list(st.session_state.ingestion_jobs if job_ids is None else job_ids):
+        job = ingestion_queue.job(job_id)
+        if job is not None and not job.done:
+            continue
+        st.session_state.ingestion_jobs.pop(job_id, None)
+        if job is None:
+            continue
+        ingestion_queue.forget(job_id)
+        if job.result["text"]:
+            st.session_state.documents.add(job.name, job.result["text"], job.result["index"])
+        collected.append(job)
+    return collected
+
+def cancel_ingestion_jobs():
+    """Abandonne les ingestions en cours de la session"""
+    ingestion_queue = get_ingestion_queue()
+    for job_id in st.session_state.get("ingestion_jobs", {}):
+        ingestion_queue.forget(job_id)
+    st.session_state.ingestion_jobs = {}
 
 def add_message(role, content, attached_docs=None):
-    """Ajoute un message à l'interface de chat et à l'historique de conversation"""
-    # Ajoute à l'état de session pour l'affichage
+    """Ajoute un message à l'historique de conversation (affiché et envoyé au LLM)"""
     st.session_state.chat_messages.append({
+        "id": uuid.uuid4().hex,
         "role": role, 
         "content": content,
         "attached_docs": attached_docs
     })
+
+# Nombre de messages affichés par défaut (et ajoutés à chaque clic sur "messages précédents")
+DISPLAY_PAGE_SIZE = 20
+
+def render_message_html(msg, message_id):
+    """Construit le HTML d'un message de chat"""
+    role = msg["role"]
+    content = msg["content"]
+    attached_docs = msg.get("attached_docs", None)
     
-    # Ajoute à l'historique de conversation pour le LLM
-    st.session_state.conversation_history.append({
-        "role": role,
-        "content": content
-    })
+    if role == "user":
+        # Utilisation d'une icône plus générique pour l'utilisateur
+        avatar_html = '<div class="avatar-user">👤</div>'
+        bg_color = "user"
+    else:
+        # Icône pour l'assistant
+        avatar_html = '<div class="avatar-assistant">🤖</div>'
+        bg_color = "assistant"
+    
+    # Construit l'affichage du message avec markdown pour le contenu
+    parts = [f"""
+    <div class="chat-message {bg_color}" id="message-{message_id}">
+        {avatar_html}
+        <div class="message">
+            {content}
+    """]
+    
+    # Ajoute des indicateurs pour les documents attachés
+    if attached_docs:
+        parts.append('<div class="doc-indicator">Documents attachés: ')
+        parts.extend(f'<span class="document-pill">📄 {doc}</span>' for doc in attached_docs)
+        parts.append('</div>')
+    
+    parts.append("</div></div>")
+    return "".join(parts)
 
 # Fonction pour afficher les messages de chat avec un style amélioré
 def display_messages():
-    for idx, msg in enumerate(st.session_state.chat_messages):
-        role = msg["role"]
-        content = msg["content"]
-        attached_docs = msg.get("attached_docs", None)
-        
-        if role == "user":
-            # Utilisation d'une icône plus générique pour l'utilisateur
-            avatar_html = '<div class="avatar-user">👤</div>'
-            bg_color = "user"
-        else:
-            # Icône pour l'assistant
-            avatar_html = '<div class="avatar-assistant">🤖</div>'
-            bg_color = "assistant"
-        
-        # Construit l'affichage du message avec markdown pour le contenu
-        message_html = f"""
-        <div class="chat-message {bg_color}" id="message-{idx}">
-            {avatar_html}
-            <div class="message">
-                {content}
-        """
-        
-        # Ajoute des indicateurs pour les documents attachés
-        if attached_docs:
-            message_html += '<div class="doc-indicator">Documents attachés: '
-            for doc in attached_docs:
-                message_html += f'<span class="document-pill">📄 {doc}</span>'
-            message_html += '</div>'
-        
-        message_html += "</div></div>"
-        
+    """Affiche les derniers messages en réutilisant leur HTML déjà construit
+
+    Seuls les `display_limit` derniers messages sont émis ; un bouton permet de charger
+    les plus anciens. Le cache HTML est limité aux messages visibles.
+    """
+    messages = st.session_state.chat_messages
+    display_limit = st.session_state.get("display_limit", DISPLAY_PAGE_SIZE)
+    first_visible = max(0, len(messages) - display_limit)
+    
+    if first_visible:
+        if st.button(f"⬆️ Afficher les messages précédents ({first_visible} masqués)", key="load_older_messages"):
+            st.session_state.display_limit = display_limit + DISPLAY_PAGE_SIZE
+            st.rerun()
+    
+    rendered = st.session_state.setdefault("rendered_messages", {})
+    visible_ids = set()
+    # Les messages visibles sont lus en un lot (les plus anciens ne sont plus en mémoire)
+    for idx, msg in enumerate(messages[first_visible:], first_visible):
+        message_id = msg.get("id", idx)
+        visible_ids.add(message_id)
+        message_html = rendered.get(message_id)
+        if message_html is None:
+            message_html = rendered[message_id] = render_message_html(msg, message_id)
         st.markdown(message_html, unsafe_allow_html=True)
+    
+    # Oublie le HTML des messages qui ne sont plus affichés
+    for message_id in rendered.keys() - visible_ids:
+        del rendered[message_id]
+
+def render_assistant_message(content):
+    """HTML d'un message de l'assistant en cours de génération"""
+    return f"""
+    <div class="chat-message assistant">
+        <div class="avatar-assistant">🤖</div>
+        <div class="message">
+            {content}
+        </div>
+    </div>
+    """
+
+def format_generation_stats(stats):
+    """Résumé lisible des mesures d'une génération"""
+    if stats.get("cached"):
+        return f"⏱️ réponse en cache · {stats['renders']} rafraîchissements"
+    parts = []
+    if stats.get("time_to_first_token") is not None:
+        parts.append(f"premier token en {stats['time_to_first_token']:.2f} s")
+    if stats.get("tokens_per_second") is not None:
+        parts.append(f"{stats['tokens_per_second']:.1f} tokens/s")
+    parts.append(f"{stats['tokens']} tokens, {stats['renders']} rafraîchissements")
+    return "⏱️ " + " · ".join(parts)
+
+def record_generation_metrics(stats, total_seconds, response_chars):
+    """Reporte les mesures d'une génération (premier token, durée totale, tokens) dans le registre"""
+    metrics = get_metrics()
+    if stats.get("time_to_first_token") is not None:
+        metrics.observe("time_to_first_token", stats["time_to_first_token"])
+    metrics.observe("generation", total_seconds, bytes_count=response_chars, tokens=stats["tokens"])
 
-# Cache du client OpenAI pour éviter de le recréer à chaque interaction
+def display_metrics_panel():
+    """Panneau de débogage : latences par étape, débits et taux de succès des caches"""
+    summary = get_metrics().snapshot()
+    if not summary["stages"] and not summary["caches"]:
+        st.caption("Aucune mesure pour le moment.")
+        return
+    rows = []
+    for stage, entry in summary["stages"].items():
+        rows.append({
+            "étape": stage,
+            "appels": entry["count"],
+            "p50 (ms)": round(entry["p50"] * 1000, 1),
+            "p95 (ms)": round(entry["p95"] * 1000, 1),
+            "Mo/s": round(entry["mb_per_second"], 1) if entry["mb_per_second"] else None,
+            "tokens/s": round(entry["tokens_per_second"], 1) if entry["tokens_per_second"] else None,
+        })
+    st.table(rows)
+    for cache, entry in summary["caches"].items():
+        st.caption(f"Cache {cache} : {entry['hit_rate']:.0%} de succès ({entry['hits']}/{entry['hits'] + entry['misses']})")
+
+
+# Transport partagé pour éviter de recréer le client et ses connexions à chaque interaction
 @st.cache_resource
-def get_openai_client():
-    """Récupère un client OpenAI avec mise en cache"""
-    return OpenAI(
-        base_url=API_BASE_URL,
-        api_key=API_KEY
-    )
+def get_llm_transport():
+    """Récupère le transport asynchrone vers l'API avec mise en cache"""
+    api_creds = get_api_credentials()
+    return AsyncLLMTransport(api_creds["base_url"], api_creds["api_key"])
+
+# Ordonnanceur partagé : limite les générations simultanées et le débit de tokens de tout le processus
+@st.cache_resource
+def get_llm_scheduler():
+    """Récupère le contrôleur d'admission enveloppant le transport partagé"""
+    return AdmissionController(get_llm_transport())
+
+def show_queue_position(placeholder):
+    """Rappel d'attente : affiche la position de la demande dans la file du modèle"""
+    def on_wait(position, waited):
+        placeholder.info(f"⏳ Modèle très sollicité : position {position} dans la file d'attente ({waited:.0f} s)")
+    return on_wait
+
+def cancel_active_generation():
+    """Annule la génération en cours de la session, s'il y en a une"""
+    generation = st.session_state.pop("active_generation", None)
+    if generation is not None:
+        generation.cancel()
+
+def _ingestion_jobs_panel():
+    """Progression des ingestions de la session ; relance l'application dès qu'un document est prêt"""
+    job_ids = list(st.session_state.get("ingestion_jobs", {}))
+    if not job_ids:
+        return
+    ingestion_queue = get_ingestion_queue()
+    st.write("### Indexation en cours:")
+    any_done = False
+    for job_id in job_ids:
+        job = ingestion_queue.job(job_id)
+        if job is None or job.done:
+            any_done = True
+            continue
+        st.progress(job.progress, text=f"📄 {job.name} · {job.status}")
+    # Pas de relance pendant l'envoi d'un message : les documents sont récupérés à l'exécution suivante
+    if any_done and not st.session_state.get("form_submitted"):
+        st.rerun()
+
+# Même panneau, réexécuté seul chaque seconde (fragment) tant qu'une ingestion est en cours
+_polled_ingestion_jobs_panel = st.fragment(run_every=1.0)(_ingestion_jobs_panel)
+
+def display_ingestion_jobs():
+    """Panneau des ingestions, interrogé chaque seconde uniquement tant qu'un travail de la session est en cours"""
+    ingestion_queue = get_ingestion_queue()
+    running = any(job is not None and not job.done
+                  for job in map(ingestion_queue.job, st.session_state.get("ingestion_jobs", {})))
+    if running:
+        _polled_ingestion_jobs_panel()
+    else:
+        _ingestion_jobs_panel()
 
 # Interface utilisateur Streamlit optimisée
 # Remplacez la partie initiale du code main() par cette version
 
 def main():
+    configure_page()
+    require_api_credentials()
+    
+    # Appel de l'initialisation
+    init_session_state()
+    
+    # Session purgée après une longue inactivité : son historique et ses documents ont disparu du disque
+    if not get_session_store().touch(st.session_state.session_id):
+        start_session_storage()
+        cancel_ingestion_jobs()
+        st.session_state.display_limit = DISPLAY_PAGE_SIZE
+        st.info("Session expirée après une longue inactivité : nouvelle conversation démarrée.")
+    
+    # Récupère les documents indexés en arrière-plan depuis la dernière exécution
+    for job in collect_ingested_documents():
+        if not job.result["text"]:
+            st.sidebar.error(f"Échec du traitement de {job.name}: {job.result['error'] or 'aucun texte extrait'}")
+    
     # Sidebar pour les paramètres
     with st.sidebar:
         st.title("⚙️ Paramètres")
         
+        # Suivi des documents en cours d'indexation
+        display_ingestion_jobs()
+        
         # Affichage des documents déjà téléchargés
         if st.session_state.documents:
             st.write("### Documents disponibles:")
@@ -511,25 +418,35 @@ def main():
         with st.expander("⚙️ Paramètres avancés", expanded=False):
             st.slider("Température", min_value=0.0, max_value=1.0, value=TEMPERATURE, step=0.1, key="temperature", 
                       help="Contrôle la créativité des réponses (0=déterministe, 1=créatif)")
-            st.slider("Longueur maximale", min_value=100, max_value=4096, value=MAX_TOKENS, step=100, key="max_tokens",
+            st.slider("Longueur maximale", min_value=100, max_value=MAX_TOKENS, value=MAX_TOKENS, step=100, key="max_tokens",
                       help="Nombre maximum de tokens dans la réponse")
+            st.selectbox("Classement des passages", options=list(RANKERS), key="ranker",
+                         index=list(RANKERS).index(DEFAULT_RANKER),
+                         help="Méthode de sélection des passages de documents envoyés au modèle")
+            st.checkbox("Rechercher dans tous les documents de la session", value=False, key="search_all_documents",
+                        help="Sinon, seuls les documents joints au message sont utilisés")
+            st.slider("Mémoire de conversation (tokens)", min_value=1000, max_value=16000, value=HISTORY_TOKEN_BUDGET,
+                      step=500, key="history_budget",
+                      help="Les échanges plus anciens sont remplacés par un résumé")
             
-            # Option pour télécharger l'historique de conversation
-            if st.button("Télécharger l'historique"):
-                conversation_json = json.dumps(st.session_state.chat_messages, ensure_ascii=False, indent=2)
-                st.download_button(
-                    label="Télécharger JSON",
-                    data=conversation_json,
-                    file_name="conversation_history.json",
-                    mime="application/json",
-                )
+            # Option pour télécharger l'historique de conversation, exporté depuis le stockage au clic
+            # (data différée, Streamlit 1.52 ou plus récent)
+            st.download_button(
+                label="Télécharger l'historique",
+                data=st.session_state.chat_messages.export,
+                file_name="conversation_history.json",
+                mime="application/json",
+            )
+            
+            if st.checkbox("Afficher les mesures de performance", key="show_metrics"):
+                display_metrics_panel()
             
             if st.button("Réinitialiser la conversation"):
-                st.session_state.conversation_history = [
-                    {"role": "system", "content": "Tu es un assistant intelligent qui répond en français même si la question est dans une autre langue. Tu peux discuter de tout sujet et analyser des documents si l'utilisateur en fournit."}
-                ]
-                st.session_state.chat_messages = []
-                st.session_state.documents = {}
+                cancel_active_generation()
+                start_session_storage()
+                cancel_ingestion_jobs()
+                st.session_state.pop("last_generation_stats", None)
+                st.session_state.display_limit = DISPLAY_PAGE_SIZE
                 st.success("Conversation réinitialisée!")
                 st.rerun()
 
@@ -540,11 +457,11 @@ def main():
     with col2:
         # Bouton Nouvelle Conversation simple
         if st.button("➕ Nouvelle", key="new_conversation", use_container_width=True):
-            st.session_state.conversation_history = [
-                {"role": "system", "content": "Tu es un assistant intelligent qui répond en français même si la question est dans une autre langue. Tu peux discuter de tout sujet et analyser des documents si l'utilisateur en fournit."}
-            ]
-            st.session_state.chat_messages = []
-            st.session_state.documents = {}
+            cancel_active_generation()
+            start_session_storage()
+            cancel_ingestion_jobs()
+            st.session_state.pop("last_generation_stats", None)
+            st.session_state.display_limit = DISPLAY_PAGE_SIZE
             # Assurez-vous de réinitialiser également la clé form_submitted
             if "form_submitted" in st.session_state:
                 st.session_state.form_submitted = False
@@ -576,6 +493,8 @@ def main():
     # Affichage des messages de chat
     with st.container():
         display_messages()
+        if st.session_state.get("last_generation_stats"):
+            st.caption(format_generation_stats(st.session_state.last_generation_stats))
     
     # Zone de saisie pour la question
     st.write("### Envoyez un message")
@@ -615,32 +534,46 @@ def main():
         # Marque le formulaire comme soumis pour éviter les doubles exécutions
         st.session_state.form_submitted = True
         
-        # Traitement des fichiers
+        # Traitement du message
+        if not user_input.strip() and not uploaded_files:
+            st.warning("Veuillez entrer un message ou joindre un document.")
+            # Réinitialise l'état pour permettre une nouvelle soumission
+            st.session_state.form_submitted = False
+            st.stop()
+        
+        # Les fichiers partent en ingestion en arrière-plan ; seule leur ingestion est attendue ici
         attached_docs = []
-        if uploaded_files:
+        attached_jobs = submit_documents(uploaded_files) if uploaded_files else []
+        if attached_jobs:
             st.write("Documents à joindre à ce message:")
             cols = st.columns(4)
+            file_status = {job_id: cols[i % 4].empty() for i, job_id in enumerate(attached_jobs)}
+            ingestion_queue = get_ingestion_queue()
+            remaining = attached_jobs
+            while remaining:
+                for job_id in remaining:
+                    job = ingestion_queue.job(job_id)
+                    if job is not None:
+                        file_status[job_id].progress(job.progress, text=f"📎 {job.name} · {job.status}")
+                remaining = ingestion_queue.wait(remaining, timeout=INGESTION_POLL_INTERVAL)
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                col_index = i % 4
-                with cols[col_index]:
-                    file_name = uploaded_file.name
-                    st.write(f"📎 {file_name}")
-                    
-                    # Traitement du fichier
-                    with st.spinner(f"Traitement de {file_name}..."):
-                        document_text = process_file(uploaded_file.getvalue(), file_name)
-                        if document_text:
-                            st.session_state.documents[file_name] = document_text
-                            attached_docs.append(file_name)
-                            st.success(f"✓ ({len(document_text)} caractères)")
-                        else:
-                            st.error("Échec du traitement")
+            # Enregistre les documents dans l'ordre d'upload ; seuls ceux dont le texte a été extrait sont joints
+            for job in collect_ingested_documents(attached_jobs):
+                with file_status[job.id].container():
+                    st.write(f"📎 {job.name}")
+                    for level, notice in job.result["notices"]:
+                        getattr(st, level)(notice)
+                    if job.result["text"]:
+                        attached_docs.append(job.name)
+                        origin = ", cache" if job.result["cached"] else ""
+                        st.success(f"✓ ({len(job.result['text'])} caractères{origin})")
+                    elif job.result["error"]:
+                        st.error(f"Échec du traitement: {job.result['error']}")
+                    else:
+                        st.error("Échec du traitement")
         
-        # Traitement du message
         if not user_input.strip() and not attached_docs:
-            st.warning("Veuillez entrer un message ou joindre un document.")
-            # Réinitialise l'état pour permettre une nouvelle soumission
+            st.warning("Aucun texte n'a pu être extrait des documents joints.")
             st.session_state.form_submitted = False
             st.stop()
         
@@ -649,7 +582,7 @@ def main():
         if not message_text and attached_docs:
             message_text = "Peux-tu analyser ce(s) document(s) et me dire ce qu'il(s) contien(nen)t?"
         
-        # Ajoute immédiatement le message à l'interface et à l'historique
+        # Ajoute le message à l'interface et à l'historique
         add_message("user", message_text, attached_docs)
         
         # Indique que la génération est en cours
@@ -657,50 +590,34 @@ def main():
         
         # Prépare le contexte des documents si applicable
         document_context = ""
-        if attached_docs:
-            # Sélectionne seulement les documents joints à ce message
-            docs_for_context = {name: content for name, content in st.session_state.documents.items() if name in attached_docs}
-            with st.spinner("Analyse des documents..."):
-                document_context = create_context_for_question(message_text, docs_for_context)
+        search_all = st.session_state.get("search_all_documents", False)
+        if attached_docs or (search_all and len(st.session_state.documents)):
+            # Interroge tous les documents de la session, ou seulement ceux joints à ce message
+            with st.spinner("Analyse des documents..."), get_metrics().timer("retrieval") as measure:
+                document_context = create_context_for_question(message_text, st.session_state.documents,
+                                                               ranker=st.session_state.get("ranker", DEFAULT_RANKER),
+                                                               doc_names=None if search_all else attached_docs,
+                                                               attached_docs=attached_docs)
+                measure["bytes"] = len(document_context)
+                measure["tokens"] = estimate_tokens(document_context)
         
-        # Prépare le prompt avec le contexte du document si nécessaire
-        if document_context:
-            # Prépare les messages pour l'API avec le contexte des documents
-            system_message = {"role": "system", "content": "Tu es un assistant intelligent qui répond en français. Tu peux analyser des documents fournis par l'utilisateur et répondre à des questions à leur sujet."}
-            
-            # Construit la liste des messages pour l'API
-            messages = [system_message]
-            
-            # Ajoute les messages précédents mais pas le dernier (qui sera traité spécialement)
-            for msg in st.session_state.conversation_history[1:-1]:
-                messages.append(msg)
-            
-            # Prépare le dernier message de l'utilisateur avec le contexte des documents
-            full_prompt = f"""Voici ma question: {message_text}
-
-Je joins également les documents suivants pour référence:
-
-{document_context}
-
-Réponds à ma question en te basant sur les informations fournies dans ces documents si pertinent."""
-            
-            # Remplace le dernier message par celui avec le contexte
-            messages.append({"role": "user", "content": full_prompt})
-        else:
-            # Pas de document attaché, utilise les messages tels quels
-            system_message = {"role": "system", "content": "Tu es un assistant intelligent qui répond en français même si la question est dans une autre langue."}
-            messages = [system_message] + st.session_state.conversation_history[1:]
+        # Prépare le prompt (avec le contexte des documents si nécessaire) dans le budget d'historique
+        messages = build_prompt_messages(st.session_state.chat_messages,
+                                         st.session_state.history_summary, document_context,
+                                         st.session_state.get("history_budget", HISTORY_TOKEN_BUDGET))
         
-        # Récupère le client OpenAI mis en cache
-        client = get_openai_client()
+        # Récupère l'ordonnanceur des appels au modèle et le cache de réponses mis en cache
+        scheduler = get_llm_scheduler()
+        response_cache = get_response_cache()
         
         # Affiche un placeholder pour la réponse en streaming
         with st.spinner("Génération de la réponse..."):
             full_response = ""
+            admitted = None  # génération admise par l'ordonnanceur, à libérer quoi qu'il arrive
             
             try:
-                # Appel de l'API en mode streaming
-                response = client.chat.completions.create(
+                request_started = time.perf_counter()
+                request = dict(
                     model=MODEL,
                     messages=messages,
                     max_tokens=st.session_state.get("max_tokens", MAX_TOKENS),
@@ -708,31 +625,41 @@ Réponds à ma question en te basant sur les informations fournies dans ces docu
                     top_p=TOP_P,
                     presence_penalty=PRESENCE_PENALTY,
                     stop=STOP_SEQUENCE,
-                    stream=True,
                 )
+                cache_key = response_cache_key(request) if response_cache_enabled(request) else None
+                cached_response = response_cache.get(cache_key) if cache_key else None
+                if cache_key:
+                    get_metrics().cache_result("réponses", cached_response is not None)
+                if cached_response is not None:
+                    # Réponse déjà connue : rejouée par le même chemin d'affichage que le flux
+                    generation = replay_response(cached_response)
+                else:
+                    # Appel de l'API en mode streaming, après passage dans la file d'attente partagée
+                    queue_status = st.empty()
+                    generation = scheduler.stream_chat(st.session_state.session_id,
+                                                       on_wait=show_queue_position(queue_status), **request)
+                    # Enregistrée avant tout appel st.* : un rerun ou un arrêt peut survenir à chacun d'eux
+                    admitted = st.session_state.active_generation = generation
+                    queue_status.empty()
+                    # Les mesures de la génération partent de l'admission, l'attente est mesurée à part
+                    request_started = time.perf_counter()
                 
                 # Conteneur pour afficher la réponse en streaming
                 with st.container():
                     # Commence l'affichage du message
-                    message_container = st.empty()
+                    renderer = StreamRenderer(st.empty(), started=request_started, render=render_assistant_message)
                     
-                    # Affichage en temps réel de la réponse
-                    for chunk in response:
-                        if chunk.choices and chunk.choices[0].delta.content:
-                            content = chunk.choices[0].delta.content
-                            full_response += content
-                            
-                            # Met à jour l'affichage du message avec l'icône générique
-                            message_html = f"""
-                            <div class="chat-message assistant">
-                                <div class="avatar-assistant">🤖</div>
-                                <div class="message">
-                                    {full_response}
-                                </div>
-                            </div>
-                            """
-                            message_container.markdown(message_html, unsafe_allow_html=True)
-                            time.sleep(0.01)
+                    # Affichage de la réponse par lots de deltas
+                    for delta in generation:
+                        renderer.write(delta)
+                    full_response = renderer.close()
+                    st.session_state.last_generation_stats = {**renderer.stats(), "cached": cached_response is not None}
+                if cached_response is None:
+                    record_generation_metrics(st.session_state.last_generation_stats,
+                                              time.perf_counter() - request_started, len(full_response))
+                st.session_state.pop("active_generation", None)
+                if cache_key and cached_response is None and full_response:
+                    response_cache.put(cache_key, full_response)
                 
                 # Ajoute la réponse complète à l'historique de conversation
                 add_message("assistant", full_response)
@@ -744,6 +671,11 @@ Réponds à ma question en te basant sur les informations fournies dans ces docu
                 # Rafraîchit l'interface pour afficher la réponse complète
                 st.rerun()
                 
+            except AdmissionRejected as e:
+                # Demande refusée avant l'appel : rien n'a été envoyé au modèle
+                st.warning(str(e))
+                st.session_state.form_submitted = False
+                st.session_state.is_generating = False
             except Exception as e:
                 st.error(f"Erreur lors de la génération de la réponse: {str(e)}")
                 # Log plus détaillé de l'erreur pour le débogage
@@ -751,6 +683,13 @@ Réponds à ma question en te basant sur les informations fournies dans ces docu
                 # Réinitialise l'état pour permettre une nouvelle soumission
                 st.session_state.form_submitted = False
                 st.session_state.is_generating = False
+            finally:
+                # Rerun, arrêt ou erreur avant la fin du flux : la place dans la file et le flux amont
+                # sont libérés (sans effet si la réponse a été lue jusqu'au bout)
+                if admitted is not None:
+                    admitted.cancel()
+                    if st.session_state.get("active_generation") is admitted:
+                        del st.session_state.active_generation
 
 # Point d'entrée de l'application
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""Génération de corpus synthétiques en français (TXT, DOCX, PDF) pour les benchmarks
+
+Les corpus sont déterministes (graine fixe) : deux exécutions produisent exactement les
+mêmes fichiers, ce qui rend les résultats comparables d'une version à l'autre.
+"""
+import io
+import os
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+SUJETS = ["le prestataire", "le client", "la société", "le fournisseur", "l'administration", "le locataire",
+          "le bailleur", "le salarié", "l'employeur", "le responsable du traitement", "la commission",
+          "le comité de pilotage", "l'assureur", "le maître d'ouvrage", "l'équipe projet"]
+VERBES = ["s'engage à respecter", "doit transmettre", "peut résilier", "garantit", "met en œuvre",
+          "vérifie", "conserve", "communique", "évalue", "prend en charge", "facture", "déclare",
+          "valide", "documente", "assure le suivi de"]
+COMPLEMENTS = ["les obligations de confidentialité", "le rapport d'activité trimestriel",
+               "les données à caractère personnel", "le contrat de maintenance", "les pénalités de retard",
+               "la période d'essai", "le préavis de trois mois", "les conditions générales de vente",
+               "le cahier des charges", "les indicateurs de performance", "la facturation mensuelle",
+               "le plan de continuité d'activité", "les mesures de sécurité", "l'état des lieux",
+               "la clause de non-concurrence", "le budget prévisionnel", "les délais de livraison",
+               "la garantie décennale", "le dépôt de garantie", "les réserves émises à la réception"]
+CIRCONSTANCES = ["dans un délai de trente jours", "conformément à l'article 12", "avant la fin de l'exercice",
+                 "sauf accord écrit préalable", "à compter de la date de signature", "en cas de force majeure",
+                 "selon les modalités prévues en annexe", "sous réserve de l'avis du comité",
+                 "à chaque échéance contractuelle", "dès réception de la mise en demeure"]
+TITRES = ["Objet du contrat", "Durée et résiliation", "Obligations des parties", "Confidentialité",
+          "Protection des données", "Conditions financières", "Responsabilité et assurances",
+          "Propriété intellectuelle", "Sécurité et conformité", "Dispositions diverses"]
+
+QUESTIONS = [
+    "Quel est le préavis de résiliation du contrat ?",
+    "Quelles sont les obligations de confidentialité du prestataire ?",
+    "Comment sont calculées les pénalités de retard ?",
+    "Qui prend en charge le dépôt de garantie à la fin du bail ?",
+    "Quelles mesures de sécurité protègent les données à caractère personnel ?",
+]
+
+
+def _phrase(rng):
+    phrase = f"{rng.choice(SUJETS)} {rng.choice(VERBES)} {rng.choice(COMPLEMENTS)} {rng.choice(CIRCONSTANCES)}."
+    return phrase[0].upper() + phrase[1:]
+
+
+def iter_blocks(target_bytes, seed=0):
+    """Produit des blocs ('titre' | 'paragraphe' | 'tableau', contenu) jusqu'à `target_bytes` octets UTF-8"""
+    rng = random.Random(seed)
+    # Réserve de paragraphes réutilisés pour générer rapidement les gros corpus
+    paragraphes = [" ".join(_phrase(rng) for _ in range(rng.randint(3, 9))) for _ in range(2000)]
+    produced = 0
+    section = 0
+    while produced < target_bytes:
+        section += 1
+        titre = f"{section}. {rng.choice(TITRES)}"
+        yield "titre", titre
+        produced += len(titre.encode("utf-8")) + 2
+        for _ in range(rng.randint(2, 6)):
+            paragraphe = rng.choice(paragraphes)
+            yield "paragraphe", paragraphe
+            produced += len(paragraphe.encode("utf-8")) + 2
+        if rng.random() < 0.2:
+            lignes = [["Poste", "Montant (€)", "Échéance"]]
+            lignes += [[rng.choice(COMPLEMENTS), f"{rng.randint(100, 99999)},00", f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/2025"]
+                       for _ in range(rng.randint(2, 6))]
+            yield "tableau", lignes
+            produced += sum(len(" | ".join(ligne).encode("utf-8")) + 1 for ligne in lignes)
+
+
+def make_txt(target_bytes, seed=0):
+    parts = []
+    for kind, content in iter_blocks(target_bytes, seed):
+        if kind == "tableau":
+            parts.append("\n".join(" | ".join(ligne) for ligne in content))
+        else:
+            parts.append(content)
+    return "\n\n".join(parts).encode("utf-8")
+
+
+def make_docx(target_bytes, seed=0):
+    """DOCX minimal (écrit directement en WordprocessingML) : titres, paragraphes et tableaux"""
+    body = []
+    for kind, content in iter_blocks(target_bytes, seed):
+        if kind == "tableau":
+            rows = "".join(
+                "<w:tr>" + "".join(f'<w:tc><w:p><w:r><w:t xml:space="preserve">{escape(cell)}</w:t></w:r></w:p></w:tc>'
+                                   for cell in ligne) + "</w:tr>"
+                for ligne in content
+            )
+            body.append(f"<w:tbl>{rows}</w:tbl>")
+        else:
+            style = '<w:pPr><w:pStyle w:val="Heading1"/></w:pPr>' if kind == "titre" else ""
+            body.append(f'<w:p>{style}<w:r><w:t xml:space="preserve">{escape(content)}</w:t></w:r></w:p>')
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{"".join(body)}</w:body></w:document>')
+    content_types = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     '<Default Extension="xml" ContentType="application/xml"/>'
+                     '<Override PartName="/word/document.xml" '
+                     'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                     '</Types>')
+    rels = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/></Relationships>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", content_types)
+        archive.writestr("_rels/.rels", rels)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def _pdf_string(line):
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf(target_bytes, seed=0, lines_per_page=60, line_width=95):
+    """PDF minimal non compressé (Helvetica, WinAnsiEncoding) dont le texte extrait fait ~`target_bytes`"""
+    lines = []
+    for kind, content in iter_blocks(target_bytes, seed):
+        if kind == "tableau":
+            lines.extend(" | ".join(ligne) for ligne in content)
+        else:
+            words = content.split()
+            current = ""
+            for word in words:
+                if current and len(current) + len(word) + 1 > line_width:
+                    lines.append(current)
+                    current = word
+                else:
+                    current = f"{current} {word}" if current else word
+            lines.append(current)
+        lines.append("")
+
+    objects = []
+    def add(payload):
+        objects.append(payload)
+        return len(objects)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    pages_id = add(b"")
+    kids = []
+    for first in range(0, len(lines), lines_per_page):
+        page_lines = lines[first:first + lines_per_page]
+        stream = ("BT /F1 9 Tf 40 810 Td 13 TL " + " ".join(f"{_pdf_string(line)} '" for line in page_lines)
+                  + " ET").encode("cp1252", errors="replace")
+        contents = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                        b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, contents)))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, payload in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + payload + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+GENERATORS = {"txt": make_txt, "docx": make_docx, "pdf": make_pdf}
+
+
+def corpus_file(directory, file_format, size_mb, seed=0):
+    """Chemin du corpus synthétique demandé, généré une seule fois puis réutilisé"""
+    path = os.path.join(directory, f"synthetique-{size_mb}mo-{seed}.{file_format}")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        data = GENERATORS[file_format](int(size_mb * 1024 * 1024), seed)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
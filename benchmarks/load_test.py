@@ -0,0 +1,289 @@
+"""Test de charge multi-sessions du moteur docqa contre un faux serveur LLM
+
+Simule N sessions concurrentes dans un seul processus, comme un worker Streamlit : chaque
+session téléverse ses documents dans la file d'ingestion partagée, puis enchaîne des
+questions (recherche du contexte, prompt, génération en streaming via l'ordonnanceur
+et le transport partagés). Le rapport donne le débit, les latences de bout en bout et du premier token
+(p50/p95) et la croissance de la mémoire du processus par session :
+
+    python benchmarks/load_test.py --sessions 20 --turns 3 --documents txt:0.5,docx:0.5
+    python benchmarks/load_test.py --sessions 50 --error-rate 0.05 --rate-limit-rate 0.05 --output charge.json
+
+Le faux serveur (stub_llm.py) est démarré dans le processus, sauf si --base-url désigne
+un serveur existant.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from corpus import QUESTIONS, corpus_file
+from run_benchmarks import DEFAULT_CORPUS_DIR, git_revision, load_engine, percentile
+from stub_llm import add_arguments, base_url, config_from_args, serve
+
+
+def current_rss_mb():
+    """Mémoire résidente actuelle du processus (Linux), None ailleurs"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class UploadedDocument:
+    """Fichier présenté comme un upload Streamlit (nom et contenu)"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+class LoadSession:
+    """Session simulée : mêmes étapes et même état conservé que la soumission d'un message dans app-2.py"""
+
+    def __init__(self, number, engine, scheduler, document_paths, args):
+        from docqa.llm import MODEL, PRESENCE_PENALTY, STOP_SEQUENCE, TOP_P
+        self.number = number
+        self.session_id = f"session-{number}"
+        self.engine = engine
+        self.scheduler = scheduler
+        self.document_paths = document_paths
+        self.args = args
+        self.request_defaults = dict(model=MODEL, top_p=TOP_P, presence_penalty=PRESENCE_PENALTY,
+                                     stop=STOP_SEQUENCE, max_tokens=args.max_tokens, temperature=args.temperature)
+        # État conservé entre les tours, comme st.session_state : poignées vers le stockage des sessions
+        session_store = engine.get_session_store()
+        session_store.open_session(self.session_id)
+        self.documents = engine.SessionDocumentStore(session_store, self.session_id)
+        self.conversation_history = engine.ConversationLog(session_store, self.session_id)
+        self.history_summary = engine.new_history_summary()
+        self.turns = []
+
+    def ingest(self, uploads):
+        queue = self.engine.get_ingestion_queue()
+        job_ids = [queue.submit(upload.getvalue(), upload.name) for upload in uploads]
+        remaining = job_ids
+        while remaining:
+            remaining = queue.wait(remaining, timeout=0.25)
+        for job_id in job_ids:
+            job = queue.forget(job_id)
+            if job is not None and job.result["text"]:
+                self.documents.add(job.name, job.result["text"], job.result["index"])
+
+    def turn(self, question, uploads=()):
+        """Un message utilisateur, de l'envoi (documents joints compris) au dernier token reçu"""
+        engine = self.engine
+        record = {"session": self.number, "turn": len(self.turns), "uploads": len(uploads), "error": None,
+                  "ttft_s": None, "chars": 0}
+        started = time.perf_counter()
+        try:
+            if uploads:
+                self.ingest(uploads)
+            record["ingestion_s"] = time.perf_counter() - started
+            self.conversation_history.append({"role": "user", "content": question})
+            context = ""
+            if len(self.documents):
+                context = engine.create_context_for_question(question, self.documents, ranker=self.args.ranker)
+            messages = engine.build_prompt_messages(self.conversation_history, self.history_summary, context)
+            request_started = time.perf_counter()
+            record["preparation_s"] = request_started - started
+            pieces = []
+            for delta in self.scheduler.stream_chat(self.session_id, messages=messages,
+                                                    **self.request_defaults):
+                if not pieces:
+                    record["ttft_s"] = time.perf_counter() - request_started
+                pieces.append(delta)
+            response = "".join(pieces)
+            record["chars"] = len(response)
+            self.conversation_history.append({"role": "assistant", "content": response})
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["e2e_s"] = time.perf_counter() - started
+        self.turns.append(record)
+        return record
+
+    def run(self, start_event, delay=0.0):
+        start_event.wait()
+        time.sleep(delay)
+        for turn in range(self.args.turns):
+            question = QUESTIONS[(self.number + turn) % len(QUESTIONS)]
+            # Les fichiers ne sont lus qu'à l'envoi, comme un upload reçu par le serveur
+            self.turn(question, [read_upload(path) for path in self.document_paths] if turn == 0 else ())
+            if self.args.think_time and turn + 1 < self.args.turns:
+                time.sleep(self.args.think_time)
+
+
+def read_upload(path):
+    with open(path, "rb") as f:
+        return UploadedDocument(os.path.basename(path), f.read())
+
+
+def session_documents(args, number):
+    """Corpus joints par une session : partagés, ou propres à la session avec --distinct-documents"""
+    seed = args.seed + (number if args.distinct_documents else 0)
+    paths = []
+    for spec in filter(None, args.documents.split(",")):
+        file_format, _, size = spec.partition(":")
+        paths.append(corpus_file(args.corpus_dir, file_format, float(size) if size else 0.5, seed))
+    return paths
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "max": max(values),
+            "mean": statistics.fmean(values)}
+
+
+def build_report(sessions, wall_seconds, rss_before, rss_after, stub_stats, args):
+    turns = [record for session in sessions for record in session.turns]
+    succeeded = [record for record in turns if record["error"] is None]
+    chars = sum(record["chars"] for record in succeeded)
+    memory = None
+    if rss_before is not None and rss_after is not None:
+        memory = {"rss_before_mb": round(rss_before, 1), "rss_after_mb": round(rss_after, 1),
+                  "growth_per_session_mb": round((rss_after - rss_before) / len(sessions), 2)}
+    errors = {}
+    for record in turns:
+        if record["error"]:
+            kind = record["error"].split(":", 1)[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "api_key")},
+        },
+        "summary": {
+            "sessions": len(sessions),
+            "turns": len(turns),
+            "failed_turns": len(turns) - len(succeeded),
+            "errors": errors,
+            "wall_s": wall_seconds,
+            "turns_per_s": len(succeeded) / wall_seconds if wall_seconds else None,
+            "tokens_per_s": chars / 4 / wall_seconds if wall_seconds else None,  # ~4 caractères par token
+            "e2e_s": summarize(record["e2e_s"] for record in succeeded),
+            "ttft_s": summarize(record["ttft_s"] for record in succeeded),
+            "ingestion_s": summarize(record["ingestion_s"] for record in succeeded if record["uploads"]),
+            "memory": memory,
+            "llm_server": stub_stats,
+        },
+        "turns": turns,
+    }
+
+
+def print_summary(summary):
+    def quantiles(name):
+        values = summary[name]
+        return f"p50 {values['p50']:.3f}s · p95 {values['p95']:.3f}s · max {values['max']:.3f}s" if values else "—"
+    print(f"{summary['sessions']} sessions · {summary['turns']} tours ({summary['failed_turns']} en échec) "
+          f"en {summary['wall_s']:.1f}s", file=sys.stderr)
+    if summary["turns_per_s"] is not None:
+        print(f"débit            {summary['turns_per_s']:.2f} tours/s · {summary['tokens_per_s']:.0f} tokens/s",
+              file=sys.stderr)
+    print(f"bout en bout     {quantiles('e2e_s')}", file=sys.stderr)
+    print(f"premier token    {quantiles('ttft_s')}", file=sys.stderr)
+    print(f"ingestion        {quantiles('ingestion_s')}", file=sys.stderr)
+    if summary["memory"]:
+        memory = summary["memory"]
+        print(f"mémoire          {memory['rss_before_mb']} -> {memory['rss_after_mb']} Mo "
+              f"({memory['growth_per_session_mb']} Mo par session)", file=sys.stderr)
+    if summary["errors"]:
+        print(f"erreurs          {summary['errors']}", file=sys.stderr)
+    if summary["llm_server"]:
+        print(f"serveur LLM      {summary['llm_server']}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="sessions simulées simultanément")
+    parser.add_argument("--turns", type=int, default=3, help="messages envoyés par session")
+    parser.add_argument("--documents", default="txt:0.5",
+                        help="documents joints au premier message (format:taille en Mo, séparés par des virgules)")
+    parser.add_argument("--distinct-documents", action="store_true",
+                        help="un corpus différent par session (sinon partagé : cache d'extraction sollicité)")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="secondes pour démarrer toutes les sessions")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause entre deux messages d'une session")
+    parser.add_argument("--ranker", default="bm25")
+    parser.add_argument("--max-tokens", type=int, default=512)
+    # Au-dessus de 0.3, le cache de réponses n'intervient pas : chaque tour sollicite le serveur
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--base-url", help="serveur compatible OpenAI existant (sinon faux serveur local)")
+    parser.add_argument("--api-key", default=os.environ.get("SCALEWAY_API_KEY", "test"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="fichier JSON du rapport (sortie standard sinon)")
+    add_arguments(parser.add_argument_group("faux serveur LLM"))
+    args = parser.parse_args()
+
+    engine = load_engine()
+    from docqa.admission import AdmissionController
+    from docqa.llm import AsyncLLMTransport
+
+    stub = None
+    if args.base_url is None:
+        stub = serve(config_from_args(args))
+        args.base_url = base_url(stub)
+    # Même file d'attente que l'interface (limites réglables par les variables ADMISSION_*)
+    scheduler = AdmissionController(AsyncLLMTransport(args.base_url, args.api_key))
+
+    # Les corpus sont générés avant la mesure ; chaque session les lit au moment de l'envoi
+    document_paths = [session_documents(args, number) for number in range(args.sessions)]
+    gc.collect()
+    rss_before = current_rss_mb()
+
+    start_event = threading.Event()
+    sessions = [LoadSession(number, engine, scheduler, document_paths[number], args)
+                for number in range(args.sessions)]
+    threads = []
+    for session in sessions:
+        # Démarrage progressif des sessions réparti sur --ramp-up secondes
+        delay = args.ramp_up * session.number / len(sessions)
+        thread = threading.Thread(target=session.run, args=(start_event, delay), name=f"session-{session.number}")
+        thread.start()
+        threads.append(thread)
+    started = time.perf_counter()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    # Les sessions restent référencées (comme dans st.session_state) pendant la mesure
+    gc.collect()
+    rss_after = current_rss_mb()
+    report = build_report(sessions, wall_seconds, rss_before, rss_after,
+                          stub.stats.snapshot() if stub else None, args)
+    for session in sessions:
+        engine.get_session_store().clear_session(session.session_id)
+    if stub:
+        stub.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    print_summary(report["summary"])
+    sys.exit(1 if report["summary"]["failed_turns"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Benchmarks reproductibles des chemins critiques d'ingestion et de recherche (paquet docqa)
+
+Mesure, pour chaque fonction et chaque taille de corpus, les latences p50/p95, le débit
+(Mo/s) et le pic de mémoire résidente, puis écrit les résultats en JSON pour comparer
+deux exécutions :
+
+    python benchmarks/run_benchmarks.py --sizes 1,10,100 --output resultats.json
+    python benchmarks/run_benchmarks.py --baseline resultats.json --output nouveaux.json
+
+Le moteur est importé sans Streamlit : aucune commande de l'interface (configuration de
+la page, vérification des identifiants) n'est exécutée.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from corpus import QUESTIONS, corpus_file
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "assistant-ia-benchmarks")
+FORMATS = ("txt", "docx", "pdf")
+STREAM_PIECE_CHARS = 4096  # taille des fragments passés à iter_chunk_spans
+
+
+def load_engine():
+    """Importe le moteur docqa (sans Streamlit) depuis la racine du dépôt"""
+    # Les extracteurs signalent leurs messages dans le journal : seules les erreurs sont affichées
+    logging.getLogger("docqa").setLevel(logging.ERROR)
+    sys.path.insert(0, REPO_ROOT)
+    import docqa
+    return docqa
+
+
+def reset_peak_rss():
+    """Réinitialise le pic de RSS du processus (Linux), sans effet ailleurs"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss est en kilo-octets sous Linux et en octets sous macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(run, repeat, max_seconds):
+    """Exécute `run` au plus `repeat` fois (au moins une) dans la limite de `max_seconds`"""
+    reset_peak_rss()
+    samples = []
+    budget_started = time.perf_counter()
+    while len(samples) < repeat:
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+        if time.perf_counter() - budget_started > max_seconds:
+            break
+    return {
+        "runs": len(samples),
+        "p50_s": percentile(samples, 0.5),
+        "p95_s": percentile(samples, 0.95),
+        "mean_s": statistics.fmean(samples),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def result(benchmark, source, input_bytes, stats, **extra):
+    return {
+        "benchmark": benchmark,
+        "source": source,
+        "input_bytes": input_bytes,
+        **stats,
+        "throughput_mb_s": input_bytes / stats["p50_s"] / 1e6 if stats["p50_s"] else None,
+        **extra,
+    }
+
+
+def extract(engine, file_format, data):
+    if file_format == "pdf":
+        return engine.extract_text_from_pdf(data)
+    if file_format == "docx":
+        return engine.extract_text_from_docx(data)
+    return engine.extract_text_from_txt(io.BytesIO(data))
+
+
+def bench_file(engine, path, file_format, args):
+    """Extraction du fichier, puis découpage et recherche sur le texte obtenu"""
+    source = os.path.basename(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    results = []
+
+    stats = measure(lambda: extract(engine, file_format, data), args.repeat, args.max_seconds)
+    text = extract(engine, file_format, data)
+    text_bytes = len(text.encode("utf-8"))
+    results.append(result(f"extract_text_from_{file_format}", source, len(data), stats, text_bytes=text_bytes,
+                          text_mb_s=text_bytes / stats["p50_s"] / 1e6 if stats["p50_s"] else None))
+    if file_format != "txt":
+        # Le découpage et la recherche ne dépendent que du texte : mesurés une fois sur le TXT
+        return results
+
+    stats = measure(lambda: engine.get_chunks(text), args.repeat, args.max_seconds)
+    results.append(result("get_chunks", source, text_bytes, stats))
+
+    stats = measure(lambda: engine.chunk_offsets(text, source), args.repeat, args.max_seconds)
+    results.append(result("chunk_offsets", source, text_bytes, stats))
+
+    # Même texte livré par fragments de la taille d'une page, comme le produisent les extracteurs
+    pieces = [text[i:i + STREAM_PIECE_CHARS] for i in range(0, len(text), STREAM_PIECE_CHARS)]
+    stats = measure(lambda: deque(engine.iter_chunk_spans(pieces, source), maxlen=0), args.repeat, args.max_seconds)
+    results.append(result("iter_chunk_spans", source, text_bytes, stats))
+
+    stats = measure(lambda: engine.build_document_index(text), args.repeat, args.max_seconds)
+    results.append(result("build_document_index", source, text_bytes, stats))
+
+    store = engine.DocumentStore()
+    store.add(source, text)
+    for ranker in args.rankers:
+        questions = iter(QUESTIONS * args.repeat)
+        stats = measure(lambda: engine.create_context_for_question(next(questions), store, ranker=ranker),
+                        args.repeat * len(QUESTIONS), args.max_seconds)
+        results.append(result("create_context_for_question", source, text_bytes, stats, ranker=ranker))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Affiche l'évolution des p50 par rapport à une exécution précédente ; renvoie le nombre de régressions"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["benchmark"], r["source"], r.get("ranker")): r for r in json.load(f)["results"]}
+    regressions = 0
+    for r in results:
+        previous = baseline.get((r["benchmark"], r["source"], r.get("ranker")))
+        if previous is None:
+            continue
+        ratio = r["p50_s"] / previous["p50_s"] if previous["p50_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  ⚠ régression"
+            regressions += 1
+        label = r["benchmark"] + (f"[{r['ranker']}]" if r.get("ranker") else "")
+        print(f"{label:45} {r['source']:32} {previous['p50_s']:9.4f}s -> {r['p50_s']:9.4f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,100", help="tailles des corpus synthétiques en Mo")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="formats à mesurer parmi txt,docx,pdf")
+    parser.add_argument("--fixtures", help="répertoire de documents réels (.pdf, .docx, .txt) à mesurer en plus")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="répertoire des corpus générés")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="nombre d'exécutions par mesure")
+    parser.add_argument("--max-seconds", type=float, default=60.0,
+                        help="durée maximale d'une mesure (au moins une exécution)")
+    parser.add_argument("--rankers", default="bm25,heuristique", help="méthodes de classement à mesurer")
+    parser.add_argument("--output", help="fichier JSON des résultats (sortie standard sinon)")
+    parser.add_argument("--baseline", help="résultats JSON d'une exécution précédente à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="ralentissement toléré avant de signaler")
+    args = parser.parse_args()
+    args.rankers = [ranker for ranker in args.rankers.split(",") if ranker]
+
+    engine = load_engine()
+    cases = []
+    for size in (float(s) if "." in s else int(s) for s in args.sizes.split(",") if s):
+        for file_format in args.formats.split(","):
+            cases.append((corpus_file(args.corpus_dir, file_format, size, args.seed), file_format))
+    if args.fixtures:
+        for name in sorted(os.listdir(args.fixtures)):
+            file_format = os.path.splitext(name)[1].lower().lstrip(".")
+            if file_format in FORMATS:
+                cases.append((os.path.join(args.fixtures, name), file_format))
+
+    results = []
+    for path, file_format in cases:
+        print(f"… {os.path.basename(path)}", file=sys.stderr)
+        results.extend(bench_file(engine, path, file_format, args))
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Faux serveur compatible OpenAI (chat.completions en streaming) pour les tests de charge
+
+Les tokens sont émis à un débit et après une latence configurables, et des erreurs peuvent
+être injectées (429, 500, coupure en cours de flux) pour éprouver les nouvelles tentatives
+du transport. Il peut aussi servir l'interface Streamlit :
+
+    python benchmarks/stub_llm.py --port 8080 --tokens-per-second 40 --error-rate 0.05
+    SCALEWAY_API_BASE_URL=http://127.0.0.1:8080/v1 SCALEWAY_API_KEY=test streamlit run app-2.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("le contrat prévoit un préavis de trois mois et des pénalités de retard calculées sur le montant "
+         "mensuel de la prestation conformément aux conditions générales").split()
+
+
+class StubConfig:
+    """Comportement du faux serveur : cadence des tokens, latence et erreurs injectées"""
+
+    def __init__(self, tokens_per_second=50.0, first_token_latency=0.3, latency_jitter=0.1, response_tokens=200,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=0.5, midstream_error_rate=0.0, seed=0):
+        self.tokens_per_second = tokens_per_second  # débit d'émission des tokens (0 : sans attente)
+        self.first_token_latency = first_token_latency  # secondes avant le premier token
+        self.latency_jitter = latency_jitter  # variation aléatoire (±) de la latence du premier token
+        self.response_tokens = response_tokens  # longueur des réponses, bornée par max_tokens
+        self.error_rate = error_rate  # proportion de requêtes refusées en 500
+        self.rate_limit_rate = rate_limit_rate  # proportion de requêtes refusées en 429 (avec Retry-After)
+        self.retry_after = retry_after
+        self.midstream_error_rate = midstream_error_rate  # proportion de flux interrompus à mi-réponse
+        self.seed = seed
+
+
+class StubStats:
+    """Compteurs du serveur, lus par le pilote de charge pour son rapport"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "completed": 0, "errors_500": 0, "errors_429": 0, "interrupted": 0,
+                       "tokens": 0}
+        self.active = 0
+        self.max_active = 0
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+    def enter(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.counts, "max_concurrent_streams": self.max_active}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, data):
+        payload = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        server = self.server
+        config, stats = server.config, server.stats
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        stats.add("requests")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        with server.rng_lock:
+            draw = server.rng.random()
+            interrupted = server.rng.random() < config.midstream_error_rate
+            latency = max(0.0, config.first_token_latency + server.rng.uniform(-1, 1) * config.latency_jitter)
+        if draw < config.rate_limit_rate:
+            stats.add("errors_429")
+            self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                            headers=[("Retry-After", str(config.retry_after))])
+            return
+        if draw < config.rate_limit_rate + config.error_rate:
+            stats.add("errors_500")
+            self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+
+        tokens = min(config.response_tokens, request.get("max_tokens") or config.response_tokens)
+        model = request.get("model", "stub")
+        if not request.get("stream"):
+            time.sleep(latency + (tokens / config.tokens_per_second if config.tokens_per_second else 0))
+            stats.add("completed")
+            stats.add("tokens", tokens)
+            content = " ".join(WORDS[i % len(WORDS)] for i in range(tokens))
+            self._send_json(200, {"id": "stub", "object": "chat.completion", "created": int(time.time()),
+                                  "model": model, "choices": [{"index": 0, "finish_reason": "stop",
+                                  "message": {"role": "assistant", "content": content}}]})
+            return
+
+        stats.enter()
+        try:
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            interval = 1 / config.tokens_per_second if config.tokens_per_second else 0
+            started = time.perf_counter()
+            for i in range(tokens):
+                if interrupted and i == tokens // 2:
+                    # Coupure brutale : le client reçoit un flux incomplet
+                    stats.add("interrupted")
+                    self.close_connection = True
+                    return
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)] + " "},
+                                      "finish_reason": None}]}
+                self._send_event(json.dumps(chunk, ensure_ascii=False))
+                stats.add("tokens")
+                # Cadence calée sur l'horloge pour ne pas accumuler les retards de sleep
+                delay = started + (i + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self._send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            stats.add("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            stats.leave()
+
+
+def serve(config=None, host="127.0.0.1", port=0):
+    """Démarre le serveur dans un thread et le renvoie (port choisi par le système si 0)"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    server.stats = StubStats()
+    server.rng = random.Random(server.config.seed)
+    server.rng_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def add_arguments(parser):
+    """Options de configuration du faux serveur, partagées avec le pilote de charge"""
+    defaults = StubConfig()
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--first-token-latency", type=float, default=defaults.first_token_latency)
+    parser.add_argument("--latency-jitter", type=float, default=defaults.latency_jitter)
+    parser.add_argument("--response-tokens", type=int, default=defaults.response_tokens)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="proportion de 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="proportion de 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--midstream-error-rate", type=float, default=defaults.midstream_error_rate,
+                        help="proportion de flux coupés en cours de réponse")
+
+
+def config_from_args(args):
+    return StubConfig(tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency,
+                      latency_jitter=args.latency_jitter, response_tokens=args.response_tokens,
+                      error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                      retry_after=args.retry_after, midstream_error_rate=args.midstream_error_rate,
+                      seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = serve(config_from_args(args), args.host, args.port)
+    print(f"Faux serveur LLM sur {base_url(server)} (Ctrl+C pour arrêter)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.stats.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
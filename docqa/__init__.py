@@ -0,0 +1,30 @@
+"""Moteur de questions-réponses sur documents : extraction, découpage, recherche et prompts
+
+Utilisable sans Streamlit (voir `python -m docqa --help`) ; les parseurs de documents et
+le client de l'API ne sont importés qu'au premier usage.
+"""
+from .admission import AdmissionController, AdmissionRejected
+from .cache import ExtractionCache, extraction_cache_key, get_extraction_cache
+from .chunking import chunk_offsets, get_chunks, iter_chunk_spans
+from .extraction import extract_and_index, extract_text_from_docx, extract_text_from_pdf, extract_text_from_txt
+from .indexing import build_document_index, tokenize
+from .ingestion import IngestionQueue, get_ingestion_queue, ingest_files, process_file
+from .metrics import get_metrics
+from .notices import notify, set_notice_handler
+from .prompting import build_chat_messages, build_prompt_messages, estimate_tokens, new_history_summary
+from .retrieval import DEFAULT_RANKER, RANKERS, DocumentStore, create_context_for_question
+from .sessions import ConversationLog, SessionDocumentStore, SessionStore, get_session_store
+
+__all__ = [
+    "AdmissionController", "AdmissionRejected",
+    "ExtractionCache", "extraction_cache_key", "get_extraction_cache",
+    "chunk_offsets", "get_chunks", "iter_chunk_spans",
+    "extract_and_index", "extract_text_from_docx", "extract_text_from_pdf", "extract_text_from_txt",
+    "build_document_index", "tokenize",
+    "IngestionQueue", "get_ingestion_queue", "ingest_files", "process_file",
+    "get_metrics",
+    "notify", "set_notice_handler",
+    "build_chat_messages", "build_prompt_messages", "estimate_tokens", "new_history_summary",
+    "DEFAULT_RANKER", "RANKERS", "DocumentStore", "create_context_for_question",
+    "ConversationLog", "SessionDocumentStore", "SessionStore", "get_session_store",
+]
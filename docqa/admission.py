@@ -0,0 +1,224 @@
+"""Contrôle d'admission des appels au modèle, partagé par toutes les sessions du processus
+
+Les générations sont limitées en nombre simultané et en tokens par minute (seau à jetons) ;
+les demandes excédentaires attendent dans une file équitable (tour de rôle entre sessions)
+et les demandes démesurées sont refusées avant tout appel à l'API.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from .llm import MAX_TOKENS, MODEL_CONTEXT_TOKENS
+from .metrics import get_metrics
+from .prompting import estimate_tokens
+
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 8))  # générations simultanées
+ADMISSION_TOKENS_PER_MINUTE = int(os.environ.get("ADMISSION_TOKENS_PER_MINUTE", 200_000))  # 0 : sans limite
+# Demandes refusées d'emblée : max_tokens au-delà du maximum du modèle, prompt + réponse au-delà
+# de sa fenêtre de contexte ou du budget de tokens par minute (elles ne pourraient jamais aboutir)
+ADMISSION_MAX_COMPLETION_TOKENS = int(os.environ.get("ADMISSION_MAX_COMPLETION_TOKENS", MAX_TOKENS))
+ADMISSION_MAX_REQUEST_TOKENS = int(os.environ.get("ADMISSION_MAX_REQUEST_TOKENS", MODEL_CONTEXT_TOKENS))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", 64))  # demandes en attente au maximum
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 120))  # secondes d'attente maximum
+ADMISSION_POLL_INTERVAL = 0.25  # secondes entre deux rappels de la position dans la file
+
+class AdmissionRejected(Exception):
+    """Demande refusée sans appel au modèle (trop grande, file saturée ou attente trop longue)"""
+
+def request_cost(request):
+    """Tokens réservés pour une demande : prompt estimé plus longueur maximale de la réponse"""
+    # Pas de message_tokens : il mémoriserait l'estimation dans les messages envoyés à l'API
+    return sum(estimate_tokens(message["content"]) + 4 for message in request["messages"]) + request["max_tokens"]
+
+class AdmissionTicket:
+    """Place d'une demande dans la file, puis réservation pendant la génération"""
+
+    def __init__(self, session_id, cost):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.cost = cost
+        self.enqueued_at = time.perf_counter()
+        self.admitted_at = None
+        self.released = False
+
+class AdmissionController:
+    """Ordonnanceur des générations : plafond de simultanéité, budget de tokens par minute, file équitable"""
+
+    def __init__(self, transport, max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+                 tokens_per_minute=ADMISSION_TOKENS_PER_MINUTE,
+                 max_completion_tokens=ADMISSION_MAX_COMPLETION_TOKENS,
+                 max_request_tokens=ADMISSION_MAX_REQUEST_TOKENS, max_queue=ADMISSION_MAX_QUEUE):
+        self.transport = transport
+        self.max_in_flight = max_in_flight
+        self.tokens_per_minute = tokens_per_minute
+        self.max_completion_tokens = max_completion_tokens
+        self.max_request_tokens = max_request_tokens
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._tokens = float(tokens_per_minute)  # seau plein au démarrage
+        self._refilled_at = time.monotonic()
+        self._queues = OrderedDict()  # {session: deque de tickets}, dans l'ordre du tour de rôle
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60)
+        self._refilled_at = now
+
+    def _schedule(self):
+        """Tickets en attente dans l'ordre de service : un par session et par tour"""
+        queues = list(self._queues.values())
+        order = []
+        for depth in range(max(map(len, queues), default=0)):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+        return order
+
+    def _next_ticket(self):
+        return next(iter(self._queues.values()))[0] if self._queues else None
+
+    def _try_admit(self, ticket):
+        """Admet `ticket` s'il est le prochain servi et que la simultanéité et le budget le permettent"""
+        if self._next_ticket() is not ticket or self.in_flight >= self.max_in_flight:
+            return False
+        self._refill()
+        if self.tokens_per_minute and self._tokens < ticket.cost:
+            return False
+        self._tokens -= ticket.cost if self.tokens_per_minute else 0
+        self.in_flight += 1
+        self._dequeue(ticket)
+        # La session servie passe en fin de tour pour laisser la main aux autres
+        if ticket.session_id in self._queues:
+            self._queues.move_to_end(ticket.session_id)
+        ticket.admitted_at = time.perf_counter()
+        self._condition.notify_all()
+        return True
+
+    def _dequeue(self, ticket):
+        queue = self._queues.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.session_id]
+
+    def queue_length(self):
+        with self._condition:
+            return sum(map(len, self._queues.values()))
+
+    def _position(self, ticket):
+        order = self._schedule()
+        return order.index(ticket) + 1 if ticket in order else None
+
+    def position(self, ticket):
+        """Rang (à partir de 1) de `ticket` dans la file, None s'il n'y est plus"""
+        with self._condition:
+            return self._position(ticket)
+
+    def check(self, request):
+        """Refuse les demandes qui ne pourront jamais être servies ; renvoie leur coût en tokens
+
+        Le coût (prompt estimé + max_tokens) est comparé à la fenêtre de contexte du modèle
+        et au budget de tokens par minute ; la charge en attente est vérifiée par acquire.
+        """
+        if request["max_tokens"] > self.max_completion_tokens:
+            raise AdmissionRejected(f"Longueur de réponse demandée trop grande ({request['max_tokens']} tokens, "
+                                    f"maximum {self.max_completion_tokens})")
+        cost = request_cost(request)
+        if cost > self.max_request_tokens:
+            raise AdmissionRejected(f"Demande trop volumineuse pour le modèle (~{cost} tokens prompt et réponse "
+                                    f"compris, maximum {self.max_request_tokens})")
+        if self.tokens_per_minute and cost > self.tokens_per_minute:
+            raise AdmissionRejected(f"Demande trop volumineuse (~{cost} tokens, budget de "
+                                    f"{self.tokens_per_minute} tokens par minute)")
+        return cost
+
+    def acquire(self, session_id, request, on_wait=None, timeout=ADMISSION_QUEUE_TIMEOUT):
+        """Attend son tour puis réserve une place et des tokens ; `on_wait(position, secondes)` est appelé en attente"""
+        ticket = AdmissionTicket(session_id, self.check(request))
+        with self._condition:
+            if self.max_queue and sum(map(len, self._queues.values())) >= self.max_queue:
+                raise AdmissionRejected("File d'attente du modèle saturée, réessayez dans un instant")
+            if self.tokens_per_minute:
+                # Travail déjà en file : refus immédiat si le budget ne peut le servir avant le délai d'attente
+                self._refill()
+                pending = sum(queued.cost for queue in self._queues.values() for queued in queue) + ticket.cost
+                available = self._tokens + self.tokens_per_minute * timeout / 60
+                if pending > available:
+                    raise AdmissionRejected(f"File d'attente du modèle trop chargée (~{pending} tokens en attente, "
+                                            f"~{available:.0f} servis en {timeout:.0f} s), réessayez dans un instant")
+            self._queues.setdefault(session_id, deque()).append(ticket)
+        try:
+            while True:
+                with self._condition:
+                    if self._try_admit(ticket):
+                        break
+                    waited = time.perf_counter() - ticket.enqueued_at
+                    if waited > timeout:
+                        raise AdmissionRejected(f"Attente trop longue dans la file du modèle ({waited:.0f} s)")
+                    self._condition.wait(ADMISSION_POLL_INTERVAL)
+                    position = self._position(ticket)
+                # Rappel hors du verrou : l'interface peut être interrompue pendant l'affichage
+                if on_wait is not None and position is not None:
+                    on_wait(position, time.perf_counter() - ticket.enqueued_at)
+        except BaseException:
+            with self._condition:
+                self._dequeue(ticket)
+                self._condition.notify_all()
+            raise
+        get_metrics().observe("admission", ticket.admitted_at - ticket.enqueued_at, tokens=ticket.cost)
+        return ticket
+
+    def release(self, ticket, used_tokens=None):
+        """Libère la place ; la part non consommée de la réservation est rendue au budget"""
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            if self.tokens_per_minute and used_tokens is not None:
+                self._refill()
+                self._tokens = min(self.tokens_per_minute, self._tokens + max(ticket.cost - used_tokens, 0))
+            self._condition.notify_all()
+
+    def stream_chat(self, session_id, on_wait=None, **request):
+        """Comme `transport.stream_chat`, après admission ; la place est libérée à la fin du flux"""
+        ticket = self.acquire(session_id, request, on_wait)
+        try:
+            generation = self.transport.stream_chat(**request)
+        except BaseException:
+            self.release(ticket)
+            raise
+        return AdmittedGeneration(self, ticket, generation, request)
+
+class AdmittedGeneration:
+    """Génération admise : itère les deltas du transport et rend sa place à la fin ou à l'annulation"""
+
+    def __init__(self, controller, ticket, generation, request):
+        self.controller = controller
+        self.ticket = ticket
+        self.generation = generation
+        self._prompt_tokens = ticket.cost - request["max_tokens"]
+        self._chars = 0
+
+    def __iter__(self):
+        try:
+            for delta in self.generation:
+                self._chars += len(delta)
+                yield delta
+        finally:
+            self._release()
+
+    def _release(self):
+        # Même estimation que estimate_tokens : ~4 caractères par token
+        self.controller.release(self.ticket, self._prompt_tokens + self._chars // 4)
+
+    def cancel(self):
+        self.generation.cancel()
+        self._release()
+
+    @property
+    def done(self):
+        return self.generation.done
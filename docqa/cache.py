@@ -0,0 +1,169 @@
+"""Cache SQLite persistant des extractions, adressé par le contenu des fichiers"""
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import stat
+import time
+import zlib
+from array import array
+from contextlib import closing
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .metrics import get_metrics
+
+# Répertoire des caches et du stockage des sessions : privé à l'utilisateur du serveur (mode 0700)
+CACHE_DIR = os.environ.get(
+    "ASSISTANT_CACHE_DIR",
+    os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "assistant-ia")
+)
+# Cache d'extraction persistant, partagé entre les workers et les redémarrages
+EXTRACTION_CACHE_PATH = os.environ.get("EXTRACTION_CACHE_PATH", os.path.join(CACHE_DIR, "extractions.sqlite3"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# À incrémenter lorsque l'extraction, le découpage ou le format de l'index changent
+EXTRACTION_CACHE_VERSION = 8
+
+def private_directory(path):
+    """Crée `path` (mode 0700) si besoin et vérifie qu'aucun autre utilisateur ne peut y écrire
+
+    Refuse un répertoire préparé par un tiers (ex. dans un /tmp partagé) : son contenu
+    pourrait avoir été forgé.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{path} n'est pas un répertoire")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"{path} appartient à un autre utilisateur")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} est accessible en écriture à d'autres utilisateurs")
+    return path
+
+def _write_block(buffer, block):
+    buffer.write(len(block).to_bytes(8, "little"))
+    buffer.write(block)
+
+def _read_block(buffer):
+    return buffer.read(int.from_bytes(buffer.read(8), "little"))
+
+def dump_extraction(value, level=6):
+    """Sérialise {"text", "index"} sans pickle : en-tête JSON, texte UTF-8 et tableaux .npy, compressés
+
+    Les postings sont aplatis (termes dans l'en-tête, identifiants et fréquences concaténés).
+    """
+    index = value["index"]
+    terms = list(index["postings"])
+    postings = [index["postings"][term] for term in terms]
+    header = {"terms": terms, "embeddings_key": index.get("embeddings_key")}
+    buffer = io.BytesIO()
+    _write_block(buffer, json.dumps(header, ensure_ascii=False).encode("utf-8"))
+    _write_block(buffer, value["text"].encode("utf-8", "surrogatepass"))
+    arrays = [
+        np.frombuffer(index["starts"], dtype=np.uint32), np.frombuffer(index["ends"], dtype=np.uint32),
+        np.asarray(index["chunk_lengths"], dtype=np.float32),
+        np.array([len(chunk_ids) for chunk_ids, _ in postings], dtype=np.int64),
+        np.concatenate([chunk_ids for chunk_ids, _ in postings]) if postings else np.zeros(0, dtype=np.int32),
+        np.concatenate([frequencies for _, frequencies in postings]) if postings else np.zeros(0, dtype=np.float32),
+    ]
+    for values in arrays:
+        np.save(buffer, values, allow_pickle=False)
+    return zlib.compress(buffer.getbuffer(), level)
+
+def load_extraction(payload):
+    """Inverse de dump_extraction ; aucun objet Python arbitraire n'est désérialisé"""
+    buffer = io.BytesIO(zlib.decompress(payload))
+    header = json.loads(_read_block(buffer))
+    text = _read_block(buffer).decode("utf-8", "surrogatepass")
+    starts, ends, chunk_lengths, counts, chunk_ids, frequencies = (
+        np.load(buffer, allow_pickle=False) for _ in range(6))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    index = {
+        "starts": array('I', starts.tobytes()), "ends": array('I', ends.tobytes()),
+        "chunk_lengths": chunk_lengths,
+        "postings": {term: (chunk_ids[offsets[i]:offsets[i + 1]], frequencies[offsets[i]:offsets[i + 1]])
+                     for i, term in enumerate(header["terms"])},
+    }
+    if header["embeddings_key"] is not None:
+        index["embeddings_key"] = header["embeddings_key"]
+    return {"text": text, "index": index}
+
+def content_digest(file_content, block_size=1 << 20):
+    """Calcule le SHA-256 du contenu par blocs, sur une vue mémoire (sans copie)"""
+    digest = hashlib.sha256()
+    view = memoryview(file_content)
+    for offset in range(0, len(view), block_size):
+        digest.update(view[offset:offset + block_size])
+    return digest.hexdigest()
+
+def extraction_cache_key(file_content, file_name):
+    """Clé adressée par le contenu : empreinte, format du fichier et version du pipeline"""
+    file_extension = Path(file_name).suffix.lower()
+    return f"{content_digest(file_content)}{file_extension}:v{EXTRACTION_CACHE_VERSION}"
+
+class ExtractionCache:
+    """Stockage SQLite compressé des extractions (texte, chunks, index) avec éviction LRU par taille
+
+    Une connexion est ouverte par opération : l'objet est sérialisable et utilisable
+    depuis plusieurs threads ou processus sur le même fichier.
+    """
+    
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    def _connect(self):
+        if os.path.dirname(self.path):
+            private_directory(os.path.dirname(self.path))
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        return conn
+    
+    def get(self, key):
+        """Renvoie l'entrée mise en cache pour `key`, ou None"""
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT payload FROM extractions WHERE key = ?", (key,)).fetchone()
+                get_metrics().cache_result("extraction", row is not None)
+                if row is None:
+                    return None
+                conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key))
+            return load_extraction(row[0])
+        except Exception:
+            # Un cache illisible ne doit jamais empêcher l'extraction
+            return None
+    
+    def put(self, key, value):
+        """Enregistre `value` puis évince les entrées les moins récemment utilisées au-delà de max_bytes"""
+        payload = dump_extraction(value)
+        if len(payload) > self.max_bytes:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extractions (key, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload), time.time())
+                )
+                total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+                if total_size > self.max_bytes:
+                    evicted = []
+                    for old_key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_access"):
+                        if total_size <= self.max_bytes:
+                            break
+                        evicted.append((old_key,))
+                        total_size -= size
+                    conn.executemany("DELETE FROM extractions WHERE key = ?", evicted)
+        except Exception:
+            pass  # Le cache est facultatif
+
+@lru_cache(maxsize=None)
+def get_extraction_cache():
+    """Cache d'extraction persistant partagé par toutes les sessions"""
+    return ExtractionCache(EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_BYTES)
@@ -0,0 +1,127 @@
+"""Découpage des textes en chunks (offsets) respectant paragraphes, titres et tableaux"""
+import re
+
+def get_chunks(text, chunk_size=3000, overlap=200):
+    """Divise le texte en chunks pour gérer les documents longs"""
+    chunks = []
+    if not text:
+        return chunks
+        
+    # Chunking amélioré avec détection de phrases
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text) and end - start == chunk_size:
+            # Chercher la fin de phrase/paragraphe la plus proche pour une coupure propre
+            # Recherche plus sophistiquée avec pattern de fin de phrase
+            sentence_end_pattern = re.compile(r'[.!?]\s+')
+            matches = list(sentence_end_pattern.finditer(text[end-200:end]))
+            if matches:
+                # Utilise la dernière correspondance trouvée
+                last_match = matches[-1]
+                end = end - 200 + last_match.end()
+            else:
+                # Cherche une fin de ligne si pas de fin de phrase
+                newline_matches = list(re.finditer(r'\n', text[end-200:end]))
+                if newline_matches:
+                    last_newline = newline_matches[-1]
+                    end = end - 200 + last_newline.end()
+                    
+        chunks.append(text[start:end])
+        start = end - overlap if end < len(text) else end
+    
+    return chunks
+
+# Motifs de découpage, compilés une seule fois et appliqués sur des fenêtres (pos/endpos) sans copie
+SENTENCE_END_PATTERN = re.compile(r'[.!?]\s+')
+HEADING_PATTERN = re.compile(
+    r"[ \t]*(?:(?:ARTICLE|Article|CHAPITRE|Chapitre|TITRE|Titre|SECTION|Section|ANNEXE|Annexe)\b"
+    r"|\d+(?:\.\d+)*[.)]?[ \t]+[A-ZÀ-Ý]"
+    r"|[A-ZÀ-Ý][A-ZÀ-Ý0-9 '’-]{3,}(?:\n|$))"
+)
+def _line_start(text, pos, floor):
+    """Début de la ligne contenant `pos` (sans remonter avant `floor`)"""
+    return text.rfind('\n', floor, pos) + 1 or floor
+
+def _is_table_line(text, line_start):
+    """Vrai si la ligne commençant à `line_start` contient au moins deux séparateurs de colonnes (| ou tabulation)"""
+    line_end = text.find('\n', line_start)
+    if line_end < 0:
+        line_end = len(text)
+    return text.count('|', line_start, line_end) + text.count('\t', line_start, line_end) >= 2
+
+def _inside_table(text, floor, pos):
+    """Vrai si `pos` tombe à l'intérieur d'un bloc de lignes tabulaires"""
+    line_start = _line_start(text, pos, floor)
+    if not _is_table_line(text, line_start):
+        return False
+    if pos != line_start:
+        return True
+    # Début de ligne : on est dans le tableau si la ligne précédente en fait aussi partie
+    return line_start > floor and _is_table_line(text, _line_start(text, line_start - 1, floor))
+
+def _is_section_start(text, pos, floor):
+    """Vrai si la ligne commençant à `pos` suit une ligne vide ou ressemble à un titre"""
+    if HEADING_PATTERN.match(text, pos):
+        return True
+    before = pos - 2
+    while before >= floor and text[before] in ' \t':
+        before -= 1
+    return before >= floor and text[before] == '\n'
+
+def _find_cut(text, start, end, window, overlap):
+    """Choisit la fin d'un chunk dans les `window` caractères précédant `end`
+
+    Préférence : début de section (paragraphe, titre), puis fin de phrase, puis fin de ligne,
+    en évitant de couper à l'intérieur d'un tableau.
+    """
+    low = max(end - window, start + overlap + 1)
+    
+    # Parcours des débuts de ligne de la fenêtre, du plus proche de `end` au plus lointain
+    line_cut = None
+    search_end = end
+    while True:
+        newline = text.rfind('\n', low - 1, search_end)
+        if newline < 0:
+            break
+        line_start = newline + 1
+        if _is_section_start(text, line_start, start):
+            if not _inside_table(text, start, line_start):
+                return line_start
+        elif line_cut is None and not _inside_table(text, start, line_start):
+            line_cut = line_start
+        search_end = newline
+    
+    # Dernière fin de phrase de la fenêtre (hors tableau, vérifié seulement pour les candidats retenus)
+    sentence_ends = [match.end() for match in SENTENCE_END_PATTERN.finditer(text, low, end)]
+    for sentence_cut in reversed(sentence_ends):
+        if not _inside_table(text, start, sentence_cut):
+            return sentence_cut
+    return line_cut if line_cut is not None else end
+
+def iter_chunk_spans(pieces, doc=None, chunk_size=3000, overlap=200, window=200):
+    """Découpe un flux de fragments de texte en un seul passage, au fur et à mesure
+
+    Produit ((doc, début, fin), buffer, base) : les offsets sont absolus dans le document et
+    le chunk se lit dans `buffer` entre début - base et fin - base (valable jusqu'à l'élément
+    suivant). Aucun chunk n'est copié ; seule la partie non encore découpée est conservée.
+    """
+    buffer = ""
+    base = 0
+    start = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer = buffer[start - base:] + piece
+        base = start
+        # Un chunk n'est coupé que lorsque la suite du texte est connue
+        while base + len(buffer) - start > chunk_size:
+            end = base + _find_cut(buffer, start - base, start - base + chunk_size, window, overlap)
+            yield (doc, start, end), buffer, base
+            start = end - overlap
+    if start < base + len(buffer):
+        yield (doc, start, base + len(buffer)), buffer, base
+
+def chunk_offsets(text, doc=None, chunk_size=3000, overlap=200, window=200):
+    """Découpe `text` en enregistrements (doc, début, fin) respectant paragraphes, titres et tableaux"""
+    return [record for record, _, _ in iter_chunk_spans([text], doc, chunk_size, overlap, window)]
@@ -0,0 +1,171 @@
+"""Interface en ligne de commande pour traiter des documents et des questions par lots
+
+    python -m docqa ingest rapport.pdf contrat.docx
+    python -m docqa ask contrat.docx -q "Quel est le préavis ?" --questions questions.txt
+    python -m docqa ask contrat.docx -q "Quel est le préavis ?" --context-only
+
+Les résultats sont écrits en JSON Lines sur la sortie standard, les messages sur la sortie d'erreur.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .ingestion import ingest_files
+from .llm import MAX_TOKENS, MODEL, PRESENCE_PENALTY, STOP_SEQUENCE, TEMPERATURE, TOP_P
+from .notices import set_notice_handler
+from .prompting import build_prompt_messages, new_history_summary
+from .retrieval import CONTEXT_TOKEN_BUDGET, DEFAULT_RANKER, RANKERS, DocumentStore, create_context_for_question
+
+
+class LocalFile:
+    """Fichier local présenté comme un fichier téléversé (nom et contenu)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = Path(path).name
+
+    def getvalue(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def _print_notice(level, message):
+    print(f"[{level}] {message}", file=sys.stderr)
+
+
+def _emit(record):
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+def load_documents(paths):
+    """Ingère les fichiers en parallèle et renvoie le DocumentStore et un compte rendu par fichier"""
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        raise SystemExit(f"Fichier(s) introuvable(s) : {', '.join(missing)}")
+    files = [LocalFile(path) for path in paths]
+    results = dict(ingest_files(files))
+    store = DocumentStore()
+    reports = []
+    for position, local_file in enumerate(files):
+        result = results[position]
+        for level, message in result["notices"]:
+            _print_notice(level, f"{local_file.name}: {message}")
+        if result["text"]:
+            store.add(local_file.name, result["text"], result["index"])
+        reports.append({
+            "file": local_file.name,
+            "chars": len(result["text"]),
+            "chunks": store.document(local_file.name).chunk_count if result["text"] else 0,
+            "cached": result["cached"],
+            "error": result["error"],
+        })
+    return store, reports
+
+
+def command_ingest(args):
+    _, reports = load_documents(args.files)
+    for report in reports:
+        _emit(report)
+    return 0 if all(report["chars"] for report in reports) else 1
+
+
+def _questions(args):
+    questions = list(args.question or [])
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions.extend(line.strip() for line in f if line.strip())
+    return questions
+
+
+def command_ask(args):
+    questions = _questions(args)
+    if not questions:
+        print("Aucune question fournie (-q ou --questions).", file=sys.stderr)
+        return 2
+    store, reports = load_documents(args.files)
+    for report in reports:
+        if not report["chars"]:
+            _print_notice("warning", f"{report['file']}: aucun texte exploitable")
+
+    contexts = [create_context_for_question(question, store, max_tokens=args.max_context, ranker=args.ranker)
+                for question in questions]
+    if args.context_only:
+        for question, context in zip(questions, contexts):
+            _emit({"question": question, "context": context})
+        return 0
+
+    base_url = os.environ.get("SCALEWAY_API_BASE_URL")
+    api_key = os.environ.get("SCALEWAY_API_KEY")
+    if not base_url or not api_key:
+        print("Les variables d'environnement SCALEWAY_API_BASE_URL et SCALEWAY_API_KEY doivent être définies.",
+              file=sys.stderr)
+        return 2
+    from .llm import AsyncLLMTransport
+    from .responses import get_response_cache, response_cache_enabled, response_cache_key
+    transport = AsyncLLMTransport(base_url, api_key)
+    response_cache = get_response_cache()
+
+    def answer(question, context):
+        started = time.perf_counter()
+        request = dict(
+            model=MODEL,
+            messages=build_prompt_messages([{"role": "user", "content": question}], new_history_summary(), context),
+            max_tokens=args.max_tokens,
+            temperature=args.temperature,
+            top_p=TOP_P,
+            presence_penalty=PRESENCE_PENALTY,
+            stop=STOP_SEQUENCE,
+        )
+        cache_key = response_cache_key(request) if response_cache_enabled(request) else None
+        response = response_cache.get(cache_key) if cache_key else None
+        cached = response is not None
+        try:
+            if not cached:
+                response = "".join(transport.stream_chat(**request))
+                if cache_key and response:
+                    response_cache.put(cache_key, response)
+        except Exception as e:
+            return {"question": question, "answer": None, "error": f"{type(e).__name__}: {e}",
+                    "seconds": time.perf_counter() - started}
+        return {"question": question, "answer": response, "cached": cached,
+                "seconds": time.perf_counter() - started}
+
+    # Les réponses sont produites dans l'ordre des questions, générées en parallèle
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        failures = 0
+        for record in executor.map(answer, questions, contexts):
+            failures += record["answer"] is None
+            _emit(record)
+    return 1 if failures else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="docqa", description="Questions-réponses sur documents en ligne de commande")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="extrait et indexe des documents (cache d'extraction partagé)")
+    ingest.add_argument("files", nargs="+", help="fichiers PDF, DOCX ou TXT")
+    ingest.set_defaults(handler=command_ingest)
+
+    ask = commands.add_parser("ask", help="répond à des questions sur des documents")
+    ask.add_argument("files", nargs="+", help="fichiers PDF, DOCX ou TXT")
+    ask.add_argument("-q", "--question", action="append", help="question (option répétable)")
+    ask.add_argument("--questions", help="fichier texte contenant une question par ligne")
+    ask.add_argument("--ranker", choices=list(RANKERS), default=DEFAULT_RANKER)
+    ask.add_argument("--max-context", type=int, default=CONTEXT_TOKEN_BUDGET, help="taille maximale du contexte (tokens)")
+    ask.add_argument("--context-only", action="store_true", help="affiche le contexte sans appeler le modèle")
+    ask.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    ask.add_argument("--temperature", type=float, default=TEMPERATURE)
+    ask.add_argument("--concurrency", type=int, default=4, help="générations simultanées")
+    ask.set_defaults(handler=command_ask)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    set_notice_handler(_print_notice)
+    sys.exit(args.handler(args))
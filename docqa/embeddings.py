@@ -0,0 +1,133 @@
+"""Embeddings locaux des chunks (hors ligne) et leur stockage en matrices projetées en mémoire"""
+import hashlib
+import os
+import threading
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .cache import EXTRACTION_CACHE_PATH, private_directory
+from .indexing import tokenize
+from .notices import notify
+
+# Index vectoriel local pour la recherche sémantique, entièrement hors ligne
+EMBEDDING_DIM = 512
+# Répertoire d'un modèle sentence-transformers déjà téléchargé (facultatif, CPU uniquement)
+EMBEDDING_MODEL_PATH = os.environ.get("EMBEDDING_MODEL_PATH", "")
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(EXTRACTION_CACHE_PATH), "embeddings")
+)
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+EMBEDDING_BATCH_SIZE = 64
+
+class HashingEmbedder:
+    """Vectoriseur par hachage des termes et de leurs préfixes, sans modèle ni réseau
+
+    Les préfixes (5 caractères) rapprochent les formes d'un même mot (« résilier »,
+    « résiliation ») ; le hachage signé crc32 est stable d'un processus à l'autre.
+    """
+    
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+    
+    def _features(self, text):
+        for term in tokenize(text):
+            yield term
+            if len(term) > 5:
+                yield "~" + term[:5]
+    
+    def embed(self, texts):
+        """Matrice float32 (une ligne normalisée par texte)"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self._features(text)).items():
+                hashed = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                matrix[row, hashed % self.dim] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+class SentenceTransformerEmbedder:
+    """Petit modèle local sentence-transformers exécuté sur CPU, sans accès réseau"""
+    
+    def __init__(self, model_path):
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_path, device="cpu")
+        self.name = f"st-{Path(model_path).name}"
+    
+    def embed(self, texts):
+        return self.model.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+@lru_cache(maxsize=None)
+def get_embedder():
+    """Encodeur partagé, chargé une seule fois par processus"""
+    if EMBEDDING_MODEL_PATH:
+        try:
+            return SentenceTransformerEmbedder(EMBEDDING_MODEL_PATH)
+        except Exception as e:
+            notify("warning", f"Modèle d'embeddings indisponible ({e}), repli sur le vectoriseur par hachage")
+    return HashingEmbedder()
+
+def embed_chunks(text, starts, ends, embedder=None):
+    """Encode les chunks d'un document par lots et renvoie la matrice float32 (chunks x dimension)"""
+    embedder = embedder or get_embedder()
+    batches = [embedder.embed([text[start:end] for start, end in zip(starts[i:i + EMBEDDING_BATCH_SIZE],
+                                                                     ends[i:i + EMBEDDING_BATCH_SIZE])])
+               for i in range(0, len(starts), EMBEDDING_BATCH_SIZE)]
+    if not batches:
+        return np.zeros((0, getattr(embedder, "dim", EMBEDDING_DIM)), dtype=np.float32)
+    return np.ascontiguousarray(np.concatenate(batches), dtype=np.float32)
+
+def embedding_path(key, embedder=None):
+    """Fichier .npy des embeddings d'un contenu pour un encodeur donné"""
+    embedder = embedder or get_embedder()
+    name = hashlib.sha1(f"{key}:{embedder.name}".encode("utf-8")).hexdigest()
+    return os.path.join(EMBEDDING_CACHE_DIR, f"{name}.npy")
+
+def save_embeddings(key, matrix):
+    """Écrit la matrice de façon atomique puis évince les fichiers les plus anciens au-delà du quota"""
+    path = embedding_path(key)
+    try:
+        private_directory(EMBEDDING_CACHE_DIR)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+        prune_embedding_cache()
+    except OSError:
+        pass  # L'index vectoriel sera recalculé à la demande
+
+def load_embeddings(key):
+    """Matrice d'embeddings projetée en mémoire (np.memmap en lecture seule), ou None"""
+    path = embedding_path(key)
+    try:
+        private_directory(EMBEDDING_CACHE_DIR)
+        matrix = np.load(path, mmap_mode="r", allow_pickle=False)
+        os.utime(path)
+        return matrix
+    except (OSError, ValueError):
+        return None
+
+def prune_embedding_cache(max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+    entries = []
+    for entry in os.scandir(EMBEDDING_CACHE_DIR):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
@@ -0,0 +1,44 @@
+"""Pool de processus partagé par l'ingestion et l'extraction des PDF par pages"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+INGESTION_PROCESSES = min(4, os.cpu_count() or 1)  # workers du pool d'extraction
+INGESTION_PROGRESS_SLOTS = 64  # travaux dont l'avancement est suivi simultanément depuis les workers
+
+_worker_progress = None  # dans un worker : tableau partagé des avancements (voir get_progress_slots)
+
+def ingestion_context():
+    """Contexte multiprocessing des workers : forkserver si disponible, spawn sinon
+
+    Jamais fork : le serveur Streamlit a plusieurs threads (tornado, boucle du transport,
+    ingestions, métriques) et un enfant forké pourrait hériter d'un verrou tenu par l'un d'eux.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Le serveur de fork importe le moteur une fois : les workers démarrent sans réimporter numpy
+        context.set_forkserver_preload(["docqa.ingestion"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+@lru_cache(maxsize=None)
+def get_progress_slots():
+    """Avancements (0 à 1) écrits par les workers, un emplacement par travail en cours"""
+    return ingestion_context().RawArray('d', INGESTION_PROGRESS_SLOTS)
+
+def _init_worker(progress_slots):
+    global _worker_progress
+    _worker_progress = progress_slots
+
+def set_worker_progress(slot, fraction):
+    """Publie l'avancement d'un travail exécuté dans un worker"""
+    if _worker_progress is not None:
+        _worker_progress[slot] = fraction
+
+@lru_cache(maxsize=None)
+def get_ingestion_executor():
+    """Pool de processus partagé pour l'extraction (CPU) des documents"""
+    # Le tableau des avancements est transmis aux workers à leur création
+    return ProcessPoolExecutor(max_workers=INGESTION_PROCESSES, mp_context=ingestion_context(),
+                               initializer=_init_worker, initargs=(get_progress_slots(),))
@@ -0,0 +1,480 @@
+"""Extraction du texte des documents PDF, DOCX et TXT
+
+Les parseurs PDF (PyPDF2, pdfplumber) ne sont importés qu'au premier document PDF ; les
+DOCX sont lus directement en flux (zipfile et iterparse).
+"""
+import codecs
+import io
+import itertools
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from xml.etree import ElementTree
+
+from .executors import INGESTION_PROCESSES, get_ingestion_executor
+from .indexing import build_document_index
+from .metrics import get_metrics
+from .notices import _notices, notify, report_progress
+
+# Extraction parallèle d'un PDF : une plage de pages par worker, d'au moins ce nombre de pages
+PDF_MIN_PAGES_PER_SHARD = 16
+
+# Fin de page d'un PDF : saut de page (form feed) puis ligne vide, repéré lors du nettoyage du contexte
+PDF_PAGE_BREAK = "\f\n\n"
+
+# Au-delà de cette taille (octets), un upload est écrit une seule fois sur disque et lu via mmap
+UPLOAD_SPILL_THRESHOLD = 64 * 1024 * 1024
+
+# Espaces de noms WordprocessingML utilisés par le parcours en flux du document
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+OFFICE_DOCUMENT_REL = "/officeDocument"
+
+# Fichiers texte : encodage déterminé une fois sur un échantillon, puis décodage par blocs
+TXT_SNIFF_BYTES = 64 * 1024
+TXT_DECODE_BLOCK = 1024 * 1024
+TXT_BOMS = [(codecs.BOM_UTF32_LE, 'utf-32-le'), (codecs.BOM_UTF32_BE, 'utf-32-be'),  # avant UTF-16 (même préfixe)
+            (codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be')]
+CP1252_UNDEFINED_BYTES = frozenset(b"\x81\x8d\x8f\x90\x9d")
+
+@contextmanager
+def spill_large_upload(file_content, suffix='', threshold=UPLOAD_SPILL_THRESHOLD):
+    """Renvoie le contenu tel quel, ou le chemin d'une copie unique sur disque à partir de `threshold` octets
+
+    Le chemin peut être transmis aux workers au lieu de sérialiser tout le contenu pour chacun.
+    Un chemin (contenu déjà déversé) est renvoyé tel quel.
+    """
+    if isinstance(file_content, (str, os.PathLike)) or len(file_content) < threshold:
+        yield file_content
+        return
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_file.write(file_content)
+        temp_path = temp_file.name
+    try:
+        yield temp_path
+    finally:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass  # Ignorer les erreurs de nettoyage
+
+@contextmanager
+def open_binary_source(source):
+    """Ouvre un flux binaire sans copie : BytesIO sur le contenu en mémoire, mmap sur un fichier déversé"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as source_file, \
+                mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+    else:
+        yield io.BytesIO(source)
+
+# Fonctions pour extraire le texte de différents formats de documents
+def _open_pdf_reader(pdf_file, warn=True):
+    """Ouvre un PDF avec PyPDF2 en tentant de le décrypter si nécessaire"""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    
+    # Vérifier si le PDF est crypté et essayer de le décrypter si nécessaire
+    if pdf_reader.is_encrypted:
+        try:
+            # Essayer avec un mot de passe vide (beaucoup de PDFs sont marqués comme cryptés mais sans mot de passe)
+            pdf_reader.decrypt('')
+        except:
+            if warn:
+                notify("warning", "Le PDF semble être protégé par un mot de passe et ne peut pas être entièrement analysé.")
+    return pdf_reader
+
+def _extract_pdf_page(pdf_reader, page_num):
+    """Extrait le texte d'une page avec gestion des erreurs propre à la page"""
+    try:
+        page_text = pdf_reader.pages[page_num].extract_text()
+        if not page_text:
+            # Essayer une méthode alternative pour les PDFs problématiques
+            notify("info", f"Méthode alternative d'extraction utilisée pour la page {page_num+1}")
+        return page_text or ""
+    except Exception as page_error:
+        notify("warning", f"Impossible d'extraire le texte de la page {page_num+1}: {str(page_error)}")
+        # Continuer avec les autres pages
+        return ""
+
+def _extract_pdf_page_range(pdf_source, first_page, last_page):
+    """Extrait une plage de pages dans un worker et renvoie ([(page, texte)], messages)"""
+    _notices.messages = []
+    try:
+        with open_binary_source(pdf_source) as pdf_file:
+            pdf_reader = _open_pdf_reader(pdf_file, warn=False)
+            pages = [(page_num, _extract_pdf_page(pdf_reader, page_num))
+                     for page_num in range(first_page, last_page)]
+        return pages, _notices.messages
+    finally:
+        _notices.messages = None
+
+def _get_page_executor():
+    """Pool de processus pour l'extraction par pages, seulement depuis le processus principal"""
+    if multiprocessing.parent_process() is not None:
+        # Déjà dans un worker d'ingestion multi-fichiers : extraction séquentielle
+        return None
+    executor = get_ingestion_executor()
+    return executor if isinstance(executor, ProcessPoolExecutor) else None
+
+def _pdf_shard_count(page_count, min_shard_pages=PDF_MIN_PAGES_PER_SHARD):
+    return min(INGESTION_PROCESSES, page_count // min_shard_pages)
+
+def pdf_page_count(pdf_source):
+    """Nombre de pages d'un PDF lorsque son extraction peut être répartie entre les workers du pool
+
+    None hors du processus principal ou si le PDF est illisible (l'extraction signalera l'erreur).
+    Le nombre obtenu est transmis à iter_pdf_pages pour ne pas relire le document.
+    """
+    if _get_page_executor() is None:
+        return None
+    try:
+        with open_binary_source(pdf_source) as pdf_file:
+            return len(_open_pdf_reader(pdf_file, warn=False).pages)
+    except Exception:
+        return None
+
+def pdf_pages_are_sharded(page_count):
+    """Vrai si l'extraction d'un PDF de `page_count` pages sera répartie entre les workers du pool"""
+    return _get_page_executor() is not None and _pdf_shard_count(page_count) > 1
+
+def iter_pdf_pages(pdf_source, min_shard_pages=PDF_MIN_PAGES_PER_SHARD, page_count=None):
+    """Produit (numéro_de_page, texte) dans l'ordre des pages au fur et à mesure de l'extraction
+
+    `pdf_source` est le contenu du PDF ou le chemin de sa copie déversée (voir spill_large_upload).
+    Chaque worker relit tout le document : les pages sont donc réparties en une plage par
+    worker du pool (d'au moins `min_shard_pages` pages), et les workers lisent tous la même
+    copie sur disque. Avec un seul worker, l'extraction reste séquentielle.
+    `page_count`, s'il est déjà connu (voir pdf_page_count), évite de relire le document ici
+    lorsque les pages sont réparties.
+    """
+    executor = _get_page_executor()
+    if page_count is None or executor is None or _pdf_shard_count(page_count, min_shard_pages) <= 1:
+        with open_binary_source(pdf_source) as pdf_file:
+            pdf_reader = _open_pdf_reader(pdf_file)
+            page_count = len(pdf_reader.pages)
+            if executor is None or _pdf_shard_count(page_count, min_shard_pages) <= 1:
+                for page_num in range(page_count):
+                    yield page_num, _extract_pdf_page(pdf_reader, page_num)
+                    report_progress((page_num + 1) / page_count)
+                return
+    
+    shard_count = _pdf_shard_count(page_count, min_shard_pages)
+    bounds = [page_count * shard // shard_count for shard in range(shard_count + 1)]
+    with spill_large_upload(pdf_source, suffix='.pdf', threshold=0) as pdf_path:
+        futures = [executor.submit(_extract_pdf_page_range, pdf_path, first_page, last_page)
+                   for first_page, last_page in zip(bounds, bounds[1:])]
+        try:
+            for future in futures:
+                pages, notices = future.result()
+                for level, message in notices:
+                    notify(level, message)
+                for page_num, text in pages:
+                    yield page_num, text
+                    report_progress((page_num + 1) / page_count)
+        finally:
+            # Abandonne les plages restantes si le consommateur s'arrête en cours de route
+            for future in futures:
+                future.cancel()
+            # La copie sur disque ne peut être supprimée qu'une fois les plages en cours terminées
+            wait(futures)
+
+def iter_pdf_text(file_content, page_count=None):
+    """Produit le texte d'un PDF page par page avec une gestion d'erreurs robuste
+
+    Permet de découper et d'indexer le document avant la fin de l'extraction.
+    `page_count` : nombre de pages déjà connu (voir pdf_page_count).
+    """
+    import PyPDF2
+    extracted = False
+    
+    try:
+        # Lecture directe du contenu en mémoire (ou d'une copie unique mappée pour les très gros fichiers)
+        with spill_large_upload(file_content, suffix='.pdf') as pdf_source:
+            try:
+                for page_num, page_text in iter_pdf_pages(pdf_source, page_count=page_count):
+                    if page_text:
+                        extracted = True
+                        yield page_text + PDF_PAGE_BREAK
+            
+            except PyPDF2.errors.PdfReadError as pdf_error:
+                notify("error", f"Erreur lors de la lecture du PDF: {str(pdf_error)}")
+                if not extracted:
+                    notify("info", "Tentative avec une méthode alternative...")
+                    
+                    # Méthode alternative en cas d'échec de PyPDF2
+                    try:
+                        import pdfplumber
+                        
+                        with open_binary_source(pdf_source) as pdf_file, pdfplumber.open(pdf_file) as pdf:
+                            for page in pdf.pages:
+                                try:
+                                    page_text = page.extract_text()
+                                except:
+                                    continue  # Ignorer les pages problématiques
+                                if page_text:
+                                    extracted = True
+                                    yield page_text + PDF_PAGE_BREAK
+                    except ImportError:
+                        notify("error", "Module pdfplumber non disponible pour l'extraction alternative.")
+                        # Recommander l'installation: pip install pdfplumber
+    
+    except Exception as e:
+        notify("error", f"Erreur lors de l'extraction du texte du PDF: {str(e)}")
+    
+    # Vérifier si du texte a été extrait
+    if not extracted:
+        notify("warning", "Aucun texte n'a pu être extrait du PDF. Cela peut être dû à un PDF scanné ou protégé.")
+
+def extract_text_from_pdf(file):
+    """Extrait le texte d'un fichier PDF (contenu ou fichier uploadé) avec une gestion d'erreurs améliorée et robuste"""
+    return "".join(iter_pdf_text(file.getvalue() if hasattr(file, 'getvalue') else file))
+
+def _docx_main_part(archive):
+    """Nom de la partie principale du document, lu dans les relations du paquet"""
+    try:
+        with archive.open("_rels/.rels") as rels:
+            for relationship in ElementTree.parse(rels).getroot():
+                if relationship.get("Type", "").endswith(OFFICE_DOCUMENT_REL):
+                    return relationship.get("Target", "").lstrip("/")
+    except KeyError:
+        pass
+    return "word/document.xml"
+
+def _docx_paragraph_text(paragraph):
+    """Texte d'un paragraphe (runs, tabulations, sauts de ligne), sans les doublons de compatibilité"""
+    parts = []
+    stack = [paragraph]
+    while stack:
+        element = stack.pop()
+        tag = element.tag
+        if tag == MC_FALLBACK:
+            continue  # Variante de repli d'un contenu déjà présent dans mc:Choice
+        if tag == W_NS + "t":
+            parts.append(element.text or "")
+        elif tag == W_NS + "tab":
+            parts.append("\t")
+        elif tag in (W_NS + "br", W_NS + "cr"):
+            parts.append("\n")
+        stack.extend(reversed(element))
+    return "".join(parts)
+
+def _docx_cell_is_merge_continuation(cell):
+    """Vrai pour la suite d'une fusion verticale (w:vMerge sans val="restart")"""
+    properties = cell.find(W_NS + "tcPr")
+    if properties is None:
+        return False
+    vertical_merge = properties.find(W_NS + "vMerge")
+    return vertical_merge is not None and vertical_merge.get(W_NS + "val", "continue") != "restart"
+
+def _docx_table_text(table):
+    """Lignes du tableau, cellules séparées par « | » ; chaque cellule fusionnée n'apparaît qu'une fois"""
+    rows = []
+    for row in table.findall(W_NS + "tr"):
+        cells = [
+            # Les paragraphes d'une cellule restent sur la ligne pour que le découpage reconnaisse la ligne
+            " ".join(filter(None, (_docx_paragraph_text(paragraph).strip() for paragraph in cell.iter(W_NS + "p"))))
+            for cell in row.findall(W_NS + "tc")
+            if not _docx_cell_is_merge_continuation(cell)
+        ]
+        rows.append(" | ".join(cells))
+    return "\n".join(rows) + "\n\n"
+
+def iter_docx_blocks(docx_source):
+    """Produit le texte des paragraphes et des tableaux du corps dans l'ordre du document
+
+    Le XML est lu en flux (iterparse) : chaque bloc est libéré dès qu'il est produit, de
+    sorte que la mémoire ne dépend pas de la taille du document.
+    """
+    archive_source = docx_source if isinstance(docx_source, str) else io.BytesIO(docx_source)
+    with zipfile.ZipFile(archive_source) as archive, archive.open(_docx_main_part(archive)) as document:
+        stack = []
+        table_depth = 0
+        for event, element in ElementTree.iterparse(document, events=("start", "end")):
+            if event == "start":
+                stack.append(element)
+                if element.tag == W_NS + "tbl":
+                    table_depth += 1
+                continue
+            stack.pop()
+            if element.tag == W_NS + "tbl":
+                table_depth -= 1
+                if table_depth:
+                    continue
+                block = _docx_table_text(element)
+            elif element.tag == W_NS + "p" and not table_depth \
+                    and not any(ancestor.tag == W_NS + "p" for ancestor in stack):
+                block = _docx_paragraph_text(element) + "\n"
+            else:
+                continue
+            # Libère le bloc traité (et sa place dans le parent) avant de lire la suite
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
+            yield block
+
+def iter_docx_text(file_content):
+    """Produit les blocs de texte d'un DOCX au fil de la lecture, avec gestion d'erreurs"""
+    try:
+        with spill_large_upload(file_content, suffix='.docx') as docx_source:
+            # zipfile exige un flux "seekable" : la copie déversée est ouverte par son chemin
+            yield from iter_docx_blocks(docx_source)
+    except Exception as e:
+        notify("error", f"Erreur lors de l'extraction du texte du DOCX: {str(e)}")
+
+def extract_text_from_docx(file):
+    """Extrait le texte d'un fichier DOCX (contenu ou fichier uploadé) en un seul parcours du document"""
+    file_content = file.getvalue() if hasattr(file, 'getvalue') else file
+    return "".join(iter_docx_text(file_content))
+
+def detect_text_encoding(sample):
+    """Choisit l'encodage d'un texte d'après son BOM, puis d'après un échantillon de son début
+
+    Renvoie (encodage, longueur_du_BOM). Sans BOM : UTF-8 si l'échantillon est valide,
+    sinon windows-1252, ou latin-1 si l'échantillon contient des octets que windows-1252
+    n'attribue pas (il ne s'agit alors pas d'un texte Windows).
+    """
+    for bom, encoding in TXT_BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    try:
+        # Décodage non final : une séquence UTF-8 coupée en fin d'échantillon n'est pas une erreur
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    if any(byte in CP1252_UNDEFINED_BYTES for byte in sample):
+        return 'latin-1', 0
+    return 'cp1252', 0
+
+def _iter_blocks(source, block_size):
+    """Blocs d'octets d'un contenu en mémoire (sans copie) ou d'un flux binaire"""
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        for offset in range(0, len(view), block_size):
+            yield view[offset:offset + block_size]
+        return
+    while block := source.read(block_size):
+        yield block
+
+def _switch_to_cp1252(error):
+    """Bascule en windows-1252 après une erreur de décodage UTF-8 ; renvoie (décodeur, texte)
+
+    `error.object` contient les octets en attente suivis du bloc : l'UTF-8 valide qui précède
+    l'octet fautif est conservé, seule la suite est reprise en windows-1252.
+    """
+    notify("warning", "Encodage incohérent dans le fichier texte : la suite est lue en windows-1252.")
+    decoder = codecs.getincrementaldecoder('cp1252')(errors='replace')
+    return decoder, error.object[:error.start].decode('utf-8') + decoder.decode(error.object[error.start:])
+
+def iter_txt_text(file_content, block_size=TXT_DECODE_BLOCK):
+    """Décode un fichier texte en un seul passage, par blocs bornés transmis au fil de l'eau
+
+    L'encodage est choisi une fois (BOM et échantillon) ; si un bloc ultérieur n'est pas
+    de l'UTF-8 valide (fichier à encodage mixte), la suite est décodée en windows-1252.
+    `file_content` est le contenu en mémoire, un flux binaire positionné au début ou le
+    chemin d'une copie déversée (voir spill_large_upload), lue par projection en mémoire.
+    """
+    if isinstance(file_content, (str, os.PathLike)):
+        with open_binary_source(file_content) as mapped:
+            yield from iter_txt_text(mapped, block_size)
+        return
+    try:
+        total = len(file_content) if hasattr(file_content, '__len__') else None
+        blocks = _iter_blocks(file_content, block_size)
+        first = bytes(next(blocks, b""))
+        encoding, bom_length = detect_text_encoding(first[:TXT_SNIFF_BYTES])
+        # Seul l'UTF-8 est décodé strictement, pour détecter un changement d'encodage en cours de fichier
+        decoder = codecs.getincrementaldecoder(encoding)(errors='strict' if encoding == 'utf-8' else 'replace')
+        decoded = 0
+        for block in itertools.chain([first[bom_length:]], blocks):
+            try:
+                text = decoder.decode(block)
+            except UnicodeDecodeError as e:
+                decoder, text = _switch_to_cp1252(e)
+            decoded += len(block)
+            if text:
+                yield text
+            if total:
+                report_progress(decoded / total)
+        try:
+            tail = decoder.decode(b"", final=True)
+        except UnicodeDecodeError as e:
+            # Fichier terminé par des octets qui ne sont pas de l'UTF-8 (ex. « é » windows-1252)
+            decoder, tail = _switch_to_cp1252(e)
+            tail += decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    except Exception as e:
+        notify("error", f"Erreur lors de l'extraction du texte du fichier TXT: {str(e)}")
+
+def extract_text_from_txt(file_object):
+    """Extrait le texte d'un fichier TXT (upload, flux binaire ou texte) en détectant son encodage une seule fois"""
+    try:
+        # Flux déjà décodé (StringIO, fichier ouvert en mode texte)
+        if isinstance(file_object, io.TextIOBase):
+            file_object.seek(0)
+            return file_object.read()
+        # Si c'est un objet UploadedFile (de l'interface Streamlit) ou un BytesIO
+        if hasattr(file_object, 'getvalue'):
+            return "".join(iter_txt_text(file_object.getvalue()))
+        file_object.seek(0)  # Retour au début du fichier
+    except Exception as e:
+        notify("error", f"Erreur lors de l'extraction du texte du fichier TXT: {str(e)}")
+        return ""
+    return "".join(iter_txt_text(file_object))
+
+def extract_and_index(file_content, file_name, page_count=None):
+    """Traite le fichier uploadé, extrait son contenu textuel et l'indexe
+
+    Retourne un tuple (texte, index) : l'index inversé est construit une seule fois
+    ici pour que chaque question ne consulte que les postings de ses mots-clés.
+    `file_content` est le contenu en mémoire ou le chemin de sa copie déversée ;
+    `page_count` est le nombre de pages d'un PDF s'il a déjà été lu (voir pdf_page_count).
+    """
+    file_extension = Path(file_name).suffix.lower()
+    metrics = get_metrics()
+    started = time.perf_counter()
+    content_bytes = (os.path.getsize(file_content) if isinstance(file_content, (str, os.PathLike))
+                     else len(file_content))
+    
+    # Les extracteurs lisent directement le contenu en mémoire (ou la copie déversée), sans autre copie
+    text_stream = TEXT_STREAMS.get(file_extension)
+    if text_stream is None:
+        notify("error", f"Format de fichier non pris en charge: {file_extension}")
+        metrics.observe("extraction", time.perf_counter() - started, bytes_count=content_bytes)
+        return "", build_document_index("")
+    if page_count is not None and text_stream is iter_pdf_text:
+        text_stream = partial(iter_pdf_text, page_count=page_count)
+    
+    # Le découpage et l'indexation consomment les pages, blocs ou morceaux de texte au fil de l'extraction
+    blocks = text_stream(file_content)
+    pieces = []
+    extraction_time = 0.0
+    def collect_pieces():
+        nonlocal extraction_time
+        while True:
+            piece_started = time.perf_counter()
+            piece = next(blocks, None)
+            extraction_time += time.perf_counter() - piece_started
+            if piece is None:
+                return
+            pieces.append(piece)
+            yield piece
+    index = build_document_index(collect_pieces())
+    result = "".join(pieces)
+    metrics.observe("extraction", extraction_time, bytes_count=content_bytes)
+    metrics.observe("indexation", time.perf_counter() - started - extraction_time,
+                    bytes_count=len(result), tokens=int(index["chunk_lengths"].sum()))
+    return result, index
+
+# Extracteurs en flux par extension : chacun produit le texte par morceaux et signale ses erreurs
+TEXT_STREAMS = {'.pdf': iter_pdf_text, '.docx': iter_docx_text, '.txt': iter_txt_text}
@@ -0,0 +1,62 @@
+"""Analyse lexicale et index inversé des chunks d'un document"""
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from .chunking import iter_chunk_spans
+
+# Mots vides ignorés lors de l'indexation et de l'analyse des questions
+STOPWORDS = frozenset(['le', 'la', 'les', 'un', 'une', 'des', 'et', 'est', 'à', 'au', 'aux',
+                       'de', 'du', 'en', 'ce', 'cette', 'ces', 'qui', 'que', 'quoi', 'où',
+                       'comment', 'pourquoi', 'quand', 'quel', 'quelle', 'quels', 'quelles',
+                       'il', 'elle', 'ils', 'elles', 'nous', 'vous', 'leur', 'leurs', 'son',
+                       'sa', 'ses', 'mon', 'ma', 'mes', 'ton', 'ta', 'tes', 'pour', 'par',
+                       'avec', 'sans', 'mais', 'ou', 'donc', 'or', 'ni', 'car', 'sur'])
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+def tokenize(text):
+    """Extrait les termes significatifs d'un texte (minuscules, sans mots vides ni mots courts)"""
+    return [word for word in WORD_PATTERN.findall(text.lower())
+            if word not in STOPWORDS and len(word) > 2]
+
+def tokenize_span(text, start, end):
+    """Comme tokenize, sur text[start:end] sans copier la sous-chaîne"""
+    terms = []
+    for word in WORD_PATTERN.findall(text, start, end):
+        word = word.lower()
+        if word not in STOPWORDS and len(word) > 2:
+            terms.append(word)
+    return terms
+
+def build_document_index(text, chunk_size=3000, overlap=200):
+    """Découpe un document en chunks et construit son index inversé
+
+    `text` est le texte complet ou un flux de fragments (pages...) indexé au fil de l'eau.
+    L'index associe chaque terme à ses postings [(indice_chunk, fréquence), ...]
+    afin qu'une question ne parcoure que les chunks contenant ses mots-clés ; les chunks
+    eux-mêmes ne sont conservés que sous forme d'offsets (starts/ends) dans le texte.
+    """
+    pieces = [text] if isinstance(text, str) else text
+    starts = array('I')
+    ends = array('I')
+    chunk_lengths = []
+    postings = {}
+    spans = iter_chunk_spans(pieces, chunk_size=chunk_size, overlap=overlap)
+    for chunk_idx, ((_, start, end), buffer, base) in enumerate(spans):
+        starts.append(start)
+        ends.append(end)
+        terms = tokenize_span(buffer, start - base, end - base)
+        chunk_lengths.append(len(terms))
+        for term, frequency in Counter(terms).items():
+            postings.setdefault(term, []).append((chunk_idx, frequency))
+    chunk_lengths = np.array(chunk_lengths, dtype=np.float32)
+    # Postings compactés en tableaux NumPy (indices de chunks, fréquences) pour le scoring vectorisé
+    postings = {
+        term: (np.array([chunk_idx for chunk_idx, _ in entries], dtype=np.int32),
+               np.array([frequency for _, frequency in entries], dtype=np.float32))
+        for term, entries in postings.items()
+    }
+    return {"starts": starts, "ends": ends, "postings": postings, "chunk_lengths": chunk_lengths}
@@ -0,0 +1,235 @@
+"""Ingestion des fichiers : cache d'extraction et traitement parallèle ou en arrière-plan"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed, wait
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from pathlib import Path
+
+from .cache import extraction_cache_key, get_extraction_cache
+from .executors import INGESTION_PROGRESS_SLOTS, get_ingestion_executor, get_progress_slots, set_worker_progress
+from .extraction import extract_and_index, pdf_page_count, pdf_pages_are_sharded, spill_large_upload
+from .metrics import collect_observations, get_metrics
+from .notices import _notices
+
+def process_file(file_content, file_name, cache=None, cache_key=None, page_count=None):
+    """Traite le fichier en passant par le cache d'extraction persistant s'il est fourni
+
+    `file_content` est le contenu en mémoire ou le chemin de sa copie déversée (la clé de
+    cache doit alors être fournie) ; `page_count` : voir extract_and_index.
+    """
+    if cache is not None:
+        cache_key = cache_key or extraction_cache_key(file_content, file_name)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached["text"], cached["index"]
+    
+    text, index = extract_and_index(file_content, file_name, page_count)
+    if text:
+        # Embeddings calculés à la première recherche sémantique ou hybride (StoredDocument.embeddings)
+        index["embeddings_key"] = cache_key or extraction_cache_key(file_content, file_name)
+    if cache is not None and text:
+        cache.put(cache_key, {"text": text, "index": index})
+    return text, index
+
+def _ingest_worker(file_content, file_name, cache_key=None, progress_slot=None, page_count=None):
+    """Traite un fichier dans un worker et renvoie son résultat sans jamais lever d'exception
+
+    Le cache d'extraction a déjà été consulté par l'appelant, qui écrit aussi la nouvelle
+    entrée et enregistre les mesures renvoyées (voir _record_ingestion). Les gros fichiers
+    arrivent sous forme de chemin (voir spill_large_upload) plutôt que sérialisés.
+    `progress_slot` : emplacement du tableau partagé où publier l'avancement (voir executors).
+    """
+    _notices.messages = []
+    if progress_slot is not None:
+        _notices.progress = partial(set_worker_progress, progress_slot)
+    with collect_observations() as observations:
+        try:
+            text, index = process_file(file_content, file_name, cache_key=cache_key, page_count=page_count)
+            result = {"text": text, "index": index, "error": None}
+        except Exception as e:
+            result = {"text": "", "index": None, "error": str(e)}
+        finally:
+            notices = _notices.messages
+            _notices.messages = None
+            _notices.progress = None
+    return {**result, "notices": notices, "cached": False, "observations": observations}
+
+def _record_ingestion(result, cache, cache_key):
+    """Enregistre dans le processus principal les mesures du worker et met en cache son extraction"""
+    get_metrics().record(result.pop("observations", ()))
+    if result["text"]:
+        cache.put(cache_key, {"text": result["text"], "index": result["index"]})
+    return result
+
+def ingest_files(files):
+    """Traite plusieurs fichiers en parallèle et produit (position, résultat) au fur et à mesure
+
+    Les fichiers déjà présents dans le cache d'extraction sont restitués sans extraction ;
+    un fichier seul est traité directement. L'échec d'un fichier est reporté dans son
+    résultat et n'interrompt pas le lot.
+    """
+    cache = get_extraction_cache()
+    pending = []
+    for position, uploaded_file in enumerate(files):
+        file_content = uploaded_file.getvalue()
+        cache_key = extraction_cache_key(file_content, uploaded_file.name)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            yield position, {"text": cached["text"], "index": cached["index"], "notices": [],
+                             "error": None, "cached": True}
+        else:
+            pending.append((position, file_content, uploaded_file.name, cache_key))
+    
+    if len(pending) == 1:
+        position, file_content, file_name, cache_key = pending[0]
+        yield position, _record_ingestion(_ingest_worker(file_content, file_name, cache_key), cache, cache_key)
+        return
+    
+    executor = get_ingestion_executor()
+    with ExitStack() as spilled:
+        # Les gros fichiers sont transmis aux workers par le chemin d'une copie sur disque
+        futures = {executor.submit(_ingest_worker,
+                                   spilled.enter_context(spill_large_upload(file_content, Path(file_name).suffix)),
+                                   file_name, cache_key): (position, cache_key)
+                   for position, file_content, file_name, cache_key in pending}
+        for future in as_completed(futures):
+            position, cache_key = futures[future]
+            try:
+                result = _record_ingestion(future.result(), cache, cache_key)
+            except Exception as e:
+                # Erreur du pool lui-même (processus interrompu, résultat non sérialisable...)
+                result = {"text": "", "index": None, "notices": [], "error": str(e), "cached": False}
+            yield position, result
+
+# File d'ingestion en arrière-plan, indépendante du cycle de réexécution de l'interface
+INGESTION_WORKERS = 4
+INGESTION_JOB_TTL = 3600  # secondes de conservation d'un travail terminé mais jamais récupéré
+INGESTION_POLL_INTERVAL = 0.25
+
+class IngestionJob:
+    """Travail d'ingestion d'un fichier : identifiant, statut, progression et résultat"""
+    
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "en attente"
+        self.progress = 0.0
+        self.result = None
+        self.finished_at = None
+        self.future = None
+    
+    @property
+    def done(self):
+        return self.result is not None
+    
+    def set_progress(self, fraction):
+        self.progress = min(max(fraction, 0.0), 1.0)
+
+class IngestionQueue:
+    """Suivi des ingestions en arrière-plan ; l'extraction et l'indexation tournent dans le pool de processus
+
+    Chaque travail est suivi par un thread (statut, avancement, résultat) qui confie le
+    traitement du fichier à get_ingestion_executor(). Un PDF dont les pages sont réparties
+    entre les workers est traité depuis le thread, qui distribue ses plages de pages au pool.
+    Les travaux survivent aux réexécutions du script Streamlit : une session ne conserve que
+    leurs identifiants et récupère les résultats lorsqu'ils sont prêts.
+    """
+    
+    def __init__(self, max_workers=INGESTION_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._free_slots = list(range(INGESTION_PROGRESS_SLOTS))
+    
+    def submit(self, file_content, file_name):
+        """Met un fichier en file d'attente et renvoie l'identifiant du travail"""
+        job = IngestionJob(file_name)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, file_content)
+        return job.id
+    
+    def _run(self, job, file_content):
+        job.status = "en cours"
+        _notices.progress = job.set_progress
+        try:
+            cache = get_extraction_cache()
+            cache_key = extraction_cache_key(file_content, job.name)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                job.result = {"text": cached["text"], "index": cached["index"], "notices": [],
+                              "error": None, "cached": True}
+            else:
+                job.result = _record_ingestion(self._extract(job, file_content, cache_key), cache, cache_key)
+        except Exception as e:
+            job.result = {"text": "", "index": None, "notices": [], "error": str(e), "cached": False}
+        finally:
+            _notices.progress = None
+        job.progress = 1.0
+        job.status = "terminé" if job.result["text"] else "échec"
+        job.finished_at = time.time()
+    
+    def _extract(self, job, file_content, cache_key):
+        """Extrait et indexe le fichier depuis une copie unique sur disque s'il est volumineux
+
+        Le nombre de pages d'un PDF est lu une fois ici : il décide de la répartition des
+        pages entre les workers et leur est transmis pour ne pas relire le document.
+        """
+        suffix = Path(job.name).suffix.lower()
+        with spill_large_upload(file_content, suffix) as source:
+            page_count = pdf_page_count(source) if suffix == ".pdf" else None
+            if page_count is not None and pdf_pages_are_sharded(page_count):
+                return _ingest_worker(source, job.name, cache_key, page_count=page_count)
+            return self._run_in_pool(job, source, cache_key, page_count)
+    
+    def _run_in_pool(self, job, file_content, cache_key, page_count=None):
+        """Traite le fichier dans un worker et recopie son avancement jusqu'à la fin"""
+        with self._lock:
+            slot = self._free_slots.pop() if self._free_slots else None
+        try:
+            if slot is not None:
+                get_progress_slots()[slot] = 0.0
+            future = get_ingestion_executor().submit(_ingest_worker, file_content, job.name, cache_key, slot, page_count)
+            while True:
+                try:
+                    return future.result(timeout=INGESTION_POLL_INTERVAL)
+                except TimeoutError:
+                    if slot is not None:
+                        job.set_progress(get_progress_slots()[slot])
+        finally:
+            if slot is not None:
+                with self._lock:
+                    self._free_slots.append(slot)
+    
+    def _prune(self):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and time.time() - job.finished_at > INGESTION_JOB_TTL]
+        for job_id in expired:
+            del self._jobs[job_id]
+    
+    def job(self, job_id):
+        """Travail correspondant à `job_id`, ou None s'il a été oublié"""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def wait(self, job_ids, timeout=None):
+        """Attend la fin des travaux indiqués (au plus `timeout` secondes) et renvoie ceux qui restent"""
+        futures = [job.future for job in map(self.job, job_ids) if job is not None]
+        wait(futures, timeout=timeout)
+        return [job_id for job_id in job_ids if (job := self.job(job_id)) is not None and not job.done]
+    
+    def forget(self, job_id):
+        """Abandonne un travail (annulé s'il n'a pas commencé) et libère son résultat"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.future.cancel()
+            return job
+
+@lru_cache(maxsize=None)
+def get_ingestion_queue():
+    """File d'ingestion partagée par toutes les sessions"""
+    return IngestionQueue()
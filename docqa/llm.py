@@ -0,0 +1,121 @@
+"""Paramètres du modèle et transport asynchrone en streaming vers l'API compatible OpenAI
+
+Le client openai/httpx n'est importé qu'à la création du transport.
+"""
+import asyncio
+import queue
+import random
+import threading
+
+# Paramètres du modèle
+MODEL = "llama-3.3-70b-instruct"
+MAX_TOKENS = 4096
+MODEL_CONTEXT_TOKENS = 32_000  # fenêtre servie par l'API : prompt et réponse compris
+TEMPERATURE = 0.15
+TOP_P = 0.9
+PRESENCE_PENALTY = 0.0
+STOP_SEQUENCE = ["/stop"]
+
+
+# Transport HTTP vers l'API du modèle
+LLM_CONNECT_TIMEOUT = 10.0  # secondes pour établir la connexion
+LLM_READ_TIMEOUT = 60.0  # secondes maximum entre deux fragments reçus
+LLM_MAX_CONNECTIONS = 32
+LLM_MAX_KEEPALIVE_CONNECTIONS = 16
+LLM_MAX_RETRIES = 3  # nouvelles tentatives sur 429, 5xx et erreurs de connexion
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_RETRY_MAX_DELAY = 8.0
+
+def retry_delay(attempt, error=None):
+    """Délai avant la tentative suivante : Retry-After si fourni, sinon backoff exponentiel à gigue complète"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), LLM_RETRY_MAX_DELAY)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+class LLMGeneration:
+    """Génération en streaming exécutée sur la boucle du transport, consommée comme un itérateur de deltas"""
+    
+    _DONE = object()
+    
+    def __init__(self, transport, request):
+        self._deltas = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(self._run(transport, request), transport.loop)
+    
+    async def _run(self, transport, request):
+        try:
+            stream = await transport.create_with_retry(stream=True, **request)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        self._deltas.put(chunk.choices[0].delta.content)
+            finally:
+                await stream.close()
+        except BaseException as e:
+            self._deltas.put(e)
+            raise
+        finally:
+            self._deltas.put(self._DONE)
+    
+    def __iter__(self):
+        try:
+            while True:
+                item = self._deltas.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Le script a été interrompu (rerun, nouvelle conversation) : on libère la connexion
+            self.cancel()
+    
+    def cancel(self):
+        """Annule la génération si elle est encore en cours"""
+        self._future.cancel()
+    
+    @property
+    def done(self):
+        return self._future.done()
+
+class AsyncLLMTransport:
+    """Client AsyncOpenAI servi par une boucle d'événements dédiée
+
+    Les connexions HTTP sont mutualisées entre les sessions ; les délais de connexion et
+    de lecture sont bornés et les erreurs transitoires sont retentées avant le premier token.
+    """
+    
+    def __init__(self, base_url, api_key):
+        import httpx
+        from openai import AsyncOpenAI
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-transport", daemon=True)
+        self._thread.start()
+        self.client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,  # les nouvelles tentatives sont gérées par create_with_retry
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            ),
+        )
+    
+    async def create_with_retry(self, **request):
+        """Appelle chat.completions.create en retentant les erreurs 429/5xx et de connexion"""
+        from openai import APIConnectionError, InternalServerError, RateLimitError
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return await self.client.chat.completions.create(**request)
+            except (RateLimitError, InternalServerError, APIConnectionError) as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(retry_delay(attempt, e))
+    
+    def stream_chat(self, **request):
+        """Démarre une génération en streaming et renvoie un LLMGeneration"""
+        return LLMGeneration(self, request)
@@ -0,0 +1,171 @@
+"""Mesures de latence, de débit et de taux de succès des caches du pipeline"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Mesures de latence et de débit des étapes du pipeline
+METRICS_SAMPLE_SIZE = 512  # derniers échantillons conservés par étape pour les quantiles
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "")  # journal JSONL (vide : désactivé)
+METRICS_HTTP_PORT = int(os.environ.get("METRICS_HTTP_PORT", 0))  # endpoint Prometheus /metrics (0 : désactivé)
+METRICS_HTTP_HOST = os.environ.get("METRICS_HTTP_HOST", "127.0.0.1")  # endpoint sans authentification : local par défaut
+
+# Mesures collectées par le thread d'un worker d'ingestion, pour être enregistrées par le processus principal
+_collected = threading.local()
+
+@contextmanager
+def collect_observations():
+    """Collecte les mesures d'étapes du thread appelant au lieu de les enregistrer
+
+    Produit la liste des (étape, secondes, octets, tokens) observés dans le bloc ; un worker
+    du pool de processus la renvoie avec son résultat (voir PipelineMetrics.record).
+    """
+    _collected.observations = observations = []
+    try:
+        yield observations
+    finally:
+        _collected.observations = None
+
+class PipelineMetrics:
+    """Durées, octets et tokens par étape, et taux de succès des caches
+
+    Une mesure coûte deux appels à perf_counter et un ajout sous verrou, négligeable
+    devant les étapes mesurées (extraction, recherche, génération).
+    """
+    
+    def __init__(self, log_path=""):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._caches = {}
+        self._log = open(log_path, "a", buffering=1, encoding="utf-8") if log_path else None
+    
+    def observe(self, stage, seconds, bytes_count=0, tokens=0):
+        """Enregistre une exécution de `stage` (ou la collecte, voir collect_observations)"""
+        collected = getattr(_collected, "observations", None)
+        if collected is not None:
+            collected.append((stage, seconds, bytes_count, tokens))
+            return
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "seconds": 0.0, "bytes": 0, "tokens": 0,
+                                               "samples": deque(maxlen=METRICS_SAMPLE_SIZE)}
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += bytes_count
+            entry["tokens"] += tokens
+            entry["samples"].append(seconds)
+            if self._log is not None:
+                self._log.write(json.dumps({"ts": time.time(), "stage": stage, "seconds": round(seconds, 6),
+                                            "bytes": bytes_count, "tokens": tokens}) + "\n")
+    
+    def record(self, observations):
+        """Enregistre des mesures collectées ailleurs (ex. dans un worker du pool de processus)"""
+        for stage, seconds, bytes_count, tokens in observations:
+            self.observe(stage, seconds, bytes_count, tokens)
+    
+    @contextmanager
+    def timer(self, stage):
+        """Chronomètre un bloc ; le dictionnaire produit reçoit éventuellement 'bytes' et 'tokens'"""
+        sizes = {}
+        started = time.perf_counter()
+        try:
+            yield sizes
+        finally:
+            self.observe(stage, time.perf_counter() - started, sizes.get("bytes", 0), sizes.get("tokens", 0))
+    
+    def cache_result(self, cache, hit):
+        """Comptabilise un accès (succès ou échec) au cache `cache`"""
+        with self._lock:
+            counts = self._caches.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+            if self._log is not None:
+                self._log.write(json.dumps({"ts": time.time(), "cache": cache, "hit": hit}) + "\n")
+    
+    def snapshot(self):
+        """Résumé par étape (nombre, total, p50, p95, débits) et par cache (succès, échecs, taux)"""
+        with self._lock:
+            stages = {stage: {**entry, "samples": sorted(entry["samples"])} for stage, entry in self._stages.items()}
+            caches = {cache: tuple(counts) for cache, counts in self._caches.items()}
+        summary = {"stages": {}, "caches": {}}
+        for stage, entry in stages.items():
+            samples = entry["samples"]
+            summary["stages"][stage] = {
+                "count": entry["count"],
+                "seconds": entry["seconds"],
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "bytes": entry["bytes"],
+                "tokens": entry["tokens"],
+                "mb_per_second": entry["bytes"] / entry["seconds"] / 1e6 if entry["seconds"] and entry["bytes"] else None,
+                "tokens_per_second": entry["tokens"] / entry["seconds"] if entry["seconds"] and entry["tokens"] else None,
+            }
+        for cache, (hits, misses) in caches.items():
+            summary["caches"][cache] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return summary
+    
+    def prometheus_text(self):
+        """Mesures au format d'exposition texte de Prometheus"""
+        summary = self.snapshot()
+        lines = ["# TYPE assistant_stage_seconds summary"]
+        for stage, entry in summary["stages"].items():
+            lines.append(f'assistant_stage_seconds{{stage="{stage}",quantile="0.5"}} {entry["p50"]:.6f}')
+            lines.append(f'assistant_stage_seconds{{stage="{stage}",quantile="0.95"}} {entry["p95"]:.6f}')
+            lines.append(f'assistant_stage_seconds_sum{{stage="{stage}"}} {entry["seconds"]:.6f}')
+            lines.append(f'assistant_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        lines.append("# TYPE assistant_stage_bytes_total counter")
+        lines.extend(f'assistant_stage_bytes_total{{stage="{stage}"}} {entry["bytes"]}'
+                     for stage, entry in summary["stages"].items())
+        lines.append("# TYPE assistant_stage_tokens_total counter")
+        lines.extend(f'assistant_stage_tokens_total{{stage="{stage}"}} {entry["tokens"]}'
+                     for stage, entry in summary["stages"].items())
+        lines.append("# TYPE assistant_cache_requests_total counter")
+        for cache, entry in summary["caches"].items():
+            lines.append(f'assistant_cache_requests_total{{cache="{cache}",result="hit"}} {entry["hits"]}')
+            lines.append(f'assistant_cache_requests_total{{cache="{cache}",result="miss"}} {entry["misses"]}')
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(metrics, port, host=METRICS_HTTP_HOST):
+    """Expose /metrics au format Prometheus sur un thread HTTP dédié, à l'adresse `host`"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+@lru_cache(maxsize=None)
+def get_metrics():
+    """Registre de mesures partagé par toutes les sessions (et l'endpoint HTTP s'il est activé)
+
+    Dans un worker du pool d'ingestion, le registre n'a ni journal ni endpoint : les mesures
+    y sont collectées (collect_observations) et enregistrées par le processus principal.
+    """
+    if multiprocessing.parent_process() is not None:
+        return PipelineMetrics()
+    metrics = PipelineMetrics(METRICS_LOG_PATH)
+    if METRICS_HTTP_PORT:
+        try:
+            serve_metrics(metrics, METRICS_HTTP_PORT, METRICS_HTTP_HOST)
+        except OSError as e:
+            logging.getLogger("docqa").warning("Endpoint de mesures indisponible sur %s:%s: %s",
+                                               METRICS_HTTP_HOST, METRICS_HTTP_PORT, e)
+    return metrics
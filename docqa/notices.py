@@ -0,0 +1,31 @@
+"""Messages et progression émis par le moteur, sans dépendance à l'interface"""
+import logging
+import threading
+
+# Messages d'extraction collectés lorsque le traitement s'exécute dans un worker
+_notices = threading.local()
+
+def _log_notice(level, message):
+    logging.getLogger("docqa").log(_LOG_LEVELS.get(level, logging.INFO), message)
+
+_LOG_LEVELS = {"info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+_notice_handler = _log_notice
+
+def set_notice_handler(handler):
+    """Définit l'affichage des messages hors collecte (ex. st.warning dans l'application), journal par défaut"""
+    global _notice_handler
+    _notice_handler = handler or _log_notice
+
+def notify(level, message):
+    """Signale un message d'extraction ('info', 'warning', 'error') ou le collecte pour le thread appelant"""
+    collected = getattr(_notices, "messages", None)
+    if collected is not None:
+        collected.append((level, message))
+    else:
+        _notice_handler(level, message)
+
+def report_progress(fraction):
+    """Transmet l'avancement (0 à 1) de l'extraction au travail d'ingestion du thread appelant"""
+    callback = getattr(_notices, "progress", None)
+    if callback is not None:
+        callback(fraction)
@@ -0,0 +1,93 @@
+"""Fenêtre d'historique, résumé glissant et construction des messages envoyés au modèle"""
+
+# Fenêtre d'historique envoyée au modèle
+HISTORY_TOKEN_BUDGET = 6000  # tokens réservés aux derniers échanges
+SUMMARY_TOKEN_BUDGET = 800  # tokens maximum du résumé des échanges plus anciens
+
+def new_history_summary():
+    """État initial du résumé glissant de la conversation"""
+    return {"lines": [], "tokens": 0, "covered": 0}
+
+def estimate_tokens(text):
+    """Estimation rapide du nombre de tokens d'un texte (environ 4 caractères par token)"""
+    return (len(text) + 3) // 4
+
+def message_tokens(message):
+    """Nombre de tokens d'une entrée d'historique, calculé une seule fois puis mémorisé sur l'entrée"""
+    if "tokens" not in message:
+        # +4 pour le rôle et le balisage du message
+        message["tokens"] = estimate_tokens(message["content"]) + 4
+    return message["tokens"]
+
+def to_api_message(message):
+    """Entrée d'historique réduite aux champs attendus par l'API"""
+    return {"role": message["role"], "content": message["content"]}
+
+def summarize_turn(message, max_chars=200):
+    """Résumé extractif d'un échange sorti de la fenêtre : début du message sur une ligne"""
+    speaker = "Utilisateur" if message["role"] == "user" else "Assistant"
+    content = " ".join(message["content"].split())
+    if len(content) > max_chars:
+        content = content[:max_chars].rsplit(" ", 1)[0] + "…"
+    return f"- {speaker} : {content}"
+
+def build_history_window(history, summary, budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+    """Sélectionne les derniers échanges tenant dans `budget` tokens et résume les plus anciens
+
+    `history` est l'historique sans le message système ; `summary` (voir new_history_summary)
+    est mis à jour en place : seuls les échanges nouvellement sortis de la fenêtre sont résumés.
+    Le dernier message est toujours conservé. Retourne (texte du résumé, échanges récents).
+    """
+    start = len(history)
+    used = 0
+    while start > summary["covered"]:
+        tokens = message_tokens(history[start - 1])
+        if used + tokens > budget and start < len(history):
+            break
+        used += tokens
+        start -= 1
+    
+    # Ajoute au résumé les échanges qui viennent de sortir de la fenêtre
+    for message in history[summary["covered"]:start]:
+        line = summarize_turn(message)
+        summary["lines"].append(line)
+        summary["tokens"] += estimate_tokens(line)
+    summary["covered"] = max(summary["covered"], start)
+    
+    # Le résumé lui-même est borné : on oublie ses lignes les plus anciennes
+    while summary["tokens"] > summary_budget and len(summary["lines"]) > 1:
+        summary["tokens"] -= estimate_tokens(summary["lines"].pop(0))
+    
+    return "\n".join(summary["lines"]), history[start:]
+
+def build_chat_messages(system_content, history, summary, budget=HISTORY_TOKEN_BUDGET):
+    """Construit la liste des messages pour l'API : système, résumé éventuel puis échanges récents"""
+    summary_text, recent = build_history_window(history, summary, budget)
+    messages = [{"role": "system", "content": system_content}]
+    if summary_text:
+        messages.append({"role": "system", "content": f"Résumé des échanges précédents :\n{summary_text}"})
+    messages.extend(to_api_message(message) for message in recent)
+    return messages
+
+# Consignes système selon que la question s'appuie ou non sur des documents
+CHAT_SYSTEM_PROMPT = "Tu es un assistant intelligent qui répond en français même si la question est dans une autre langue."
+DOCUMENT_SYSTEM_PROMPT = "Tu es un assistant intelligent qui répond en français. Tu peux analyser des documents fournis par l'utilisateur et répondre à des questions à leur sujet."
+
+def build_document_prompt(question, document_context):
+    """Message utilisateur accompagné des extraits de documents"""
+    return f"""Voici ma question: {question}
+
+Je joins également les documents suivants pour référence:
+
+{document_context}
+
+Réponds à ma question en te basant sur les informations fournies dans ces documents si pertinent."""
+
+def build_prompt_messages(history, summary, document_context="", budget=HISTORY_TOKEN_BUDGET):
+    """Messages envoyés au modèle ; `history` se termine par la question de l'utilisateur"""
+    if not document_context:
+        return build_chat_messages(CHAT_SYSTEM_PROMPT, history, summary, budget)
+    # Messages précédents tenant dans le budget, puis la question accompagnée du contexte
+    messages = build_chat_messages(DOCUMENT_SYSTEM_PROMPT, history[:-1], summary, budget)
+    messages.append({"role": "user", "content": build_document_prompt(history[-1]["content"], document_context)})
+    return messages
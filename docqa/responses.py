@@ -0,0 +1,127 @@
+"""Cache des réponses complètes pour les prompts répétés"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from functools import lru_cache
+
+from .cache import private_directory
+
+# Cache des réponses pour les questions répétées (FAQ, vérifications types...)
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 3600))  # secondes
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+# Fichier SQLite de persistance (vide : cache uniquement en mémoire)
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "")
+# Au-delà de cette température, les réponses sont volontairement variées : pas de cache
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.3
+REPLAY_PIECE_CHARS = 64
+
+def normalize_messages(messages):
+    """Liste de messages réduite à (rôle, contenu) avec espaces normalisés"""
+    return [(message["role"], " ".join(message["content"].split())) for message in messages]
+
+def response_cache_key(request):
+    """Empreinte SHA-256 des messages normalisés et des paramètres influant sur la génération"""
+    payload = {
+        "messages": normalize_messages(request["messages"]),
+        "model": request["model"],
+        "temperature": request["temperature"],
+        "max_tokens": request["max_tokens"],
+        "top_p": request["top_p"],
+        "presence_penalty": request.get("presence_penalty"),
+        "stop": request["stop"],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Cache des réponses complètes avec expiration (TTL), éviction LRU et persistance SQLite facultative"""
+    
+    def __init__(self, ttl, max_entries, path=""):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if os.path.dirname(self.path):
+            private_directory(os.path.dirname(self.path))
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        return conn
+    
+    def _remember(self, key, response, created):
+        self._entries[key] = (response, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def get(self, key):
+        """Renvoie la réponse en cache pour `key` si elle n'a pas expiré, sinon None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                del self._entries[key]
+        if not self.path:
+            return None
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        except Exception:
+            return None  # Le cache est facultatif
+        with self._lock:
+            self._remember(key, row[0], row[1])
+        return row[0]
+    
+    def put(self, key, response):
+        """Enregistre une réponse complète, en mémoire et sur disque si la persistance est active"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+        if not self.path:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+        except Exception:
+            pass
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    """Cache de réponses partagé par toutes les sessions"""
+    return ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_PATH)
+
+def response_cache_enabled(request):
+    return request["temperature"] <= RESPONSE_CACHE_MAX_TEMPERATURE
+
+def replay_response(response, piece_chars=REPLAY_PIECE_CHARS):
+    """Restitue une réponse en cache par fragments, comme un flux du modèle"""
+    for offset in range(0, len(response), piece_chars):
+        yield response[offset:offset + piece_chars]
@@ -0,0 +1,481 @@
+"""Documents de la session, classement des chunks et construction du contexte d'une question"""
+import re
+from bisect import bisect_right
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from .embeddings import embed_chunks, get_embedder, load_embeddings, save_embeddings
+from .indexing import build_document_index, tokenize
+from .metrics import get_metrics
+from .prompting import estimate_tokens
+
+def _lowercase_view(text):
+    """Version minuscule de `text` de même longueur, pour rechercher dans les chunks par offsets"""
+    lower = text.lower()
+    if len(lower) == len(text):
+        return lower
+    # Quelques caractères (ex. 'İ') s'allongent en minuscule : on les conserve tels quels
+    return "".join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+class StoredDocument:
+    """Document de la session : texte immuable, offsets de ses chunks et index inversé"""
+    
+    __slots__ = ("text", "starts", "ends", "postings", "chunk_lengths", "length_sum", "embeddings_key",
+                 "_lower", "_embeddings")
+    
+    def __init__(self, text, index):
+        self.text = text
+        self.starts = index["starts"]
+        self.ends = index["ends"]
+        self.postings = index["postings"]
+        self.chunk_lengths = index["chunk_lengths"]
+        self.length_sum = float(self.chunk_lengths.sum())
+        self.embeddings_key = index.get("embeddings_key")
+        self._lower = None
+        self._embeddings = None
+    
+    @property
+    def chunk_count(self):
+        return len(self.starts)
+    
+    @property
+    def lower(self):
+        """Vue minuscule du texte, calculée une seule fois"""
+        if self._lower is None:
+            self._lower = _lowercase_view(self.text)
+        return self._lower
+    
+    @property
+    def embeddings(self):
+        """Matrice des embeddings des chunks, projetée en mémoire depuis le disque si possible"""
+        if self._embeddings is None:
+            matrix = load_embeddings(self.embeddings_key) if self.embeddings_key else None
+            if matrix is None or len(matrix) != self.chunk_count:
+                # Index absent (cache évincé, changement d'encodeur...) : recalcul à la demande
+                with get_metrics().timer("embeddings") as measure:
+                    matrix = embed_chunks(self.text, self.starts, self.ends)
+                    measure["bytes"] = len(self.text)
+                if self.embeddings_key:
+                    save_embeddings(self.embeddings_key, matrix)
+            self._embeddings = matrix
+        return self._embeddings
+
+class DocumentStore:
+    """Documents de la session, accessibles comme un dictionnaire {nom_document: texte}
+
+    Chaque document garde un unique buffer de texte ; les chunks ne sont que des offsets
+    array('I') dans ce buffer, de sorte que la recherche ne copie aucun texte.
+    Les statistiques du corpus de la session (nombre de chunks, longueurs, fréquences
+    documentaires des termes) sont tenues à jour à chaque ajout ou suppression, en O(document).
+    """
+    
+    def __init__(self):
+        self._documents = {}
+        self.chunk_count = 0
+        self.length_sum = 0.0
+        self.document_frequency = Counter()
+    
+    def add(self, name, text, index=None):
+        """Ajoute (ou remplace) un document avec l'index construit à l'ingestion"""
+        if name in self._documents:
+            del self[name]
+        document = StoredDocument(text, index or build_document_index(text))
+        self._documents[name] = document
+        self._update_statistics(document, 1)
+    
+    def _update_statistics(self, document, sign):
+        self.chunk_count += sign * document.chunk_count
+        self.length_sum += sign * document.length_sum
+        for term, (chunk_ids, _) in document.postings.items():
+            self.document_frequency[term] += sign * len(chunk_ids)
+            if not self.document_frequency[term]:
+                del self.document_frequency[term]
+    
+    def document(self, name):
+        return self._documents[name]
+    
+    def summary(self, name):
+        """(nombre de chunks, somme des longueurs, longueur du texte) d'un document"""
+        document = self._documents[name]
+        return document.chunk_count, document.length_sum, len(document.text)
+    
+    def documents_with_term(self, term):
+        """Noms des documents dont les postings contiennent `term`"""
+        return [name for name, document in self._documents.items() if term in document.postings]
+    
+    def __getitem__(self, name):
+        return self._documents[name].text
+    
+    def __delitem__(self, name):
+        self._update_statistics(self._documents.pop(name), -1)
+    
+    def __contains__(self, name):
+        return name in self._documents
+    
+    def __iter__(self):
+        return iter(self._documents)
+    
+    def __len__(self):
+        return len(self._documents)
+    
+    def keys(self):
+        return self._documents.keys()
+    
+    def items(self):
+        return ((name, document.text) for name, document in self._documents.items())
+
+class ChunkCorpus:
+    """Chunks des documents interrogés, numérotés globalement dans l'ordre des documents
+
+    La numérotation ne dépend que des résumés des documents (store.summary) : un document
+    n'est chargé que lorsque ses postings, ses embeddings ou son texte sont consultés.
+    """
+    
+    def __init__(self, store, names):
+        self.store = store
+        self.names = list(dict.fromkeys(names))  # Un nom répété ne doit compter qu'une fois
+        self.summaries = [store.summary(name) for name in self.names]
+        self._indices = {name: doc_idx for doc_idx, name in enumerate(self.names)}
+        self._documents = [None] * len(self.names)
+        self.offsets = []
+        size = 0
+        for chunk_count, _, _ in self.summaries:
+            self.offsets.append(size)
+            size += chunk_count
+        self.size = size
+        # Sur toute la session, les statistiques tenues par le store évitent de parcourir les documents
+        self._covers_store = len(self.names) == len(store)
+    
+    def document(self, doc_idx):
+        """Document d'indice `doc_idx`, chargé à la première consultation"""
+        document = self._documents[doc_idx]
+        if document is None:
+            document = self._documents[doc_idx] = self.store.document(self.names[doc_idx])
+        return document
+    
+    def positions(self, name):
+        """Positions globales des chunks du document `name` (vide s'il n'est pas interrogé)"""
+        doc_idx = self._indices.get(name)
+        if doc_idx is None:
+            return range(0)
+        return range(self.offsets[doc_idx], self.offsets[doc_idx] + self.summaries[doc_idx][0])
+    
+    @property
+    def documents(self):
+        """Tous les documents interrogés (ex. pour les embeddings)"""
+        return [self.document(doc_idx) for doc_idx in range(len(self.names))]
+    
+    def postings(self, term):
+        """(document, offset, indices des chunks, fréquences) des seuls documents contenant `term`"""
+        for name in self.store.documents_with_term(term):
+            doc_idx = self._indices.get(name)
+            if doc_idx is not None:
+                document = self.document(doc_idx)
+                chunk_ids, frequencies = document.postings.get(term, ((), ()))
+                yield document, self.offsets[doc_idx], chunk_ids, frequencies
+    
+    @property
+    def average_length(self):
+        """Longueur moyenne des chunks (en termes) du corpus interrogé"""
+        if self._covers_store:
+            length_sum = self.store.length_sum
+        else:
+            length_sum = sum(length_sum for _, length_sum, _ in self.summaries)
+        return length_sum / self.size if self.size else 0.0
+    
+    def document_frequency(self, term):
+        """Nombre de chunks du corpus contenant `term`"""
+        if self._covers_store:
+            return self.store.document_frequency.get(term, 0)
+        return sum(len(chunk_ids) for _, _, chunk_ids, _ in self.postings(term))
+    
+    def locate(self, position):
+        """(indice du document, indice du chunk dans ce document) d'une position globale"""
+        doc_idx = bisect_right(self.offsets, position) - 1
+        return doc_idx, position - self.offsets[doc_idx]
+    
+    def span(self, position):
+        doc_idx, chunk_idx = self.locate(position)
+        document = self.document(doc_idx)
+        return document, document.starts[chunk_idx], document.ends[chunk_idx]
+    
+    def length(self, position):
+        _, start, end = self.span(position)
+        return end - start
+    
+    def text(self, position):
+        document, start, end = self.span(position)
+        return document.text[start:end]
+    
+    def contains(self, position, needle):
+        """Vrai si le chunk contient `needle` (en minuscules), sans copier le chunk"""
+        document, start, end = self.span(position)
+        return document.lower.find(needle, start, end) != -1
+
+def score_chunks_heuristic(question, keywords, corpus):
+    """Classement historique : fréquence des mots-clés pondérée par leur longueur + bonus de phrases"""
+    chunk_scores = {}
+    for keyword in keywords:
+        # Donne un poids plus élevé aux mots plus longs (supposés plus significatifs)
+        weight = min(1.0, 0.5 + (len(keyword) / 10))
+        for _, offset, chunk_ids, frequencies in corpus.postings(keyword):
+            for chunk_idx, frequency in zip(chunk_ids, frequencies):
+                position = offset + int(chunk_idx)
+                chunk_scores[position] = chunk_scores.get(position, 0) + float(frequency) * weight
+    
+    # Bonus pour les chunks contenant des phrases complètes de la question
+    question_phrases = [phrase.strip() for phrase in re.split(r'[.!?]', question.lower())
+                        if len(phrase.strip()) > 10]
+    if question_phrases:
+        for position in chunk_scores:
+            for phrase in question_phrases:
+                if corpus.contains(position, phrase):
+                    chunk_scores[position] += 2
+    
+    return chunk_scores
+
+def score_chunks_bm25(question, keywords, corpus, k1=1.5, b=0.75):
+    """Classement BM25 vectorisé, accumulé sur les seuls postings des termes de la question"""
+    n_chunks = corpus.size
+    if n_chunks == 0:
+        return {}
+    average_length = max(corpus.average_length, 1.0)
+    
+    scores = np.zeros(n_chunks, dtype=np.float32)
+    for term, query_weight in Counter(keywords).items():
+        document_frequency = corpus.document_frequency(term)
+        if not document_frequency:
+            continue
+        idf = np.log1p((n_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+        for document, offset, chunk_ids, frequencies in corpus.postings(term):
+            if len(chunk_ids):
+                norm = k1 * (1 - b + b * document.chunk_lengths[chunk_ids] / average_length)
+                scores[offset + chunk_ids] += query_weight * idf * frequencies * (k1 + 1) / (frequencies + norm)
+    
+    positions = np.flatnonzero(scores > 0)
+    return {int(position): float(scores[position]) for position in positions}
+
+SEMANTIC_TOP_K = 50
+# Constante de lissage de la fusion des rangs (Reciprocal Rank Fusion)
+RRF_K = 60
+
+def score_chunks_semantic(question, keywords, corpus, top_k=SEMANTIC_TOP_K):
+    """Similarité cosinus entre la question et les chunks : produit matriciel sur les embeddings projetés"""
+    if corpus.size == 0:
+        return {}
+    query = get_embedder().embed([question])[0]
+    scores = np.zeros(corpus.size, dtype=np.float32)
+    for document, offset in zip(corpus.documents, corpus.offsets):
+        if document.chunk_count:
+            scores[offset:offset + document.chunk_count] = document.embeddings @ query
+    
+    top_k = min(top_k, corpus.size)
+    positions = np.argpartition(-scores, top_k - 1)[:top_k]
+    return {int(position): float(scores[position]) for position in positions if scores[position] > 0}
+
+def score_chunks_hybrid(question, keywords, corpus, k=RRF_K):
+    """Fusion des rangs BM25 et sémantiques (Reciprocal Rank Fusion)"""
+    fused = {}
+    for chunk_scores in (score_chunks_bm25(question, keywords, corpus),
+                         score_chunks_semantic(question, keywords, corpus)):
+        ranking = sorted(chunk_scores, key=chunk_scores.get, reverse=True)
+        for rank, position in enumerate(ranking, start=1):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (k + rank)
+    return fused
+
+# Méthodes de classement disponibles pour la sélection des chunks
+RANKERS = {
+    "bm25": score_chunks_bm25,
+    "heuristique": score_chunks_heuristic,
+    "sémantique": score_chunks_semantic,
+    "hybride": score_chunks_hybrid,
+}
+DEFAULT_RANKER = "bm25"
+
+# Budget du contexte documentaire joint à une question (tokens estimés, voir estimate_tokens)
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_HEADER = "--- DOCUMENT: {} ---"
+CONTEXT_GAP = "[…]"  # Sépare deux extraits non contigus d'un même document
+
+# Bruit d'extraction retiré du contexte : espaces multiples et numéros de page explicites en bord de page
+HORIZONTAL_SPACE_PATTERN = re.compile(r"[ \u00a0\v]*\t[ \t\u00a0\v]*|[ \u00a0\v]{2,}|[\u00a0\v]")
+LINE_EDGE_SPACE_PATTERN = re.compile(r" *\n *")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+# « Page N », « Page N/M », « - N - », « N sur M » ; un nombre seul n'est jamais retiré
+PAGE_MARKER_PATTERN = re.compile(
+    r"page\s+\d{1,4}(?:\s*(?:/|sur)\s*\d{1,4})?|-\s*\d{1,4}\s*-|\d{1,4}\s*sur\s*\d{1,4}", re.IGNORECASE
+)
+# « N/M » seul : un numéro de page seulement si la numérotation se suit d'une page à l'autre
+# (N croissant, M constant) ; isolé, c'est souvent une date (3/12, 01/12, 03/2024)
+BARE_PAGE_FRACTION_PATTERN = re.compile(r"(\d{1,3})\s*/\s*(\d{1,3})")
+
+def _edge_line(lines, edge):
+    """Indice de la ligne non vide au bord `edge` (0 ou -1) de la page, ou None"""
+    nonblank = [i for i, line in enumerate(lines) if line.strip()]
+    return nonblank[edge] if nonblank else None
+
+def _page_fraction(line, page_idx):
+    """Clé (M, N - page) d'une ligne « N/M » avec N ≤ M, identique sur des pages qui se suivent, ou None"""
+    fraction = BARE_PAGE_FRACTION_PATTERN.fullmatch(line.strip())
+    if fraction is None or not 0 < int(fraction.group(1)) <= int(fraction.group(2)):
+        return None
+    return int(fraction.group(2)), int(fraction.group(1)) - page_idx
+
+def normalize_context_text(text):
+    """Texte d'un extrait sans espaces superflus ni numéros de page autour des sauts de page
+
+    Les pages sont délimitées par des sauts de page (\\f, voir PDF_PAGE_BREAK) : seuls les
+    marqueurs explicites (« Page 3 », « - 3 - », « 3 sur 12 »...) en première ou dernière
+    ligne d'une page sont retirés, ainsi que les « N/M » seuls qui se suivent sur plusieurs
+    pages. Les retours à la ligne simples sont conservés (tableaux, listes).
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    pages = [page.split("\n") for page in text.split("\f")]
+    # Lignes au bord d'un saut de page : (page, indice de ligne)
+    edges = [(page_idx, _edge_line(pages[page_idx], 0)) for page_idx in range(1, len(pages))]
+    edges += [(page_idx, _edge_line(pages[page_idx], -1)) for page_idx in range(len(pages) - 1)]
+    edges = [edge for edge in dict.fromkeys(edges) if edge[1] is not None]  # Page d'une ligne : un seul bord
+    fractions = Counter(_page_fraction(pages[page_idx][line_idx], page_idx) for page_idx, line_idx in edges)
+    fractions.pop(None, None)
+    markers = set()
+    for page_idx, line_idx in edges:
+        line = pages[page_idx][line_idx].strip()
+        key = _page_fraction(line, page_idx)
+        # Une même clé sur deux bords : la numérotation se suit d'une page à l'autre
+        if PAGE_MARKER_PATTERN.fullmatch(line) or (key is not None and fractions[key] > 1):
+            markers.add((page_idx, line_idx))
+    text = "\n\n".join("\n".join(line for line_idx, line in enumerate(lines) if (page_idx, line_idx) not in markers)
+                       for page_idx, lines in enumerate(pages))
+    text = HORIZONTAL_SPACE_PATTERN.sub(lambda match: "\t" if "\t" in match.group() else " ", text)
+    return BLANK_LINES_PATTERN.sub("\n\n", LINE_EDGE_SPACE_PATTERN.sub("\n", text)).strip()
+
+def merge_spans(spans):
+    """Fusionne les intervalles [début, fin) qui se chevauchent ou se touchent (triés par début)"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+class ContextSelection:
+    """Chunks retenus pour le contexte, comptés en tokens sans le recouvrement entre chunks voisins"""
+    
+    def __init__(self, corpus, max_tokens):
+        self.corpus = corpus
+        self.max_tokens = max_tokens
+        self.positions = set()
+        self.tokens = 0
+        self._documents = set()
+    
+    def added_chars(self, position):
+        """Caractères réellement ajoutés par un chunk : son texte moins ce que ses voisins retenus couvrent déjà"""
+        doc_idx, chunk_idx = self.corpus.locate(position)
+        document = self.corpus.document(doc_idx)
+        start, end = document.starts[chunk_idx], document.ends[chunk_idx]
+        if chunk_idx > 0 and position - 1 in self.positions:
+            start = max(start, document.ends[chunk_idx - 1])
+        if chunk_idx + 1 < document.chunk_count and position + 1 in self.positions:
+            end = min(end, document.starts[chunk_idx + 1])
+        return max(end - start, 0)
+    
+    def add(self, position):
+        """Retient le chunk s'il tient dans le budget restant ; renvoie True s'il a été ajouté"""
+        if position in self.positions:
+            return False
+        doc_idx, _ = self.corpus.locate(position)
+        cost = (self.added_chars(position) + 3) // 4  # estimate_tokens appliqué à une longueur
+        if doc_idx not in self._documents:
+            cost += estimate_tokens(CONTEXT_HEADER.format(self.corpus.names[doc_idx])) + 1
+        if self.tokens + cost > self.max_tokens:
+            return False
+        self.positions.add(position)
+        self._documents.add(doc_idx)
+        self.tokens += cost
+        return True
+    
+    def render(self):
+        """Extraits fusionnés par document, dans l'ordre des documents, chacun étiqueté par sa source"""
+        spans_by_document = {}
+        for position in self.positions:
+            doc_idx, chunk_idx = self.corpus.locate(position)
+            document = self.corpus.document(doc_idx)
+            spans_by_document.setdefault(doc_idx, []).append((document.starts[chunk_idx], document.ends[chunk_idx]))
+        parts = []
+        for doc_idx in sorted(spans_by_document):
+            document = self.corpus.document(doc_idx)
+            excerpts = [normalize_context_text(document.text[start:end])
+                        for start, end in merge_spans(spans_by_document[doc_idx])]
+            excerpts = [excerpt for excerpt in excerpts if excerpt]
+            if excerpts:
+                parts.append(CONTEXT_HEADER.format(self.corpus.names[doc_idx]))
+                parts.append(f"\n\n{CONTEXT_GAP}\n\n".join(excerpts))
+        return "\n\n".join(parts)
+
+def create_context_for_question(question, documents, max_tokens=CONTEXT_TOKEN_BUDGET, ranker=DEFAULT_RANKER,
+                                doc_names=None, attached_docs=None):
+    """Crée un contexte pertinent pour la question en utilisant les documents disponibles
+
+    `documents` est le DocumentStore de la session (un simple dictionnaire {nom: texte} est
+    indexé à la volée) ; `doc_names` restreint la recherche à certains documents.
+    `ranker` désigne la méthode de classement des chunks (voir RANKERS). Le contexte tient
+    dans `max_tokens` : les chunks voisins retenus sont fusionnés (leur recouvrement n'est
+    envoyé qu'une fois) et les espaces superflus sont retirés.
+    `attached_docs` nomme les documents joints explicitement à la question (par défaut, tous
+    ceux interrogés) : faute de chunk pertinent, seuls leurs premiers chunks sont envoyés,
+    et sans document joint le contexte est vide lorsqu'aucun chunk n'obtient un score positif.
+    """
+    if not isinstance(documents, DocumentStore):
+        store = DocumentStore()
+        for doc_name, doc_content in documents.items():
+            store.add(doc_name, doc_content)
+        documents = store
+    names = [name for name in (documents.keys() if doc_names is None else doc_names) if name in documents]
+    if not names:
+        return ""
+    attached = names if attached_docs is None else [name for name in attached_docs if name in documents]
+    
+    # Pour les documents plus grands que le budget, on interroge les index inversés de chaque document
+    corpus = ChunkCorpus(documents, names)
+    selection = ContextSelection(corpus, max_tokens)
+    
+    # Extraction des mots-clés avec élimination des stopwords
+    keywords = tokenize(question)
+    # Score uniquement les chunks présents dans les postings des mots-clés (calculé au premier besoin)
+    score_chunks = RANKERS.get(ranker, RANKERS[DEFAULT_RANKER])
+    chunk_scores = None
+    
+    if not attached:
+        # Documents de la session non joints : ils ne sont envoyés que si la question les concerne
+        chunk_scores = score_chunks(question, keywords, corpus) if keywords else {}
+        if not any(score > 0 for score in chunk_scores.values()):
+            return ""
+    
+    # Si le texte total est petit, on utilise tout
+    if sum((text_length + 3) // 4 for _, _, text_length in corpus.summaries) <= max_tokens * 0.9:
+        for position in range(corpus.size):
+            selection.add(position)
+        if len(selection.positions) == corpus.size:
+            return selection.render()
+        selection = ContextSelection(corpus, max_tokens)
+    
+    if keywords:
+        if chunk_scores is None:
+            chunk_scores = score_chunks(question, keywords, corpus)
+        
+        # Prend les meilleurs chunks tant qu'ils tiennent dans le budget de tokens
+        for position, score in sorted(chunk_scores.items(), key=lambda x: x[1], reverse=True):
+            if score > 0:
+                selection.add(position)
+    
+    # Si aucun chunk n'a de score positif ou si on n'a pas assez de contenu
+    if selection.tokens < max_tokens * 0.5:
+        # Ajoute des chunks supplémentaires au début des documents joints
+        first_chunks = (position for name in dict.fromkeys(attached) for position in corpus.positions(name))
+        for position in islice(first_chunks, 3 if keywords else 5):
+            selection.add(position)
+    
+    return selection.render()
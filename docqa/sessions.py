@@ -0,0 +1,443 @@
+"""Stockage sur disque des sessions : messages et documents hors de la mémoire du processus
+
+`st.session_state` ne garde que des poignées (ConversationLog, SessionDocumentStore) :
+les messages sont écrits dans SQLite au fil de l'eau et seuls les plus récents restent
+en mémoire ; les documents indexés sont relus à la demande via un cache LRU partagé
+borné en octets. Les sessions inactives sont purgées après SESSION_IDLE_TTL.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from .cache import CACHE_DIR, dump_extraction, load_extraction, private_directory
+from .indexing import build_document_index
+from .metrics import get_metrics
+from .prompting import message_tokens
+from .retrieval import DocumentStore, StoredDocument
+
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 2 * 3600))  # secondes d'inactivité avant purge
+SESSION_EVICTION_INTERVAL = 300  # secondes entre deux purges des sessions inactives
+SESSION_MEMORY_MESSAGES = int(os.environ.get("SESSION_MEMORY_MESSAGES", 20))  # messages récents gardés en mémoire
+# Documents relus depuis le disque, partagés par toutes les sessions du processus
+SESSION_DOCUMENT_CACHE_BYTES = int(os.environ.get("SESSION_DOCUMENT_CACHE_BYTES", 256 * 1024 * 1024))
+SESSION_READ_BATCH = 500  # messages lus par requête lors des parcours et de l'export
+# À incrémenter lorsque le schéma change, avec la migration correspondante (voir SessionStore._create_schema)
+SESSION_STORE_VERSION = 2
+
+def document_size(document):
+    """Empreinte mémoire approximative d'un document chargé (texte, vue minuscule, index)"""
+    size = 2 * len(document.text) + document.starts.itemsize * 2 * len(document.starts)
+    size += document.chunk_lengths.nbytes
+    for chunk_ids, frequencies in document.postings.values():
+        size += chunk_ids.nbytes + frequencies.nbytes + 200  # clé, tuple et en-têtes des tableaux
+    return size
+
+class SessionStoreVersionError(RuntimeError):
+    """Fichier de sessions écrit par une version plus récente de l'application"""
+
+class SessionStore:
+    """Messages et documents des sessions dans SQLite, avec purge des sessions inactives
+
+    Le schéma est créé (ou migré) une fois à l'ouverture ; chaque thread garde ensuite sa
+    propre connexion. Les documents relus sont gardés dans un cache LRU commun, borné à
+    `cache_bytes`.
+    """
+
+    def __init__(self, path, idle_ttl=SESSION_IDLE_TTL, cache_bytes=SESSION_DOCUMENT_CACHE_BYTES):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.cache_bytes = cache_bytes
+        self._loaded = OrderedDict()  # {(session, nom): (document, taille)}
+        self._loaded_bytes = 0
+        self._lock = threading.Lock()
+        self._evicted_at = 0.0
+        self._connections = threading.local()
+        if os.path.dirname(self.path):
+            private_directory(os.path.dirname(self.path))
+        self._create_schema()
+
+    def _connect(self):
+        """Connexion du thread appelant, ouverte à sa première opération"""
+        conn = getattr(self._connections, "conn", None)
+        if conn is None:
+            conn = self._connections.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _create_schema(self):
+        with self._connect() as conn:
+            # Une seule transaction : un autre processus n'observe jamais un schéma à moitié migré
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if not version and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sessions'").fetchone():
+                version = 1  # Fichier antérieur à la numérotation du schéma
+            if version > SESSION_STORE_VERSION:
+                raise SessionStoreVersionError(
+                    f"{self.path} a été écrit par une version plus récente (schéma {version}, "
+                    f"pris en charge : {SESSION_STORE_VERSION}) ; indiquez un autre SESSION_STORE_PATH"
+                )
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, id TEXT, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "attached_docs TEXT, tokens INTEGER NOT NULL, PRIMARY KEY (session_id, seq))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "session_id TEXT NOT NULL, name TEXT NOT NULL, position INTEGER NOT NULL, chunk_count INTEGER NOT NULL, "
+                "length_sum REAL NOT NULL, text_length INTEGER NOT NULL, payload BLOB NOT NULL, "
+                "PRIMARY KEY (session_id, name))"
+            )
+            # Nombre de chunks de chaque document contenant chaque terme : fréquences documentaires de
+            # la session et documents à charger pour une question, sans relire les documents
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_terms ("
+                "session_id TEXT NOT NULL, name TEXT NOT NULL, term TEXT NOT NULL, chunks INTEGER NOT NULL, "
+                "PRIMARY KEY (session_id, name, term)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS document_terms_by_term ON document_terms (session_id, term)")
+            if version == 1:
+                self._migrate_documents(conn)
+            conn.execute(f"PRAGMA user_version = {SESSION_STORE_VERSION}")
+
+    def _migrate_documents(self, conn):
+        """Schéma 1 vers 2 : longueur du texte et termes de chaque document, relus depuis son contenu"""
+        conn.execute("ALTER TABLE documents ADD COLUMN text_length INTEGER NOT NULL DEFAULT 0")
+        for session_id, name in conn.execute("SELECT session_id, name FROM documents").fetchall():
+            payload = conn.execute("SELECT payload FROM documents WHERE session_id = ? AND name = ?",
+                                   (session_id, name)).fetchone()[0]
+            value = load_extraction(payload)
+            conn.execute("UPDATE documents SET text_length = ? WHERE session_id = ? AND name = ?",
+                         (len(value["text"]), session_id, name))
+            self._insert_terms(conn, session_id, name, value["index"]["postings"])
+
+    def _insert_terms(self, conn, session_id, name, postings):
+        conn.execute("DELETE FROM document_terms WHERE session_id = ? AND name = ?", (session_id, name))
+        conn.executemany(
+            "INSERT INTO document_terms (session_id, name, term, chunks) VALUES (?, ?, ?, ?)",
+            ((session_id, name, term, len(chunk_ids)) for term, (chunk_ids, _) in postings.items())
+        )
+
+    # Sessions
+
+    def touch(self, session_id):
+        """Marque la session active ; renvoie False si elle est inconnue (purgée pour inactivité)"""
+        with self._connect() as conn:
+            known = conn.execute("UPDATE sessions SET last_seen = ? WHERE id = ?",
+                                 (time.time(), session_id)).rowcount > 0
+        if time.monotonic() - self._evicted_at > SESSION_EVICTION_INTERVAL:
+            self.evict_idle()
+        return known
+
+    def open_session(self, session_id):
+        """Crée (ou vide) la session `session_id`"""
+        self.clear_session(session_id)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (id, last_seen) VALUES (?, ?)", (session_id, time.time()))
+
+    def clear_session(self, session_id):
+        """Supprime les messages, les documents et l'entrée de la session"""
+        with self._connect() as conn:
+            self._delete_sessions(conn, [session_id])
+        self._forget_loaded(lambda key: key[0] == session_id)
+
+    def _delete_sessions(self, conn, session_ids):
+        rows = [(session_id,) for session_id in session_ids]
+        conn.executemany("DELETE FROM messages WHERE session_id = ?", rows)
+        conn.executemany("DELETE FROM documents WHERE session_id = ?", rows)
+        conn.executemany("DELETE FROM document_terms WHERE session_id = ?", rows)
+        conn.executemany("DELETE FROM sessions WHERE id = ?", rows)
+
+    def evict_idle(self):
+        """Purge les sessions inactives depuis plus de idle_ttl ; renvoie leur nombre"""
+        self._evicted_at = time.monotonic()
+        try:
+            with self._connect() as conn:
+                idle = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE last_seen < ?",
+                                                       (time.time() - self.idle_ttl,))]
+                self._delete_sessions(conn, idle)
+        except sqlite3.Error:
+            return 0  # Nouvelle tentative à la prochaine purge
+        if idle:
+            evicted = set(idle)
+            self._forget_loaded(lambda key: key[0] in evicted)
+        return len(idle)
+
+    # Messages
+
+    def append_message(self, session_id, seq, message):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO messages (session_id, seq, id, role, content, attached_docs, tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq, message.get("id"), message["role"], message["content"],
+                 json.dumps(message.get("attached_docs"), ensure_ascii=False), message_tokens(message))
+            )
+
+    def message_count(self, session_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def messages(self, session_id, start, stop):
+        """Messages d'indices [start, stop) de la session, dans l'ordre"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content, attached_docs, tokens FROM messages "
+                "WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq", (session_id, start, stop)
+            ).fetchall()
+        return [{"id": message_id, "role": role, "content": content, "attached_docs": json.loads(attached_docs),
+                 "tokens": tokens} for message_id, role, content, attached_docs, tokens in rows]
+
+    def iter_export(self, session_id):
+        """Historique de la session en JSON (UTF-8), produit lot par lot
+
+        La concaténation des fragments est identique à json.dumps(messages, indent=2) ;
+        seul un lot de messages est lu à la fois.
+        """
+        separator = "\n"
+        start = 0
+        while True:
+            batch = self.messages(session_id, start, start + SESSION_READ_BATCH)
+            if not batch:
+                break
+            parts = []
+            for message in batch:
+                entry = {key: message[key] for key in ("id", "role", "content", "attached_docs")}
+                parts.append(separator + "\n".join("  " + line for line in
+                                                    json.dumps(entry, ensure_ascii=False, indent=2).splitlines()))
+                separator = ",\n"
+            yield (("" if start else "[") + "".join(parts)).encode("utf-8")
+            start += len(batch)
+        yield b"\n]" if start else b"[]"
+
+    def export_messages(self, session_id):
+        """Historique de la session en JSON (octets), construit depuis le stockage au moment de l'appel"""
+        return b"".join(self.iter_export(session_id))
+
+    # Documents
+
+    def save_document(self, session_id, name, text, index):
+        """Enregistre un document indexé et le garde dans le cache des documents chargés"""
+        document = StoredDocument(text, index)
+        payload = dump_extraction({"text": text, "index": index}, level=1)
+        with self._connect() as conn:
+            position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM documents WHERE session_id = ?",
+                                    (session_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(session_id, name, position, chunk_count, length_sum, text_length, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, name, position, document.chunk_count, document.length_sum, len(text), payload)
+            )
+            self._insert_terms(conn, session_id, name, document.postings)
+        self._remember((session_id, name), document)
+        return document
+
+    def load_document(self, session_id, name):
+        """Document de la session, depuis le cache ou relu depuis le disque"""
+        key = (session_id, name)
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is not None:
+                self._loaded.move_to_end(key)
+        get_metrics().cache_result("documents de session", entry is not None)
+        if entry is not None:
+            return entry[0]
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM documents WHERE session_id = ? AND name = ?",
+                               (session_id, name)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        value = load_extraction(row[0])
+        document = StoredDocument(value["text"], value["index"])
+        self._remember(key, document)
+        return document
+
+    def delete_document(self, session_id, name):
+        """Supprime un document et renvoie ses {terme: nombre de chunks le contenant}"""
+        with self._connect() as conn:
+            terms = dict(conn.execute("SELECT term, chunks FROM document_terms WHERE session_id = ? AND name = ?",
+                                      (session_id, name)))
+            conn.execute("DELETE FROM document_terms WHERE session_id = ? AND name = ?", (session_id, name))
+            conn.execute("DELETE FROM documents WHERE session_id = ? AND name = ?", (session_id, name))
+        self._forget_loaded(lambda key: key == (session_id, name))
+        return terms
+
+    def document_summaries(self, session_id):
+        """(nom, nombre de chunks, somme des longueurs, longueur du texte) des documents, dans l'ordre d'ajout"""
+        with self._connect() as conn:
+            return conn.execute("SELECT name, chunk_count, length_sum, text_length FROM documents "
+                                "WHERE session_id = ? ORDER BY position", (session_id,)).fetchall()
+
+    def document_frequency(self, session_id):
+        """Nombre de chunks de la session contenant chaque terme"""
+        with self._connect() as conn:
+            return Counter(dict(conn.execute("SELECT term, SUM(chunks) FROM document_terms WHERE session_id = ? "
+                                             "GROUP BY term", (session_id,))))
+
+    def documents_with_term(self, session_id, term):
+        """Noms des documents de la session dont les postings contiennent `term`"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT name FROM document_terms WHERE session_id = ? AND term = ?",
+                                                   (session_id, term))]
+
+    def _remember(self, key, document):
+        size = document_size(document)
+        with self._lock:
+            previous = self._loaded.pop(key, None)
+            if previous is not None:
+                self._loaded_bytes -= previous[1]
+            if size > self.cache_bytes:
+                return
+            self._loaded[key] = (document, size)
+            self._loaded_bytes += size
+            while self._loaded_bytes > self.cache_bytes:
+                _, (_, evicted_size) = self._loaded.popitem(last=False)
+                self._loaded_bytes -= evicted_size
+
+    def _forget_loaded(self, predicate):
+        with self._lock:
+            for key in [key for key in self._loaded if predicate(key)]:
+                self._loaded_bytes -= self._loaded.pop(key)[1]
+
+@lru_cache(maxsize=None)
+def get_session_store():
+    """Stockage des sessions partagé par toutes les sessions du processus"""
+    return SessionStore(SESSION_STORE_PATH)
+
+class MessageRange:
+    """Tranche [start, stop) d'un ConversationLog, lue à la demande"""
+
+    def __init__(self, log, start, stop):
+        self.log = log
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("pas de tranche non unitaire sur l'historique")
+            return MessageRange(self.log, self.start + start, self.start + max(start, stop))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.log.message(self.start + key)
+
+    def __iter__(self):
+        return self.log.iter_range(self.start, self.stop)
+
+class ConversationLog:
+    """Historique d'une session utilisable comme une liste de messages
+
+    Chaque message est écrit dans le SessionStore à l'ajout ; seuls les
+    SESSION_MEMORY_MESSAGES derniers restent en mémoire. Les tranches (history[:-1],
+    history[start:]...) sont des vues paresseuses, relues par lots à l'itération.
+    """
+
+    def __init__(self, store, session_id, memory_messages=SESSION_MEMORY_MESSAGES):
+        self.store = store
+        self.session_id = session_id
+        self.memory_messages = memory_messages
+        self._count = store.message_count(session_id)
+        self._tail = store.messages(session_id, max(0, self._count - memory_messages), self._count)
+        self._page_start = 0
+        self._page = []  # derniers messages anciens relus, pour les parcours à rebours
+
+    def append(self, message):
+        """Ajoute un message {"role", "content", ...} à la fin de l'historique"""
+        self.store.append_message(self.session_id, self._count, message)
+        self._count += 1
+        self._tail.append(message)
+        del self._tail[:-self.memory_messages]
+
+    def message(self, index):
+        tail_start = self._count - len(self._tail)
+        if index >= tail_start:
+            return self._tail[index - tail_start]
+        if not self._page_start <= index < self._page_start + len(self._page):
+            # Page se terminant à `index` : la fenêtre d'historique est parcourue depuis la fin
+            self._page_start = max(0, index + 1 - self.memory_messages)
+            self._page = self.store.messages(self.session_id, self._page_start, index + 1)
+        return self._page[index - self._page_start]
+
+    def iter_range(self, start, stop):
+        tail_start = self._count - len(self._tail)
+        for batch_start in range(start, min(stop, tail_start), SESSION_READ_BATCH):
+            yield from self.store.messages(self.session_id, batch_start,
+                                           min(batch_start + SESSION_READ_BATCH, stop, tail_start))
+        for index in range(max(start, tail_start), stop):
+            yield self._tail[index - tail_start]
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        return MessageRange(self, 0, self._count)[key]
+
+    def __iter__(self):
+        return self.iter_range(0, self._count)
+
+    def export(self):
+        """JSON de tout l'historique, en octets (voir SessionStore.iter_export)"""
+        return self.store.export_messages(self.session_id)
+
+class SessionDocumentStore(DocumentStore):
+    """DocumentStore dont les textes et index sont conservés dans le SessionStore
+
+    Seuls les résumés des documents (chunks, longueurs) et les fréquences documentaires
+    de la session sont gardés en mémoire ; ces dernières sont aussi enregistrées avec la
+    session. Les documents sont relus à la demande, uniquement lorsqu'une question
+    consulte leurs postings ou leur texte.
+    """
+
+    def __init__(self, store, session_id):
+        super().__init__()
+        self.store = store
+        self.session_id = session_id
+        for name, chunk_count, length_sum, text_length in store.document_summaries(session_id):
+            self._documents[name] = (chunk_count, length_sum, text_length)
+            self.chunk_count += chunk_count
+            self.length_sum += length_sum
+        self.document_frequency = store.document_frequency(session_id)
+
+    def add(self, name, text, index=None):
+        if name in self._documents:
+            del self[name]
+        document = self.store.save_document(self.session_id, name, text, index or build_document_index(text))
+        self._documents[name] = (document.chunk_count, document.length_sum, len(text))
+        self._update_statistics(document, 1)
+
+    def document(self, name):
+        if name not in self._documents:
+            raise KeyError(name)
+        return self.store.load_document(self.session_id, name)
+
+    def summary(self, name):
+        return self._documents[name]
+
+    def documents_with_term(self, term):
+        return self.store.documents_with_term(self.session_id, term)
+
+    def __getitem__(self, name):
+        return self.document(name).text
+
+    def __delitem__(self, name):
+        chunk_count, length_sum, _ = self._documents.pop(name)
+        self.chunk_count -= chunk_count
+        self.length_sum -= length_sum
+        for term, chunks in self.store.delete_document(self.session_id, name).items():
+            self.document_frequency[term] -= chunks
+            if not self.document_frequency[term]:
+                del self.document_frequency[term]
+
+    def items(self):
+        return ((name, self.document(name).text) for name in list(self._documents))
@@ -0,0 +1,79 @@
+"""Affichage par lots d'une réponse reçue en streaming"""
+import time
+
+# Cadence de rafraîchissement de la réponse en streaming
+STREAM_FLUSH_INTERVAL = 0.05  # secondes
+STREAM_FLUSH_CHARS = 400
+
+class StreamRenderer:
+    """Regroupe les deltas d'une réponse en streaming et ne rafraîchit l'affichage que par lots
+
+    L'affichage est mis à jour au plus toutes les `flush_interval` secondes ou dès que
+    `flush_chars` caractères sont en attente. Mesure le délai avant le premier token
+    et le débit d'affichage. `render` met en forme le texte avant son affichage.
+    """
+    
+    def __init__(self, container, started=None, flush_interval=STREAM_FLUSH_INTERVAL,
+                 flush_chars=STREAM_FLUSH_CHARS, render=None):
+        self.container = container
+        self.render = render
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.started = started if started is not None else time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.token_count = 0
+        self.flush_count = 0
+        self._parts = []
+        self._pending_chars = 0
+        self._last_flush = self.started
+    
+    @property
+    def text(self):
+        """Texte reçu jusqu'ici (les fragments sont fusionnés à la demande)"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+    
+    def write(self, delta):
+        """Ajoute un delta et rafraîchit l'affichage si le budget de temps ou de taille est atteint"""
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.token_count += 1
+        self._parts.append(delta)
+        self._pending_chars += len(delta)
+        if now - self._last_flush >= self.flush_interval or self._pending_chars >= self.flush_chars:
+            self.flush(now)
+    
+    def flush(self, now=None):
+        """Affiche le texte accumulé"""
+        text = self.text
+        self.container.markdown(self.render(text) if self.render else text, unsafe_allow_html=True)
+        self._pending_chars = 0
+        self._last_flush = now if now is not None else time.perf_counter()
+        self.flush_count += 1
+    
+    def close(self):
+        """Affiche les derniers deltas en attente et renvoie la réponse complète"""
+        if self._pending_chars:
+            self.flush()
+        self.finished_at = time.perf_counter()
+        return self.text
+    
+    def stats(self):
+        """Délai avant le premier token (s), débit d'affichage (tokens/s) et nombre de rafraîchissements"""
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        time_to_first_token = None
+        tokens_per_second = None
+        if self.first_token_at is not None:
+            time_to_first_token = self.first_token_at - self.started
+            streaming_time = end - self.first_token_at
+            if streaming_time > 0:
+                tokens_per_second = self.token_count / streaming_time
+        return {
+            "time_to_first_token": time_to_first_token,
+            "tokens_per_second": tokens_per_second,
+            "tokens": self.token_count,
+            "renders": self.flush_count,
+        }
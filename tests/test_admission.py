@@ -0,0 +1,75 @@
+"""Contrôle d'admission : refus des demandes impossibles, tour de rôle entre sessions, budget rendu"""
+import threading
+import time
+
+import pytest
+
+from docqa.admission import AdmissionController, AdmissionRejected, request_cost
+
+
+def request(prompt_chars=400, max_tokens=100):
+    return {"messages": [{"role": "user", "content": "x" * prompt_chars}], "max_tokens": max_tokens}
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("limits, oversized", [
+    ({"max_completion_tokens": 1000}, request(max_tokens=2000)),
+    ({"max_request_tokens": 1000}, request(prompt_chars=4000, max_tokens=100)),
+    ({"tokens_per_minute": 1000}, request(prompt_chars=4000, max_tokens=100)),
+])
+def test_requests_that_can_never_be_served_are_rejected(limits, oversized):
+    controller = AdmissionController(transport=None, **limits)
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("session", oversized)
+    assert controller.in_flight == 0
+    assert controller.queue_length() == 0
+
+
+def test_queue_beyond_the_token_budget_is_rejected_at_once():
+    controller = AdmissionController(transport=None, max_in_flight=1, tokens_per_minute=1000)
+    held = controller.acquire("a", request(max_tokens=100))
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b", request(max_tokens=800), timeout=1)
+    assert time.monotonic() - started < 0.5
+    controller.release(held)
+
+
+def test_sessions_are_served_in_turn():
+    controller = AdmissionController(transport=None, max_in_flight=1, tokens_per_minute=0)
+    held = controller.acquire("a", request())
+    admitted = []
+
+    def generate(session_id, label):
+        ticket = controller.acquire(session_id, request())
+        admitted.append(label)
+        controller.release(ticket)
+
+    threads = []
+    for session_id, label in [("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        thread = threading.Thread(target=generate, args=(session_id, label))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: controller.queue_length() == len(threads))
+    controller.release(held)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ["a2", "b1", "a3"]
+
+
+def test_release_refunds_the_unused_reservation():
+    controller = AdmissionController(transport=None, tokens_per_minute=10_000)
+    ticket = controller.acquire("session", request(max_tokens=1000))
+    assert ticket.cost == request_cost(request(max_tokens=1000))
+    assert controller._tokens == pytest.approx(10_000 - ticket.cost, abs=5)
+    controller.release(ticket, used_tokens=200)
+    assert controller._tokens == pytest.approx(10_000 - 200, abs=5)
+    controller.release(ticket, used_tokens=0)  # Une seconde libération ne rend rien
+    assert controller._tokens == pytest.approx(10_000 - 200, abs=5)
+    assert controller.in_flight == 0
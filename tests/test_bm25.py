@@ -0,0 +1,64 @@
+"""BM25 vectorisé : mêmes scores qu'un calcul direct sur le texte des chunks"""
+import math
+from collections import Counter
+
+import pytest
+
+from docqa.indexing import build_document_index, tokenize, tokenize_span
+from docqa.retrieval import ChunkCorpus, DocumentStore, score_chunks_bm25
+
+DOCUMENTS = {
+    "contrat.txt": "Le préavis de résiliation est de trois mois. " * 40 + "La garantie couvre les pannes. " * 30,
+    "facture.txt": "Montant total de la facture : 1500 euros. " * 50 + "Résiliation sans frais. " * 5,
+    "annexe.txt": "Liste des équipements fournis et de leur garantie. " * 60,
+}
+
+
+def reference_bm25(keywords, corpus, k1=1.5, b=0.75):
+    # Comme à l'indexation, un mot coupé au début d'un chunk n'en fait pas partie
+    terms = []
+    for position in range(corpus.size):
+        document, start, end = corpus.span(position)
+        terms.append(Counter(tokenize_span(document.text, start, end)))
+    average_length = max(sum(sum(counts.values()) for counts in terms) / len(terms), 1.0)
+    scores = {}
+    for position, counts in enumerate(terms):
+        score = 0.0
+        for term, query_weight in Counter(keywords).items():
+            frequency = counts[term]
+            if not frequency:
+                continue
+            document_frequency = sum(1 for other in terms if other[term])
+            idf = math.log1p((len(terms) - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = k1 * (1 - b + b * sum(counts.values()) / average_length)
+            score += query_weight * idf * frequency * (k1 + 1) / (frequency + norm)
+        if score > 0:
+            scores[position] = score
+    return scores
+
+
+@pytest.fixture
+def store():
+    store = DocumentStore()
+    for name, text in DOCUMENTS.items():
+        store.add(name, text, build_document_index(text, chunk_size=500, overlap=50))
+    return store
+
+
+@pytest.mark.parametrize("names", [list(DOCUMENTS), ["facture.txt", "contrat.txt"]])
+def test_scores_match_direct_computation(store, names):
+    corpus = ChunkCorpus(store, names)
+    keywords = tokenize("Quel est le préavis de résiliation et la garantie ?")
+    scores = score_chunks_bm25("", keywords, corpus)
+    expected = reference_bm25(keywords, corpus)
+    assert scores.keys() == expected.keys()
+    for position, score in expected.items():
+        assert scores[position] == pytest.approx(score, rel=1e-4)
+
+
+def test_rarer_term_ranks_its_chunks_first(store):
+    corpus = ChunkCorpus(store, list(DOCUMENTS))
+    scores = score_chunks_bm25("", tokenize("équipements garantie"), corpus)
+    best = max(scores, key=scores.get)
+    assert "équipements" in corpus.text(best)
+    assert score_chunks_bm25("", tokenize("introuvable"), corpus) == {}
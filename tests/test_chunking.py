@@ -0,0 +1,50 @@
+"""Découpage en offsets : mêmes chunks que get_chunks sur du texte courant, quel que soit le flux"""
+import random
+
+import pytest
+
+from docqa.chunking import chunk_offsets, get_chunks, iter_chunk_spans
+
+WORDS = "le contrat est résilié par lettre recommandée dans un délai de trois mois".split()
+
+
+def prose(sentences, seed=0):
+    rng = random.Random(seed)
+    return "".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))).capitalize() + rng.choice([". ", "! ", "? "])
+        for _ in range(sentences)
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    prose(5),
+    prose(300),
+    prose(2000, seed=1),
+    "x" * 10000,
+])
+def test_offsets_match_get_chunks_on_text_without_line_breaks(text):
+    assert [text[start:end] for _, start, end in chunk_offsets(text)] == get_chunks(text)
+
+
+@pytest.mark.parametrize("piece_size", [1, 777, 5000])
+def test_streamed_pieces_give_the_same_chunks(piece_size):
+    text = prose(2000, seed=2)
+    pieces = [text[offset:offset + piece_size] for offset in range(0, len(text), piece_size)]
+    streamed = [buffer[start - base:end - base] for (_, start, end), buffer, base in iter_chunk_spans(pieces)]
+    assert streamed == get_chunks(text)
+
+
+def test_cut_prefers_a_heading_in_the_window():
+    text = "Une phrase. " * 80 + "\nARTICLE 2 - Résiliation\n" + "Une autre phrase. " * 80
+    _, _, end = chunk_offsets(text, chunk_size=1000, overlap=100)[0]
+    assert text.startswith("ARTICLE 2", end)
+
+
+def test_cut_does_not_split_a_table():
+    table = "".join(f"| ligne {row} | valeur {row} |\n" for row in range(6))
+    text = "Une phrase. " * 78 + "\n" + table + "\n" + "Une autre phrase. " * 80
+    table_start = text.index("| ligne")
+    _, _, end = chunk_offsets(text, chunk_size=1000, overlap=100)[0]
+    assert table_start < 1000 < table_start + len(table)
+    assert end <= table_start or end >= table_start + len(table)
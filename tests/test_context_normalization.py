@@ -0,0 +1,57 @@
+"""Nettoyage du contexte : les numéros de page sont retirés, jamais les nombres du document"""
+import pytest
+
+from docqa.extraction import PDF_PAGE_BREAK
+from docqa.retrieval import create_context_for_question, normalize_context_text
+
+
+@pytest.mark.parametrize("text", [
+    "Montant total HT\n1500",
+    "Durée du préavis (mois)\n3\n\nArticle suivant",
+    "Total\n\n42\n\nfin",
+    "2025",
+    "Désignation | Quantité | Prix\nLicence | 12 | 1500\nSupport | 1 | 300",
+    "Nom : Dupont\nÂge :\n42\nCode postal :\n75011",
+])
+def test_numbers_without_page_break_are_kept(text):
+    assert normalize_context_text(text) == text
+
+
+def test_numbers_of_tables_and_forms_at_page_edges_are_kept():
+    text = f"Total HT\n1500{PDF_PAGE_BREAK}12\nQuantité | Prix\nLicence | 12 | 300"
+    assert normalize_context_text(text) == "Total HT\n1500\n\n12\nQuantité | Prix\nLicence | 12 | 300"
+
+
+@pytest.mark.parametrize("marker", ["Page 3", "page 3/12", "- 3 -", "3 sur 12"])
+def test_explicit_page_markers_next_to_page_break_are_removed(marker):
+    text = f"fin de la page\n{marker}{PDF_PAGE_BREAK}{marker}\ndébut de la page"
+    assert normalize_context_text(text) == "fin de la page\n\ndébut de la page"
+
+
+def test_bare_page_fractions_following_each_other_are_removed():
+    text = f"fin de la page\n3/12{PDF_PAGE_BREAK}milieu\n4/12{PDF_PAGE_BREAK}5/12\ndébut de la page"
+    assert normalize_context_text(text) == "fin de la page\n\nmilieu\n\ndébut de la page"
+
+
+@pytest.mark.parametrize("text, expected", [
+    (f"Date de signature :\n3/12{PDF_PAGE_BREAK}suite", "Date de signature :\n3/12\n\nsuite"),
+    (f"fin de la page{PDF_PAGE_BREAK}01/12\nRéunion du comité", "fin de la page\n\n01/12\nRéunion du comité"),
+    (f"Signé le\n3/12{PDF_PAGE_BREAK}3/12\nsuite", "Signé le\n3/12\n\n3/12\nsuite"),
+    (f"Date de signature :\n03/2024{PDF_PAGE_BREAK}suite", "Date de signature :\n03/2024\n\nsuite"),
+    (f"fin de la page{PDF_PAGE_BREAK}15/03\nRéunion du comité", "fin de la page\n\n15/03\nRéunion du comité"),
+    (f"fin de la page\n12/3{PDF_PAGE_BREAK}suite", "fin de la page\n12/3\n\nsuite"),
+])
+def test_dates_at_page_edges_are_kept(text, expected):
+    assert normalize_context_text(text) == expected
+
+
+def test_page_markers_away_from_page_break_are_kept():
+    text = "Voir le tableau\n- 3 -\nsuite du texte\n3/12"
+    assert normalize_context_text(text) == text
+
+
+def test_context_keeps_table_numbers():
+    document = "Échéancier\nMois | Montant\nJanvier | 1500\nFévrier | 1500\n\nTotal\n3000"
+    context = create_context_for_question("Quel est le montant total ?", {"contrat.txt": document})
+    assert "Janvier | 1500" in context
+    assert context.endswith("Total\n3000")
@@ -0,0 +1,67 @@
+"""Extraction DOCX en flux : paragraphes et tableaux dans l'ordre du document, un bloc à la fois"""
+import io
+import zipfile
+
+from docqa.extraction import extract_and_index, extract_text_from_docx, iter_docx_blocks
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/contenu.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+
+def paragraph(*runs):
+    return "<w:p>" + "".join(f"<w:r>{run}</w:r>" for run in runs) + "</w:p>"
+
+
+def cell(text, merge=None):
+    properties = f'<w:tcPr><w:vMerge{merge}/></w:tcPr>' if merge is not None else ""
+    return f"<w:tc>{properties}{paragraph(f'<w:t>{text}</w:t>')}</w:tc>"
+
+
+BODY = (
+    paragraph("<w:t>ARTICLE 1</w:t>")
+    + paragraph("<w:t>Préavis</w:t>", "<w:tab/>", "<w:t>trois mois</w:t>", "<w:br/>", "<w:t>suite</w:t>")
+    + "<w:tbl>"
+    + "<w:tr>" + cell("Lot") + cell("Prix", ' w:val="restart"') + "</w:tr>"
+    + "<w:tr>" + cell("A") + cell("", "") + "</w:tr>"
+    + "</w:tbl>"
+    + paragraph(
+        "<mc:AlternateContent><mc:Choice><w:t>Zone de texte</w:t></mc:Choice>"
+        "<mc:Fallback><w:t>Zone de texte</w:t></mc:Fallback></mc:AlternateContent>"
+    )
+)
+
+
+def build_docx(body=BODY, main_part="word/contenu.xml", rels=RELS):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        if rels:
+            archive.writestr("_rels/.rels", rels)
+        archive.writestr(main_part, f'<w:document xmlns:w="{W}" xmlns:mc="{MC}"><w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def test_blocks_follow_the_document_order():
+    assert list(iter_docx_blocks(build_docx())) == [
+        "ARTICLE 1\n",
+        "Préavis\ttrois mois\nsuite\n",
+        "Lot | Prix\nA\n\n",
+        "Zone de texte\n",
+    ]
+
+
+def test_main_part_defaults_to_word_document_without_relationships():
+    content = build_docx(paragraph("<w:t>Bonjour</w:t>"), main_part="word/document.xml", rels=None)
+    assert extract_text_from_docx(content) == "Bonjour\n"
+
+
+def test_indexed_text_is_the_concatenated_blocks():
+    content = build_docx()
+    text, index = extract_and_index(content, "contrat.docx")
+    assert text == "".join(iter_docx_blocks(content))
+    assert "préavis" in index["postings"]
@@ -0,0 +1,36 @@
+"""Cache d'extraction : une entrée relue depuis le fichier SQLite redonne le même document"""
+import numpy as np
+
+from docqa.cache import ExtractionCache, extraction_cache_key
+from docqa.indexing import build_document_index
+
+TEXT = "Le préavis de résiliation est de trois mois.\n\n" * 300 + "Fin du contrat, signé à Lyon.\n"
+
+
+def assert_same_extraction(actual, expected):
+    assert actual["text"] == expected["text"]
+    assert actual["index"]["starts"] == expected["index"]["starts"]
+    assert actual["index"]["ends"] == expected["index"]["ends"]
+    assert np.array_equal(actual["index"]["chunk_lengths"], expected["index"]["chunk_lengths"])
+    assert actual["index"]["postings"].keys() == expected["index"]["postings"].keys()
+    for term, (chunk_ids, frequencies) in expected["index"]["postings"].items():
+        assert np.array_equal(actual["index"]["postings"][term][0], chunk_ids)
+        assert np.array_equal(actual["index"]["postings"][term][1], frequencies)
+
+
+def test_reopened_cache_returns_the_same_document(tmp_path):
+    path = str(tmp_path / "cache" / "extractions.sqlite3")
+    key = extraction_cache_key(TEXT.encode("utf-8"), "contrat.txt")
+    extraction = {"text": TEXT, "index": {**build_document_index(TEXT), "embeddings_key": "embeddings-key"}}
+    ExtractionCache(path, max_bytes=1 << 20).put(key, extraction)
+
+    cached = ExtractionCache(path, max_bytes=1 << 20).get(key)
+    assert_same_extraction(cached, extraction)
+    assert cached["index"]["embeddings_key"] == "embeddings-key"
+
+
+def test_unknown_key_and_unreadable_cache_return_none(tmp_path):
+    path = tmp_path / "extractions.sqlite3"
+    assert ExtractionCache(str(path), max_bytes=1 << 20).get("absente") is None
+    path.write_bytes(b"ceci n'est pas une base SQLite")
+    assert ExtractionCache(str(path), max_bytes=1 << 20).get("absente") is None
@@ -0,0 +1,40 @@
+"""Cache des réponses : expiration après le TTL, éviction du moins récemment utilisé, persistance"""
+import pytest
+
+from docqa import responses
+from docqa.responses import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(responses.time, "time", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl=60, max_entries=10)
+    cache.put("question", "réponse")
+    clock[0] += 60
+    assert cache.get("question") == "réponse"
+    clock[0] += 1
+    assert cache.get("question") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(ttl=60, max_entries=2)
+    cache.put("a", "réponse a")
+    cache.put("b", "réponse b")
+    assert cache.get("a") == "réponse a"
+    cache.put("c", "réponse c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "réponse a"
+    assert cache.get("c") == "réponse c"
+
+
+def test_persisted_entries_survive_a_new_cache_until_they_expire(clock, tmp_path):
+    path = str(tmp_path / "cache" / "responses.sqlite3")
+    ResponseCache(ttl=60, max_entries=2, path=path).put("question", "réponse")
+    assert ResponseCache(ttl=60, max_entries=2, path=path).get("question") == "réponse"
+    clock[0] += 61
+    assert ResponseCache(ttl=60, max_entries=2, path=path).get("question") is None
@@ -0,0 +1,110 @@
+"""Documents de session sur disque : statistiques tenues par la session, documents chargés à la demande"""
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from docqa.cache import dump_extraction
+from docqa.indexing import build_document_index
+from docqa.retrieval import ChunkCorpus, DocumentStore, StoredDocument, create_context_for_question
+from docqa.sessions import SESSION_STORE_VERSION, SessionDocumentStore, SessionStore, SessionStoreVersionError
+
+DOCUMENTS = {
+    "contrat.txt": "Le préavis de résiliation est de trois mois.\n" * 200,
+    "facture.txt": "Montant total de la facture : 1500 euros.\n" * 200,
+    "annexe.txt": "Liste des équipements fournis et de leur garantie.\n" * 200,
+}
+
+
+@pytest.fixture
+def session_store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"), cache_bytes=0)
+    store.open_session("session")
+    return store
+
+
+def test_statistics_match_in_memory_store_and_survive_reload(session_store):
+    documents = SessionDocumentStore(session_store, "session")
+    in_memory = DocumentStore()
+    for name, text in DOCUMENTS.items():
+        documents.add(name, text)
+        in_memory.add(name, text)
+    del documents["annexe.txt"]
+    del in_memory["annexe.txt"]
+
+    reloaded = SessionDocumentStore(session_store, "session")
+    for store in (documents, reloaded):
+        assert store.document_frequency == in_memory.document_frequency
+        assert store.chunk_count == in_memory.chunk_count
+        assert store.length_sum == in_memory.length_sum
+
+
+def test_question_loads_only_documents_containing_its_terms(session_store, monkeypatch):
+    documents = SessionDocumentStore(session_store, "session")
+    for name, text in DOCUMENTS.items():
+        documents.add(name, text)
+    loaded = []
+    load_document = session_store.load_document
+    monkeypatch.setattr(session_store, "load_document",
+                        lambda session_id, name: loaded.append(name) or load_document(session_id, name))
+
+    context = create_context_for_question("Quel est le préavis de résiliation ?", documents, max_tokens=200)
+    assert "préavis de résiliation" in context
+    assert loaded and set(loaded) == {"contrat.txt"}
+
+
+def test_unrelated_question_gets_no_context_from_documents_not_attached():
+    assert create_context_for_question("Bonjour, comment vas-tu ?", DOCUMENTS, attached_docs=[]) == ""
+    assert "préavis" in create_context_for_question("Quel préavis ?", DOCUMENTS, attached_docs=[])
+    # Documents joints au message : les premiers passages sont envoyés faute de mieux
+    assert create_context_for_question("Bonjour, comment vas-tu ?", DOCUMENTS)
+
+
+def test_sessions_written_before_schema_version_are_migrated(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    index = build_document_index(DOCUMENTS["contrat.txt"])
+    document = StoredDocument(DOCUMENTS["contrat.txt"], index)
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+        conn.execute("CREATE TABLE documents (session_id TEXT NOT NULL, name TEXT NOT NULL, position INTEGER NOT NULL, "
+                     "chunk_count INTEGER NOT NULL, length_sum REAL NOT NULL, payload BLOB NOT NULL, "
+                     "PRIMARY KEY (session_id, name))")
+        conn.execute("INSERT INTO sessions VALUES ('session', 0)")
+        conn.execute("INSERT INTO documents VALUES ('session', 'contrat.txt', 1, ?, ?, ?)",
+                     (document.chunk_count, document.length_sum,
+                      dump_extraction({"text": DOCUMENTS["contrat.txt"], "index": index})))
+
+    documents = SessionDocumentStore(SessionStore(path), "session")
+    in_memory = DocumentStore()
+    in_memory.add("contrat.txt", DOCUMENTS["contrat.txt"])
+    assert documents.summary("contrat.txt") == in_memory.summary("contrat.txt")
+    assert documents.document_frequency == in_memory.document_frequency
+    assert documents["contrat.txt"] == DOCUMENTS["contrat.txt"]
+
+
+def test_sessions_written_by_a_newer_version_are_not_opened(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    SessionStore(path).open_session("session")
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute(f"PRAGMA user_version = {SESSION_STORE_VERSION + 1}")
+    with pytest.raises(SessionStoreVersionError):
+        SessionStore(path)
+    with closing(sqlite3.connect(path)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+
+
+def test_fallback_uses_the_attached_document_when_searching_the_whole_session():
+    context = create_context_for_question("Bonjour, comment vas-tu ?", DOCUMENTS, attached_docs=["annexe.txt"])
+    assert context.startswith("--- DOCUMENT: annexe.txt ---")
+    assert "contrat.txt" not in context and "facture.txt" not in context
+
+
+def test_repeated_document_names_do_not_count_as_the_whole_session():
+    store = DocumentStore()
+    for name, text in DOCUMENTS.items():
+        store.add(name, text)
+    corpus = ChunkCorpus(store, ["contrat.txt", "contrat.txt", "facture.txt"])
+    assert corpus.names == ["contrat.txt", "facture.txt"]
+    assert corpus.document_frequency("équipements") == 0
+    assert corpus.average_length == pytest.approx(
+        (store.summary("contrat.txt")[1] + store.summary("facture.txt")[1]) / corpus.size)
@@ -0,0 +1,43 @@
+"""Affichage en streaming : les deltas sont regroupés et le dernier lot est toujours affiché"""
+from docqa.streaming import StreamRenderer
+
+
+class Container:
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, body, unsafe_allow_html=False):
+        self.renders.append(body)
+
+
+def test_small_deltas_are_displayed_once_on_close():
+    container = Container()
+    renderer = StreamRenderer(container, flush_interval=3600, flush_chars=1000)
+    for delta in ["Le ", "préavis ", "est ", "de ", "trois ", "mois."]:
+        renderer.write(delta)
+    assert container.renders == []
+
+    assert renderer.close() == "Le préavis est de trois mois."
+    assert container.renders == ["Le préavis est de trois mois."]
+    assert renderer.stats()["tokens"] == 6
+    assert renderer.stats()["renders"] == 1
+
+
+def test_pending_characters_trigger_a_flush():
+    container = Container()
+    renderer = StreamRenderer(container, flush_interval=3600, flush_chars=10, render=str.upper)
+    for delta in ["abcd", "efgh", "ijkl", "mn"]:
+        renderer.write(delta)
+    assert container.renders == ["ABCDEFGHIJKL"]
+
+    renderer.close()
+    assert container.renders == ["ABCDEFGHIJKL", "ABCDEFGHIJKLMN"]
+
+
+def test_elapsed_interval_triggers_a_flush_and_close_does_not_repeat_it():
+    container = Container()
+    renderer = StreamRenderer(container, flush_interval=0, flush_chars=1000)
+    renderer.write("a")
+    renderer.write("b")
+    assert renderer.close() == "ab"
+    assert container.renders == ["a", "ab"]
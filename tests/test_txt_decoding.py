@@ -0,0 +1,41 @@
+"""Décodage des fichiers texte : un changement d'encodage en cours de fichier ne corrompt pas ce qui précède"""
+from docqa.extraction import iter_txt_text
+from docqa.notices import set_notice_handler
+
+
+def decode(content, **kwargs):
+    return "".join(iter_txt_text(content, **kwargs))
+
+
+def test_utf8_file_is_decoded():
+    assert decode("Café à Noël".encode("utf-8")) == "Café à Noël"
+
+
+def test_cp1252_tail_in_the_same_block_keeps_utf8_prefix():
+    # L'octet fautif est au-delà de l'échantillon de détection : le fichier est lu en UTF-8
+    padding = "a" * (70 * 1024)
+    content = f"café {padding} ".encode("utf-8") + "l’été".encode("cp1252")
+    assert decode(content) == f"café {padding} l’été"
+
+
+def test_cp1252_tail_in_a_later_block_keeps_utf8_prefix():
+    first = ("début " + "a" * 1024).encode("utf-8")
+    content = first + "café ".encode("utf-8") + "l’été".encode("cp1252")
+    assert decode(content, block_size=1024) == "début " + "a" * 1024 + "café l’été"
+
+
+def test_utf8_sequence_split_across_blocks_before_cp1252_tail():
+    content = b"a" * 1023 + "é".encode("utf-8") + " fin ".encode("utf-8") + "€".encode("cp1252")
+    assert decode(content, block_size=1024) == "a" * 1023 + "é fin €"
+
+
+def test_cp1252_byte_at_the_end_of_the_file_is_decoded_with_a_notice():
+    notices = []
+    set_notice_handler(lambda level, message: notices.append(level))
+    try:
+        # Le dernier octet (0xE9) n'est pas de l'UTF-8 : ni dans l'échantillon, ni dans un bloc complet
+        assert decode("début ".encode("utf-8") + b"a" * 2000 + "café".encode("cp1252"), block_size=1024) \
+            == "début " + "a" * 2000 + "café"
+    finally:
+        set_notice_handler(None)
+    assert notices == ["warning"]